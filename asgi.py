@@ -0,0 +1,7 @@
+from fitnessblog import create_app
+from fitnessblog.asgi import ASGIApp
+
+# Entry point for ASGI servers, e.g. "uvicorn asgi:app --workers 4"
+# The read only feed views run as coroutines on aiosqlite or asyncpg, so thousands of open connections
+# don't need thousands of threads. Every other route runs on the Flask app in a thread pool
+app = ASGIApp(create_app())
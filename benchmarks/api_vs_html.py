@@ -0,0 +1,85 @@
+"""Compare response size and latency of the JSON API with the HTML feed pages.
+
+Run from the repository root:
+
+    python benchmarks/api_vs_html.py --posts 2000 --requests 200
+
+A throwaway SQLite database is created in a temporary directory and filled with
+generated users and posts, then each route is requested through the Flask test client.
+"""
+import argparse
+import gzip
+import os
+import statistics
+import tempfile
+import time
+
+from common import build_app, login_cookie
+
+ROUTES = [
+    ("html home", "/", {}),
+    ("api posts", "/api/v1/posts?limit=5", {}),
+    ("api posts gzip", "/api/v1/posts?limit=5", {"Accept-Encoding": "gzip"}),
+    ("api posts fields", "/api/v1/posts?limit=5&fields=id,title", {}),
+    ("html user", "/user/user1", {}),
+    ("api user", "/api/v1/users/user1/posts?limit=5", {}),
+]
+
+
+def measure(client, url, headers, requests):
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get(url, headers=headers)
+        timings.append(time.perf_counter() - start)
+        assert response.status_code == 200, (url, response.status_code)
+    body = response.get_data()
+    wire = len(body)
+    raw = len(gzip.decompress(body)) if response.content_encoding == "gzip" else wire
+    timings.sort()
+    return (
+        raw,
+        wire,
+        statistics.median(timings) * 1000,
+        timings[int(len(timings) * 0.95) - 1] * 1000,
+        response.headers.get("ETag"),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--posts", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = build_app(os.path.join(tmp, "bench.db"), args.users, args.posts)
+        client = app.test_client()
+        # Pages are rendered for logged in users instead of coming from the anonymous page cache
+        client.set_cookie("localhost", "session", login_cookie(app, 1))
+        print(f"{'route':<18}{'bytes':>9}{'on wire':>9}{'p50 ms':>9}{'p95 ms':>9}")
+        etags = {}
+        for name, url, headers in ROUTES:
+            raw, wire, p50, p95, etag = measure(client, url, headers, args.requests)
+            etags[url] = etag
+            print(f"{name:<18}{raw:>9}{wire:>9}{p50:>9.2f}{p95:>9.2f}")
+
+        # Revalidating an unchanged feed only runs the light ETag query
+        url = "/api/v1/posts?limit=5"
+        timings = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            response = client.get(url, headers={"If-None-Match": etags[url]})
+            timings.append(time.perf_counter() - start)
+            assert response.status_code == 304
+        timings.sort()
+        print(
+            f"{'api posts 304':<18}{0:>9}{0:>9}"
+            f"{statistics.median(timings) * 1000:>9.2f}"
+            f"{timings[int(len(timings) * 0.95) - 1] * 1000:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
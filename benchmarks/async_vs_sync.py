@@ -0,0 +1,235 @@
+"""Compare the sync (WSGI) and async (ASGI) servers with thousands of open connections.
+
+Run from the repository root:
+
+    python benchmarks/async_vs_sync.py --connections 100 1000 2000 --seconds 10
+
+The app is served from a separate process, either by a WSGI server with a fixed
+pool of --threads threads (like gunicorn's gthread workers) or by uvicorn running
+asgi.py, whose feed views wait for the database on the event loop. The client
+holds the given number of connections open at once, each sending GET requests for
+the read only feed pages one after another as a logged in user, so pages are
+rendered rather than served from the anonymous page cache. The async mode needs
+uvicorn and aiosqlite installed.
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import logging
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import bench_config, build_app, login_cookie, summarize
+
+MODES = ("sync", "async")
+
+READ_PATHS = [
+    "/home",
+    "/home?page=2",
+    "/post/1",
+    "/category/cardio",
+    "/latest",
+    "/user/user1",
+]
+
+
+# Each open connection is a file descriptor, on both ends
+def raise_open_file_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# Serve the app in this process, called in the server subprocess
+def serve(mode, path, port, threads):
+    raise_open_file_limit()
+    from werkzeug.serving import BaseWSGIServer
+    from fitnessblog import create_app
+
+    app = create_app(bench_config(path))
+    if mode == "async":
+        import uvicorn
+        from fitnessblog.asgi import ASGIApp
+
+        uvicorn.run(
+            ASGIApp(app), host="127.0.0.1", port=port, log_level="error", backlog=4096
+        )
+        return
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    # WSGI server handing each connection to a fixed pool of threads, queued connections wait for a free thread
+    class PooledWSGIServer(BaseWSGIServer):
+        request_queue_size = 4096
+        multithread = True
+
+        def __init__(self):
+            super().__init__("127.0.0.1", port, app)
+            self.pool = ThreadPoolExecutor(threads)
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self.handle_in_thread, request, client_address)
+
+        def handle_in_thread(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    PooledWSGIServer().serve_forever()
+
+
+def start_server(mode, path, threads):
+    port = free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.abspath(__file__),
+            "--serve",
+            mode,
+            "--database",
+            path,
+            "--port",
+            str(port),
+            "--threads",
+            str(threads),
+        ]
+    )
+    deadline = time.perf_counter() + 30
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(
+                f"The {mode} server exited with status {process.returncode}"
+            )
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process, port
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise SystemExit(f"The {mode} server didn't start")
+
+
+# One GET on a new connection, returning the status code
+async def get(port, path, cookie):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        writer.write(
+            f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nCookie: session={cookie}\r\n"
+            "Connection: close\r\n\r\n".encode("latin-1")
+        )
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+    return int(response.split(b" ", 2)[1])
+
+
+async def load(port, cookie, connections, seconds, timeout, seed):
+    timings = []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+
+    async def client(number):
+        nonlocal errors
+        rng = random.Random(seed + number)
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(
+                    get(port, rng.choice(READ_PATHS), cookie), timeout
+                )
+            except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+                status = None
+            timings.append(time.perf_counter() - start)
+            errors += status != 200
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(n) for n in range(connections)))
+    return summarize(timings, time.perf_counter() - start, errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--posts", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--connections", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--mode", choices=MODES + ("both",), default="both")
+    parser.add_argument("--json", help="Write the results to this file.")
+    parser.add_argument("--serve", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--database", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.database, args.port, args.threads)
+        return
+
+    modes = MODES if args.mode == "both" else (args.mode,)
+    if "async" in modes:
+        missing = [
+            m for m in ("uvicorn", "aiosqlite") if not importlib.util.find_spec(m)
+        ]
+        if missing:
+            raise SystemExit(f"The async mode needs {' and '.join(missing)} installed")
+    raise_open_file_limit()
+
+    report = {}
+    print(
+        f"{'mode':<7}{'conns':>7}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}"
+        f"{'p99 ms':>10}{'errors':>8}"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        app = build_app(path, args.users, args.posts, args.seed)
+        cookie = login_cookie(app, 1)
+        for mode in modes:
+            process, port = start_server(mode, path, args.threads)
+            try:
+                for connections in args.connections:
+                    r = asyncio.run(
+                        load(
+                            port,
+                            cookie,
+                            connections,
+                            args.seconds,
+                            args.timeout,
+                            args.seed,
+                        )
+                    )
+                    report[f"{mode}:{connections}"] = r
+                    print(
+                        f"{mode:<7}{connections:>7}{r['rps']:>9.1f}{r['p50']:>10.2f}"
+                        f"{r['p95']:>10.2f}{r['p99']:>10.2f}{r['errors']:>8}"
+                    )
+            finally:
+                process.terminate()
+                process.wait()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
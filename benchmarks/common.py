@@ -0,0 +1,102 @@
+"""Helpers shared by the benchmark scripts."""
+import http.client
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlencode
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from werkzeug.serving import make_server
+from fitnessblog import create_app
+from fitnessblog.config import Config
+from fitnessblog.schema import upgrade
+
+
+# Config for an app on the SQLite database at path
+def bench_config(path, **config):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{path}"
+        WTF_CSRF_ENABLED = False
+        # The login benchmark sends far more attempts than the limits allow
+        RATELIMIT_ENABLED = False
+
+    for name, value in config.items():
+        setattr(BenchConfig, name, value)
+    return BenchConfig
+
+
+# Create an app on a fresh SQLite database at path, seeded with generated users and posts
+def build_app(path, users, posts, seed=1, **config):
+    app = create_app(bench_config(path, **config))
+    with app.app_context():
+        upgrade()
+    if users or posts:
+        run_seed(app, users, posts, seed)
+    return app
+
+
+# Add generated users and posts to an app's database with "flask seed", the same as running it by hand
+# Posts are written by the users created in the same run
+def run_seed(app, users, posts, seed=1):
+    args = ["seed", "--users", str(users), "--posts", str(posts), "--seed", str(seed)]
+    result = app.test_cli_runner().invoke(args=args)
+    if result.exit_code != 0:
+        raise RuntimeError(f"flask seed failed: {result.output}") from result.exception
+
+
+# Session cookie value for a logged in user, so pages are rendered instead of served from the anonymous page cache
+def login_cookie(app, user_id):
+    serializer = app.session_interface.get_signing_serializer(app)
+    return serializer.dumps({"_user_id": str(user_id), "_fresh": True})
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values))) - 1)
+    return sorted_values[max(index, 0)]
+
+
+# Throughput and latency percentiles (in milliseconds) for one route
+def summarize(timings, elapsed, errors=0):
+    timings = sorted(timings)
+    return {
+        "requests": len(timings),
+        "errors": errors,
+        "rps": len(timings) / elapsed if elapsed else 0.0,
+        "p50": percentile(timings, 50) * 1000,
+        "p95": percentile(timings, 95) * 1000,
+        "p99": percentile(timings, 99) * 1000,
+    }
+
+
+# Run the app on a threaded WSGI server on a free port, yielding the port
+@contextmanager
+def serve(app):
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server.port
+    finally:
+        server.shutdown()
+
+
+# Make one HTTP request on a new connection, returning the status code
+def http_request(port, method, path, data=None, cookie=None):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    headers = {}
+    body = None
+    if data is not None:
+        body = urlencode(data)
+        headers["Content-Type"] = "application/x-www-form-urlencoded"
+    if cookie is not None:
+        headers["Cookie"] = f"session={cookie}"
+    connection.request(method, path, body=body, headers=headers)
+    response = connection.getresponse()
+    response.read()
+    connection.close()
+    return response.status
@@ -0,0 +1,110 @@
+"""Measure mixed read and write throughput with several concurrent clients.
+
+Run from the repository root:
+
+    python benchmarks/concurrency.py --clients 8 --seconds 10 --write-ratio 0.2
+
+Each client thread keeps requesting pages from a threaded WSGI server, creating a
+post instead of reading a page for the given share of requests. The run is repeated
+with the tuned engine settings (connection pool, WAL, synchronous=NORMAL) and with
+the SQLite defaults the app used before (no pool, rollback journal, synchronous=FULL).
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from common import build_app, http_request, login_cookie, serve, summarize
+
+SETTINGS = {
+    "tuned": {},
+    "sqlite defaults": {
+        "DATABASE_POOL_SIZE": 0,
+        "SQLITE_JOURNAL_MODE": "DELETE",
+        "SQLITE_SYNCHRONOUS": "FULL",
+    },
+}
+
+READ_PATHS = ["/home", "/home?page=2", "/category/cardio", "/latest", "/user/user1"]
+
+
+def run(app, clients, seconds, write_ratio, seed):
+    cookie = login_cookie(app, 1)
+    timings = {"read": [], "write": []}
+    errors = {"read": 0, "write": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client(number):
+        rng = random.Random(seed + number)
+        while time.perf_counter() < deadline:
+            if rng.random() < write_ratio:
+                kind, expected = "write", 302
+                args = (
+                    "POST",
+                    "/post/new",
+                    {
+                        "title": "Benchmark",
+                        "content": "Tempo run",
+                        "category": "cardio",
+                    },
+                )
+            else:
+                kind, expected = "read", 200
+                args = ("GET", rng.choice(READ_PATHS), None)
+            start = time.perf_counter()
+            try:
+                status = http_request(port, *args, cookie=cookie)
+            except OSError:
+                status = None
+            elapsed = time.perf_counter() - start
+            with lock:
+                timings[kind].append(elapsed)
+                errors[kind] += status != expected
+
+    with serve(app) as port:
+        start = time.perf_counter()
+        threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    return {kind: summarize(timings[kind], elapsed, errors[kind]) for kind in timings}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--posts", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    args = parser.parse_args()
+
+    print(
+        f"{'settings':<17}{'kind':<7}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}"
+        f"{'p99 ms':>9}{'errors':>8}"
+    )
+    for name, config in SETTINGS.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            app = build_app(
+                os.path.join(tmp, "bench.db"),
+                args.users,
+                args.posts,
+                args.seed,
+                **config,
+            )
+            results = run(app, args.clients, args.seconds, args.write_ratio, args.seed)
+        for kind, r in results.items():
+            print(
+                f"{name:<17}{kind:<7}{r['rps']:>9.1f}{r['p50']:>9.2f}{r['p95']:>9.2f}"
+                f"{r['p99']:>9.2f}{r['errors']:>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
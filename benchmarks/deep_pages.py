@@ -0,0 +1,98 @@
+"""Measure deep feed pages by page number and by cursor as the post table grows.
+
+Run from the repository root:
+
+    python benchmarks/deep_pages.py --sizes 10000 100000 1000000 --page 1000
+
+A throwaway SQLite database is grown to each --sizes number of posts with
+"flask seed". At each size the home and category feeds are requested through the
+Flask test client as a logged in user: the first page, --page by page number
+(OFFSET) and the same page by cursor (the "older" link a reader follows there).
+Page number latency grows with the size of the table, cursor latency shouldn't.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from common import build_app, login_cookie, run_seed, summarize
+from fitnessblog.posts.utils import (
+    POSTS_PER_PAGE,
+    category_feed,
+    encode_cursor,
+    home_feed,
+)
+
+
+# Latency percentiles for requesting url requests times
+def measure(client, url, requests):
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get(url)
+        timings.append(time.perf_counter() - start)
+        assert response.status_code == 200, (url, response.status_code)
+    return summarize(timings, sum(timings))
+
+
+# Cursor for reaching page of a feed, from the last post on the page before it
+def page_cursor(query, page):
+    return encode_cursor(query.offset((page - 1) * POSTS_PER_PAGE - 1).first())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10000, 100000, 1000000]
+    )
+    parser.add_argument("--page", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--json", help="Write the results to this file.")
+    args = parser.parse_args()
+
+    if min(args.sizes) < args.page * POSTS_PER_PAGE * 3:
+        # Categories hold about a third of the posts, each feed needs --page pages
+        parser.error(f"--sizes must be at least {args.page * POSTS_PER_PAGE * 3}")
+
+    report = {}
+    print(f"{'posts':>9}  {'request':<24}{'p50 ms':>10}{'p95 ms':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        app = build_app(os.path.join(tmp, "bench.db"), 0, 0)
+        client = app.test_client()
+        client.set_cookie("localhost", "session", login_cookie(app, 1))
+        seeded = 0
+        for step, size in enumerate(sorted(args.sizes)):
+            # Each step adds a user per hundred new posts, as flask seed needs authors for them
+            added = size - seeded
+            run_seed(app, max(1, added // 100), added, args.seed + step)
+            seeded = size
+            with app.app_context():
+                feeds = {
+                    "home": ("/home", page_cursor(home_feed(), args.page)),
+                    "category": (
+                        "/category/cardio",
+                        page_cursor(category_feed("cardio"), args.page),
+                    ),
+                }
+            results = {}
+            for feed, (url, cursor) in feeds.items():
+                results[f"{feed} page 1"] = measure(client, url, args.requests)
+                results[f"{feed} page {args.page}"] = measure(
+                    client, f"{url}?page={args.page}", args.requests
+                )
+                results[f"{feed} cursor {args.page}"] = measure(
+                    client, f"{url}?before={cursor}", args.requests
+                )
+            for name, r in results.items():
+                print(f"{size:>9}  {name:<24}{r['p50']:>10.2f}{r['p95']:>10.2f}")
+            report[size] = results
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
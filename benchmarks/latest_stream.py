@@ -0,0 +1,142 @@
+"""Measure pushing new posts to open latest posts pages over server-sent events.
+
+Run from the repository root:
+
+    python benchmarks/latest_stream.py --clients 10 100 500 --posts 20
+
+A throwaway SQLite database is filled with generated users and posts and the app
+is served by a threaded WSGI server. For each --clients count that many event
+streams are held open as a logged in user while --posts posts are created, and
+the time from submitting each post to it arriving on every stream is recorded,
+along with the SQL statements run per post. For comparison the same number of
+clients then poll the latest posts page once, which is what each refresh of the
+page costs without the stream.
+"""
+import argparse
+import json
+import logging
+import os
+import selectors
+import socket
+import tempfile
+import time
+
+from sqlalchemy import event
+
+from common import build_app, http_request, login_cookie, serve, summarize
+from fitnessblog import db
+
+
+# Open an event stream as a logged in user and read past its first line
+def open_stream(port, cookie):
+    sock = socket.create_connection(("127.0.0.1", port), timeout=30)
+    sock.sendall(
+        f"GET /latest/stream HTTP/1.1\r\nHost: 127.0.0.1\r\nCookie: session={cookie}\r\n"
+        "\r\n".encode("latin-1")
+    )
+    received = b""
+    while b"retry:" not in received:
+        received += sock.recv(65536)
+    sock.setblocking(False)
+    return sock
+
+
+# Wait until every stream has received count created events, returning the time each one got the last
+def wait_for_events(selector, counts, count, timeout):
+    arrived = {}
+    deadline = time.perf_counter() + timeout
+    while len(arrived) < len(counts) and time.perf_counter() < deadline:
+        for key, _ in selector.select(timeout=1):
+            sock = key.fileobj
+            counts[sock] += sock.recv(65536).count(b"event: created")
+            if counts[sock] >= count and sock not in arrived:
+                arrived[sock] = time.perf_counter()
+    return arrived
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--seed-posts", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--clients", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--posts", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--json", help="Write the results to this file.")
+    args = parser.parse_args()
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    report = {}
+    print(
+        f"{'clients':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'missed':>8}"
+        f"{'SQL/post':>10}{'SQL/poll':>10}"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        app = build_app(
+            os.path.join(tmp, "bench.db"),
+            args.users,
+            args.seed_posts,
+            args.seed,
+            PASSWORD_HASH_WORKERS=0,
+            EVENTS_STREAM_ENABLED=True,
+        )
+        cookie = login_cookie(app, 1)
+        statements = [0]
+        with app.app_context():
+            engine = db.engine
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def count_statement(*args):
+            statements[0] += 1
+
+        with serve(app) as port:
+            for clients in args.clients:
+                selector = selectors.DefaultSelector()
+                counts = {}
+                for _ in range(clients):
+                    sock = open_stream(port, cookie)
+                    selector.register(sock, selectors.EVENT_READ)
+                    counts[sock] = 0
+
+                timings, missed = [], 0
+                statements[0] = 0
+                for n in range(1, args.posts + 1):
+                    start = time.perf_counter()
+                    http_request(
+                        port,
+                        "POST",
+                        "/post/new",
+                        {
+                            "title": f"Live {n}",
+                            "content": "Intervals",
+                            "category": "cardio",
+                        },
+                        cookie,
+                    )
+                    arrived = wait_for_events(selector, counts, n, args.timeout)
+                    timings.extend(t - start for t in arrived.values())
+                    missed += clients - len(arrived)
+                per_post = statements[0] / args.posts
+                for sock in counts:
+                    selector.unregister(sock)
+                    sock.close()
+
+                statements[0] = 0
+                for _ in range(clients):
+                    http_request(port, "GET", "/latest", cookie=cookie)
+                r = summarize(timings, 1, missed)
+                r["statements_per_post"] = per_post
+                r["statements_per_poll_round"] = statements[0]
+                report[clients] = r
+                print(
+                    f"{clients:>8}{r['p50']:>10.2f}{r['p95']:>10.2f}{r['p99']:>10.2f}"
+                    f"{missed:>8}{per_post:>10.1f}{statements[0]:>10}"
+                )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
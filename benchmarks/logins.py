@@ -0,0 +1,138 @@
+"""Measure logins from many clients at once, hashing on the request threads and in the worker pool.
+
+Run from the repository root:
+
+    python benchmarks/logins.py --concurrency 1 4 16 32 --requests 200
+
+A throwaway SQLite database is seeded with "flask seed" and served by a threaded
+WSGI server, once with PASSWORD_HASH_WORKERS=0 (bcrypt runs on the request
+thread) and once with the password hashing pool. At each --concurrency that many
+clients post the login form as different seeded users, while one more client
+keeps requesting the home page as a logged in user. Logins report throughput,
+p50/p95/p99 latency and how many were turned away with 429 because every hashing
+slot was taken. The home page latency shows what a login burst does to readers.
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+
+from common import build_app, http_request, login_cookie, serve, summarize
+from fitnessblog import passwords
+from fitnessblog.seed import SEED_PASSWORD
+
+
+# Logins from concurrency clients at once, and home page requests from one more client while they run
+def run_burst(port, cookie, users, requests, concurrency):
+    timings, pages, statuses = [], [], []
+    lock = threading.Lock()
+    counter = iter(range(requests))
+    done = threading.Event()
+
+    def login_worker():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            data = {
+                "email": f"user{i % users + 1}@example.com",
+                "password": SEED_PASSWORD,
+            }
+            t = time.perf_counter()
+            status = http_request(port, "POST", "/login", data)
+            elapsed = time.perf_counter() - t
+            with lock:
+                timings.append(elapsed)
+                statuses.append(status)
+
+    def page_worker():
+        while not done.is_set():
+            t = time.perf_counter()
+            status = http_request(port, "GET", "/home", cookie=cookie)
+            pages.append(time.perf_counter() - t)
+            assert status == 200, status
+
+    reader = threading.Thread(target=page_worker)
+    reader.start()
+    start = time.perf_counter()
+    workers = [threading.Thread(target=login_worker) for _ in range(concurrency)]
+    for worker_thread in workers:
+        worker_thread.start()
+    for worker_thread in workers:
+        worker_thread.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    reader.join()
+
+    busy = statuses.count(429)
+    result = summarize(timings, elapsed, len(statuses) - statuses.count(302) - busy)
+    result["busy"] = busy
+    result["home"] = summarize(pages, elapsed)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--posts", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--requests", type=int, default=200, help="Logins per concurrency level."
+    )
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 32])
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=2,
+        help="PASSWORD_HASH_WORKERS for the pool run.",
+    )
+    parser.add_argument(
+        "--bcrypt-rounds", type=int, help="Override BCRYPT_LOG_ROUNDS for /login."
+    )
+    parser.add_argument("--json", help="Write the results to this file.")
+    args = parser.parse_args()
+
+    config = {}
+    if args.bcrypt_rounds is not None:
+        config["BCRYPT_LOG_ROUNDS"] = args.bcrypt_rounds
+    report = {}
+    print(
+        f"{'hashing':<10}{'clients':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}"
+        f"{'p99 ms':>9}{'429s':>6}{'errors':>8}{'home p95':>10}"
+    )
+    for mode, workers in (("inline", 0), ("pool", args.workers)):
+        with tempfile.TemporaryDirectory() as tmp:
+            app = build_app(
+                os.path.join(tmp, "bench.db"),
+                args.users,
+                args.posts,
+                args.seed,
+                PASSWORD_HASH_WORKERS=workers,
+                **config,
+            )
+            cookie = login_cookie(app, 1)
+            results = {}
+            with serve(app) as port:
+                # Start the hashing processes before timing anything
+                run_burst(port, cookie, args.users, workers, max(workers, 1))
+                for concurrency in args.concurrency:
+                    r = run_burst(port, cookie, args.users, args.requests, concurrency)
+                    results[concurrency] = r
+                    print(
+                        f"{mode:<10}{concurrency:>8}{r['rps']:>9.1f}{r['p50']:>9.2f}"
+                        f"{r['p95']:>9.2f}{r['p99']:>9.2f}{r['busy']:>6}"
+                        f"{r['errors']:>8}{r['home']['p95']:>10.2f}"
+                    )
+            passwords.shutdown()
+            report[mode] = results
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
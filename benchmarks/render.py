@@ -0,0 +1,107 @@
+"""Compare rendering post bodies when feed pages are read with rendering them when posts are saved.
+
+Run from the repository root:
+
+    python benchmarks/render.py --posts 2000 --requests 200
+
+A throwaway SQLite database is filled with generated users and posts. For pages of
+feed posts the time to render their Markdown and excerpts on every read is compared
+with reading the excerpts stored when the posts were saved, along with the bytes of
+post body each feed page carries either way. The home page is then requested through
+the Flask test client as a logged in user.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from common import build_app, login_cookie, summarize
+from fitnessblog import db
+from fitnessblog.models import Post
+from fitnessblog.posts.render import render_excerpt, render_markdown
+from fitnessblog.posts.utils import POSTS_PER_PAGE
+
+
+# Latency percentiles for calling f requests times
+def measure(f, requests):
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        f()
+        timings.append(time.perf_counter() - start)
+    return summarize(timings, sum(timings))
+
+
+def render_on_read(contents):
+    return [render_excerpt(render_markdown(content)) for content in contents]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--posts", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--json", help="Write the results to this file.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = build_app(
+            os.path.join(tmp, "bench.db"), args.users, args.posts, args.seed
+        )
+        with app.app_context():
+            pages = [
+                db.session.query(Post.content, Post.content_html, Post.excerpt_html)
+                .order_by(Post.id)
+                .offset(offset)
+                .limit(POSTS_PER_PAGE)
+                .all()
+                for offset in range(0, args.posts, args.posts // 20 or 1)
+            ]
+        pages = [page for page in pages if page]
+
+        def read_pages(column):
+            for page in pages:
+                [row[column] for row in page]
+
+        def render_pages():
+            for page in pages:
+                render_on_read(row.content for row in page)
+
+        results = {
+            "render on read": measure(render_pages, args.requests),
+            "stored excerpts": measure(lambda: read_pages(2), args.requests),
+        }
+        bytes_per_page = {
+            "full body": sum(
+                len(row.content_html.encode()) for page in pages for row in page
+            )
+            / len(pages),
+            "excerpt": sum(
+                len(row.excerpt_html.encode()) for page in pages for row in page
+            )
+            / len(pages),
+        }
+
+        client = app.test_client()
+        client.set_cookie("localhost", "session", login_cookie(app, 1))
+        assert client.get("/").status_code == 200
+        results["home page"] = measure(lambda: client.get("/"), args.requests)
+
+        print(f"{len(pages)} pages of {POSTS_PER_PAGE} posts per run")
+        print(f"{'read':<18}{'p50 ms':>10}{'p95 ms':>10}")
+        for name, r in results.items():
+            print(f"{name:<18}{r['p50']:>10.2f}{r['p95']:>10.2f}")
+        print(f"{'body per page':<18}{'bytes':>10}")
+        for name, size in bytes_per_page.items():
+            print(f"{name:<18}{size:>10.0f}")
+        report = {"latency": results, "bytes_per_page": bytes_per_page}
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
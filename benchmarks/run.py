@@ -0,0 +1,180 @@
+"""Benchmark the main pages through the Flask test client and a real WSGI server.
+
+Run from the repository root:
+
+    python benchmarks/run.py --users 200 --posts 5000 --requests 300 --json results.json
+
+A throwaway SQLite database is created in a temporary directory and seeded with
+"flask seed"'s generator, so the same --seed gives the same data on every run.
+Each route reports throughput and p50/p95/p99 latency. Save the results with
+--json and compare them across commits.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import tempfile
+import threading
+import time
+
+from common import build_app, http_request, login_cookie, serve, summarize
+from fitnessblog.models import Post
+from fitnessblog.seed import SEED_PASSWORD
+
+
+# (name, method, path or list of paths, form data, status expected)
+def build_routes(app, rng):
+    with app.app_context():
+        post_ids = [post_id for (post_id,) in Post.query.with_entities(Post.id)]
+    sample = rng.sample(post_ids, min(len(post_ids), 50))
+    return [
+        ("home", "GET", ["/home"], None, 200),
+        ("home page 5", "GET", ["/home?page=5"], None, 200),
+        ("category", "GET", ["/category/cardio", "/category/weight"], None, 200),
+        ("latest", "GET", ["/latest"], None, 200),
+        ("user", "GET", ["/user/user1", "/user/user2", "/user/user3"], None, 200),
+        ("post", "GET", [f"/post/{post_id}" for post_id in sample], None, 200),
+        (
+            "login",
+            "POST",
+            ["/login"],
+            {"email": "user1@example.com", "password": SEED_PASSWORD},
+            302,
+        ),
+    ]
+
+
+# Requests through the test client, one at a time, measuring the app without any network overhead
+def run_client(app, cookie, routes, requests):
+    results = {}
+    for name, method, paths, data, expected in routes:
+        # Cookies are sent by hand so a login never carries over into the next request
+        client = app.test_client(use_cookies=False)
+        headers = {"Cookie": f"session={cookie}"} if data is None else {}
+        timings, errors = [], 0
+        start = time.perf_counter()
+        for i in range(requests):
+            t = time.perf_counter()
+            response = client.open(
+                paths[i % len(paths)], method=method, data=data, headers=headers
+            )
+            timings.append(time.perf_counter() - t)
+            errors += response.status_code != expected
+        results[name] = summarize(timings, time.perf_counter() - start, errors)
+    return results
+
+
+# Requests over HTTP to a threaded WSGI server, from several client threads at once
+def run_wsgi(app, cookie, routes, requests, concurrency):
+    results = {}
+    with serve(app) as port:
+        for name, method, paths, data, expected in routes:
+            timings, errors = [], [0]
+            lock = threading.Lock()
+            counter = iter(range(requests))
+
+            def worker():
+                while True:
+                    with lock:
+                        i = next(counter, None)
+                    if i is None:
+                        return
+                    t = time.perf_counter()
+                    # The login request is sent without a session so it always checks the password
+                    status = http_request(
+                        port,
+                        method,
+                        paths[i % len(paths)],
+                        data,
+                        cookie if data is None else None,
+                    )
+                    elapsed = time.perf_counter() - t
+                    with lock:
+                        timings.append(elapsed)
+                        errors[0] += status != expected
+
+            start = time.perf_counter()
+            workers = [threading.Thread(target=worker) for _ in range(concurrency)]
+            for worker_thread in workers:
+                worker_thread.start()
+            for worker_thread in workers:
+                worker_thread.join()
+            results[name] = summarize(timings, time.perf_counter() - start, errors[0])
+    return results
+
+
+def print_results(title, results):
+    print(title)
+    print(
+        f"  {'route':<14}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}"
+    )
+    for name, r in results.items():
+        print(
+            f"  {name:<14}{r['rps']:>9.1f}{r['p50']:>9.2f}{r['p95']:>9.2f}"
+            f"{r['p99']:>9.2f}{r['errors']:>8}"
+        )
+
+
+def git_commit():
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL
+            )
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--posts", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per route.")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--mode", choices=("client", "wsgi", "both"), default="both")
+    parser.add_argument(
+        "--bcrypt-rounds", type=int, help="Override BCRYPT_LOG_ROUNDS for /login."
+    )
+    parser.add_argument("--json", help="Write the results to this file.")
+    args = parser.parse_args()
+
+    config = {}
+    if args.bcrypt_rounds is not None:
+        config["BCRYPT_LOG_ROUNDS"] = args.bcrypt_rounds
+    with tempfile.TemporaryDirectory() as tmp:
+        app = build_app(
+            os.path.join(tmp, "bench.db"), args.users, args.posts, args.seed, **config
+        )
+        cookie = login_cookie(app, 1)
+        routes = build_routes(app, random.Random(args.seed))
+        report = {
+            "commit": git_commit(),
+            "users": args.users,
+            "posts": args.posts,
+            "seed": args.seed,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+        }
+        if args.mode in ("client", "both"):
+            report["client"] = run_client(app, cookie, routes, args.requests)
+            print_results("Test client", report["client"])
+        if args.mode in ("wsgi", "both"):
+            report["wsgi"] = run_wsgi(
+                app, cookie, routes, args.requests, args.concurrency
+            )
+            print_results(
+                f"WSGI server, {args.concurrency} concurrent clients", report["wsgi"]
+            )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
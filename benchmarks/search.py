@@ -0,0 +1,111 @@
+"""Measure search latency as the post table grows, against a LIKE scan of the posts.
+
+Run from the repository root:
+
+    python benchmarks/search.py --sizes 100000 1000000 --requests 50
+
+A throwaway SQLite database is grown to each --sizes number of posts with
+"flask seed", which also fills the search index. At each size /search is
+requested through the Flask test client for a word in every post, two words, a
+rarer word, a word within one category and the second page of results for the
+common word. The same words are then found with a LIKE scan of the post titles
+and content, the way the search worked before it had an index.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from common import build_app, run_seed, summarize
+from fitnessblog.models import Post
+from fitnessblog.posts.utils import POSTS_PER_PAGE
+from fitnessblog.search.utils import search_posts
+
+# (name, words, category) searched at every size, generated posts all end with "plenty of rest"
+QUERIES = [
+    ("common word", "rest", None),
+    ("two words", "squat deadlift", None),
+    ("rare word", "mobility", None),
+    ("in category", "press", "weight"),
+]
+
+
+# Latency percentiles for calling f requests times
+def measure(f, requests):
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        f()
+        timings.append(time.perf_counter() - start)
+    return summarize(timings, sum(timings))
+
+
+def search_url(words, category=None, before=None):
+    url = f"/search?q={words.replace(' ', '+')}"
+    if category:
+        url += f"&category={category}"
+    if before:
+        url += f"&before={before}"
+    return url
+
+
+# The newest page of posts containing every word, without the search index
+def like_scan(words):
+    query = Post.query
+    for word in words.split():
+        pattern = f"%{word}%"
+        query = query.filter(Post.title.like(pattern) | Post.content.like(pattern))
+    return query.order_by(Post.date_posted.desc()).limit(POSTS_PER_PAGE).all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--json", help="Write the results to this file.")
+    args = parser.parse_args()
+
+    report = {}
+    print(f"{'posts':>9}  {'request':<24}{'p50 ms':>10}{'p95 ms':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        app = build_app(os.path.join(tmp, "bench.db"), 0, 0)
+        client = app.test_client()
+        seeded = 0
+        for step, size in enumerate(sorted(args.sizes)):
+            # Each step adds a user per hundred new posts, as flask seed needs authors for them
+            added = size - seeded
+            run_seed(app, max(1, added // 100), added, args.seed + step)
+            seeded = size
+
+            def get(url):
+                def request():
+                    assert client.get(url).status_code == 200, url
+
+                return request
+
+            with app.app_context():
+                older = search_posts(QUERIES[0][1]).older_cursor
+            results = {}
+            for name, words, category in QUERIES:
+                results[name] = measure(get(search_url(words, category)), args.requests)
+            results["common word page 2"] = measure(
+                get(search_url(QUERIES[0][1], before=older)), args.requests
+            )
+            with app.app_context():
+                for name, words, category in QUERIES[:3]:
+                    results[f"{name} LIKE"] = measure(
+                        lambda: like_scan(words), args.requests
+                    )
+            for name, r in results.items():
+                print(f"{size:>9}  {name:<24}{r['p50']:>10.2f}{r['p95']:>10.2f}")
+            report[size] = results
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
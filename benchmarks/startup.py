@@ -0,0 +1,153 @@
+"""Measure how long the app takes to import and to answer its first request.
+
+Run from the repository root:
+
+    python benchmarks/startup.py --runs 5 --json startup.json
+
+Each run starts a fresh interpreter, the way a server worker starts. The import time
+comes from "python -X importtime -c 'import wsgi'". Time to first response is the
+wall time from starting the interpreter until "import wsgi" plus one request to
+/about has finished. The script also checks that heavy modules only needed by
+background jobs or the flask command (Pillow, Flask-Mail, bcrypt, Alembic) are
+not imported at startup. It exits with status 1 when a budget is exceeded, so it
+can guard against startup regressions in CI.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import ROOT_DIR, build_app
+
+# Modules that must not be imported by creating the app and serving a page
+DEFERRED_MODULES = (
+    "PIL",
+    "flask_mail",
+    "bcrypt",
+    "alembic",
+    "flask_migrate",
+    "markdown",
+    "bleach",
+)
+
+FIRST_RESPONSE = """
+import sys
+import wsgi
+response = wsgi.app.test_client().get("/about")
+assert response.status_code == 200, response.status_code
+print(",".join(m for m in {modules!r} if m in sys.modules))
+"""
+
+
+def child_env(database_path):
+    env = dict(os.environ)
+    env["DATABASE_URL"] = f"sqlite:///{database_path}"
+    env.setdefault("SECRET_KEY", "startup-benchmark")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT_DIR, env.get("PYTHONPATH")]))
+    return env
+
+
+# Cumulative import time of wsgi in milliseconds, and the slowest top level imports under it
+def import_time(env):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import wsgi"],
+        cwd=ROOT_DIR,
+        env=env,
+        stderr=subprocess.PIPE,
+        check=True,
+        universal_newlines=True,
+    )
+    total, modules = 0.0, []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip())) // 2
+        ms = int(cumulative) / 1000
+        if name.strip() == "wsgi":
+            total = ms
+        elif depth == 1:
+            modules.append((name.strip(), ms))
+    return total, sorted(modules, key=lambda m: -m[1])
+
+
+# Wall time to start an interpreter, create the app and answer /about, plus any deferred modules it imported
+def first_response(env):
+    script = FIRST_RESPONSE.format(modules=DEFERRED_MODULES)
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=ROOT_DIR,
+        env=env,
+        stdout=subprocess.PIPE,
+        check=True,
+        universal_newlines=True,
+    )
+    elapsed = (time.perf_counter() - start) * 1000
+    imported = [m for m in result.stdout.strip().split(",") if m]
+    return elapsed, imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--max-import-ms", type=float, default=600, help="Budget for importing wsgi."
+    )
+    parser.add_argument(
+        "--max-first-response-ms",
+        type=float,
+        default=1200,
+        help="Budget for starting Python, importing wsgi and serving /about.",
+    )
+    parser.add_argument("--json", help="Write the results to this file.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        build_app(path, 10, 100)
+        env = child_env(path)
+        imports, responses, deferred, slowest = [], [], set(), []
+        for _ in range(args.runs):
+            total, slowest = import_time(env)
+            imports.append(total)
+            elapsed, imported = first_response(env)
+            responses.append(elapsed)
+            deferred.update(imported)
+
+    report = {
+        "runs": args.runs,
+        "import_ms": statistics.median(imports),
+        "first_response_ms": statistics.median(responses),
+        "slowest_imports": dict(slowest[:10]),
+        "deferred_modules_imported": sorted(deferred),
+    }
+    print(f"import wsgi        {report['import_ms']:8.1f} ms (median of {args.runs})")
+    print(f"first response     {report['first_response_ms']:8.1f} ms")
+    print("slowest imports:")
+    for name, ms in slowest[:10]:
+        print(f"  {name:<28}{ms:8.1f} ms")
+
+    failures = []
+    if report["import_ms"] > args.max_import_ms:
+        failures.append(f"import took {report['import_ms']:.0f} ms")
+    if report["first_response_ms"] > args.max_first_response_ms:
+        failures.append(f"first response took {report['first_response_ms']:.0f} ms")
+    if deferred:
+        failures.append(f"imported at startup: {', '.join(sorted(deferred))}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if failures:
+        print("Over budget: " + "; ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
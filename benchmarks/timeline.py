@@ -0,0 +1,110 @@
+"""Measure personal timeline reads for users following more and more authors.
+
+Run from the repository root:
+
+    python benchmarks/timeline.py --users 1200 --posts 60000 --follows 10 100 1000
+
+A throwaway SQLite database is filled with generated users and posts. For each
+--follows count a reader follows that many authors and their timeline is built the
+way fan out on write leaves it. The first and second pages of the timeline are then
+read from the precomputed timeline, and the first page is also read by pulling the
+latest posts of every followed author (fan out on read) for comparison. /feed is
+requested through the Flask test client as the reader.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from common import build_app, login_cookie, summarize
+from fitnessblog import db
+from fitnessblog.models import Follow, Post, User
+from fitnessblog.posts.utils import cursor_paginate, feed_query
+from fitnessblog.timeline.utils import rebuild_timeline, timeline_page
+
+
+# Latency percentiles for calling f requests times
+def measure(f, requests):
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        f()
+        timings.append(time.perf_counter() - start)
+    return summarize(timings, sum(timings))
+
+
+# A new user following the first follows seeded authors, with their timeline filled
+def add_reader(app, follows):
+    with app.app_context():
+        reader = User(
+            username=f"reader{follows}",
+            email=f"reader{follows}@example.com",
+            profile_type="student",
+            password="x",
+        )
+        db.session.add(reader)
+        db.session.flush()
+        authors = [
+            user_id
+            for (user_id,) in db.session.query(User.id)
+            .filter(User.id != reader.id, ~User.username.like("reader%"))
+            .order_by(User.id)
+            .limit(follows)
+        ]
+        if len(authors) < follows:
+            raise SystemExit(f"--users must be at least {follows} to follow {follows}")
+        db.session.execute(
+            Follow.__table__.insert(),
+            [{"follower_id": reader.id, "followed_id": author} for author in authors],
+        )
+        rebuild_timeline(reader.id, app.config["TIMELINE_MAX_ENTRIES"])
+        db.session.commit()
+        return reader.id, authors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1200)
+    parser.add_argument("--posts", type=int, default=60000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--follows", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--json", help="Write the results to this file.")
+    args = parser.parse_args()
+
+    report = {}
+    print(f"{'follows':>8}  {'read':<18}{'p50 ms':>10}{'p95 ms':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        app = build_app(
+            os.path.join(tmp, "bench.db"), args.users, args.posts, args.seed
+        )
+        client = app.test_client()
+        for follows in args.follows:
+            reader_id, authors = add_reader(app, follows)
+            with app.app_context():
+                second = timeline_page(reader_id).older_cursor
+                reads = {
+                    "timeline": lambda: timeline_page(reader_id),
+                    "timeline page 2": lambda: timeline_page(reader_id, before=second),
+                    "pull": lambda: cursor_paginate(
+                        feed_query(Post.user_id.in_(authors))
+                    ),
+                }
+                results = {
+                    name: measure(read, args.requests) for name, read in reads.items()
+                }
+            client.set_cookie("localhost", "session", login_cookie(app, reader_id))
+            assert client.get("/feed").status_code == 200
+            results["/feed"] = measure(lambda: client.get("/feed"), args.requests)
+            for name, r in results.items():
+                print(f"{follows:>8}  {name:<18}{r['p50']:>10.2f}{r['p95']:>10.2f}")
+            report[follows] = results
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
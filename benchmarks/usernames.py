@@ -0,0 +1,126 @@
+"""Measure sign ups and live username checks against the database's unique constraints.
+
+Run from the repository root:
+
+    python benchmarks/usernames.py --users 20000 --requests 500
+
+A throwaway SQLite database is filled with generated users. Accounts are then
+created through the sign up form, once with free names and once with a taken name,
+counting the SQL statements each sign up runs. /api/v1/username-available is then
+asked about free and taken names, recording how many answers came from the
+in-memory username filter and the latency compared with looking every name up.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from sqlalchemy import event
+
+from common import build_app, summarize
+from fitnessblog import db, usernames
+from fitnessblog.models import User
+
+
+# Latency percentiles and SQL statements per call of f(n) for n in range(requests)
+def measure(f, requests, statements):
+    timings = []
+    statements[0] = 0
+    for n in range(requests):
+        start = time.perf_counter()
+        f(n)
+        timings.append(time.perf_counter() - start)
+    r = summarize(timings, sum(timings))
+    r["statements"] = statements[0] / requests
+    return r
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--signups", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--json", help="Write the results to this file.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = build_app(
+            os.path.join(tmp, "bench.db"),
+            args.users,
+            0,
+            args.seed,
+            BCRYPT_LOG_ROUNDS=4,
+            PASSWORD_HASH_WORKERS=0,
+        )
+        client = app.test_client()
+        statements = [0]
+        with app.app_context():
+            engine = db.engine
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def count_statement(*args):
+            statements[0] += 1
+
+        def sign_up(username, email):
+            return client.post(
+                "/register",
+                data={
+                    "username": username,
+                    "email": email,
+                    "password": "password",
+                    "confirm_password": "password",
+                    "profile_type": "student",
+                },
+            )
+
+        def free_sign_up(n):
+            assert sign_up(f"new{n}", f"new{n}@example.com").status_code == 302
+
+        def taken_sign_up(n):
+            assert (
+                b"Username is taken" in sign_up("user1", f"taken{n}@example.com").data
+            )
+
+        def check(username):
+            response = client.get(f"/api/v1/username-available?username={username}")
+            assert response.status_code == 200
+            return response.get_json()["available"]
+
+        def lookup(username):
+            with app.app_context():
+                query = db.session.query(User.id).filter_by(username=username)
+                return db.session.query(query.exists()).scalar()
+
+        # Build the filter before timing the checks
+        check("warmup")
+        usernames.checks.clear()
+        results = {
+            "sign up": measure(free_sign_up, args.signups, statements),
+            "sign up taken": measure(taken_sign_up, args.signups, statements),
+            "check free": measure(
+                lambda n: check(f"free{n}"), args.requests, statements
+            ),
+        }
+        from_filter = usernames.checks["filter"]
+        results["check taken"] = measure(
+            lambda n: check(f"user{n % args.users + 1}"), args.requests, statements
+        )
+        results["lookup free"] = measure(
+            lambda n: lookup(f"free{n}"), args.requests, statements
+        )
+
+    print(f"{'request':<16}{'p50 ms':>10}{'p95 ms':>10}{'SQL':>8}")
+    for name, r in results.items():
+        print(f"{name:<16}{r['p50']:>10.2f}{r['p95']:>10.2f}{r['statements']:>8.1f}")
+    print(f"free names answered without SQL: {from_filter}/{args.requests}")
+    report = {"results": results, "free_answered_by_filter": from_filter}
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
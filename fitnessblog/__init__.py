@@ -1,16 +1,34 @@
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-from flask_bcrypt import Bcrypt
 from flask_login import LoginManager
-from flask_mail import Mail
 from fitnessblog.config import Config
+from fitnessblog.database import Database, configure_database
+from fitnessblog.cache import FragmentCache
+from fitnessblog.passwords import PasswordHasher
+from fitnessblog.jobs import JobQueue
+from fitnessblog.identity import IdentityCache
+from fitnessblog.metrics import Metrics
+from fitnessblog.assets import Assets
+from fitnessblog.ratelimit import RateLimiter
+from fitnessblog.events import EventHub
+from fitnessblog.usernames import UsernameFilter
+from fitnessblog.schema import init_cli_migrate
+from fitnessblog.seed import seed_command
 
 
-# Create DB instance
-db = SQLAlchemy()
+# Request timings, SQL and template metrics served at /metrics
+metrics = Metrics()
 
-# Bcrypt PW hashing
-bcrypt = Bcrypt()
+# Token bucket rate limits for logins, sign ups and password resets
+limiter = RateLimiter()
+
+# Create DB instance, read only views can be routed to replicas (see fitnessblog/database.py)
+db = Database()
+
+# Background jobs (flask jobs work)
+jobs = JobQueue(db)
+
+# Runs bcrypt in a bounded worker pool
+passwords = PasswordHasher()
 
 # Flask Login
 login_manager = LoginManager()
@@ -19,31 +37,63 @@ login_manager = LoginManager()
 login_manager.login_view = "users.login"
 login_manager.login_message_category = "info"
 
+# Caches the logged in user's fields so the user loader rarely hits the db
+identity = IdentityCache()
+
+# Cache for rendered post cards and anonymous feed pages
+cache = FragmentCache()
 
-mail = Mail()
+# Fingerprinted CSS, JS and images (flask assets build)
+assets = Assets()
+
+# Pushes new, updated and deleted posts to open latest posts pages
+events = EventHub()
+
+# In-memory filter of taken usernames for the live username check on the sign up and account forms
+usernames = UsernameFilter(db)
 
 
 def create_app(config_class=Config):
     app = Flask(__name__)
 
     # Use config values from config file
-    app.config.from_object(Config)
+    app.config.from_object(config_class)
 
+    metrics.init_app(app)
+    limiter.init_app(app)
+    configure_database(app)
     db.init_app(app)
-    bcrypt.init_app(app)
+    jobs.init_app(app)
+    passwords.init_app(app)
     login_manager.init_app(app)
-    mail.init_app(app)
+    identity.init_app(app)
+    cache.init_app(app)
+    assets.init_app(app)
+    events.init_app(app)
+    usernames.init_app(app)
 
     # Import routes from Blueprints
     from fitnessblog.users.routes import users
     from fitnessblog.posts.routes import posts
     from fitnessblog.main.routes import main
+    from fitnessblog.search.routes import search
+    from fitnessblog.timeline.routes import timeline
+    from fitnessblog.api.routes import api
     from fitnessblog.errors.handlers import errors
 
     # Register routes from Blueprints
     app.register_blueprint(users)
     app.register_blueprint(posts)
     app.register_blueprint(main)
+    app.register_blueprint(search)
+    app.register_blueprint(timeline)
+    app.register_blueprint(api, url_prefix="/api/v1")
     app.register_blueprint(errors)
 
+    # Schema migrations (flask db upgrade), only loaded for the flask command
+    init_cli_migrate(app)
+
+    # Generate test data (flask seed)
+    app.cli.add_command(seed_command)
+
     return app
@@ -0,0 +1,167 @@
+from flask import abort, current_app, request, stream_with_context, Blueprint
+from flask_login import current_user
+from werkzeug.exceptions import HTTPException
+from fitnessblog import usernames
+from fitnessblog.database import use_replica
+from fitnessblog.models import Post, User
+from fitnessblog.posts.forms import CATEGORIES
+from fitnessblog.posts.utils import feed_total, get_post_or_404, category_counts
+from fitnessblog.posts.bulk import encode_rows, export_rows, import_posts, read_records
+from fitnessblog.api.utils import (
+    etag_feed,
+    feed_page,
+    load_posts,
+    page_links,
+    requested_fields,
+    serialize_post,
+    make_etag,
+    not_modified,
+    json_response,
+)
+
+api = Blueprint("api", __name__)
+
+
+# Errors inside the API are returned as JSON instead of the HTML error pages
+@api.errorhandler(HTTPException)
+def api_error(error):
+    return json_response(
+        {"error": error.name, "message": error.description}, status=error.code
+    )
+
+
+# Serialize one page of a feed, answering 304 before the posts are loaded if the client is up to date
+def feed_response(query, count_key):
+    fields = requested_fields()
+    page, etag = feed_page(query, feed_total(count_key), count_key)
+    response = not_modified(etag)
+    if response is not None:
+        return response
+    posts = load_posts(page.items)
+    data = {
+        "posts": [serialize_post(post, fields) for post in posts],
+        "total": page.total,
+        "links": page_links(page),
+    }
+    return json_response(data, etag=etag)
+
+
+# All posts or the posts in one category, newest first
+@api.route("/posts", methods=["GET"])
+@use_replica
+def list_posts():
+    category = request.args.get("category")
+    if category is None:
+        return feed_response(etag_feed(), "home")
+    if category not in dict(CATEGORIES):
+        abort(400, f"Unknown category: {category}")
+    return feed_response(etag_feed(Post.category == category), ("category", category))
+
+
+# A single post
+@api.route("/posts/<int:post_id>", methods=["GET"])
+@use_replica
+def get_post(post_id):
+    fields = requested_fields()
+    post = get_post_or_404(post_id)
+    etag = make_etag(
+        post.id,
+        post.date_updated,
+        post.render_version,
+        post.author.username,
+        post.author.image_file,
+        post.author.profile_type,
+        request.args.get("fields"),
+    )
+    response = not_modified(etag)
+    if response is not None:
+        return response
+    return json_response(serialize_post(post, fields), etag=etag)
+
+
+# Posts written by a specific user, newest first
+@api.route("/users/<string:username>/posts", methods=["GET"])
+@use_replica
+def user_posts(username):
+    user = User.query.filter_by(username=username).first_or_404()
+    return feed_response(etag_feed(Post.user_id == user.id), ("user", user.id))
+
+
+# Every category with its post count and the number of posts in the last 24 hours
+@api.route("/categories", methods=["GET"])
+@use_replica
+def list_categories():
+    counts = category_counts()
+    etag = make_etag(counts)
+    response = not_modified(etag)
+    if response is not None:
+        return response
+    return json_response({"categories": counts}, etag=etag)
+
+
+# Whether a username is free, for the live check on the sign up and account forms
+# Most names are answered by the in-memory username filter, only names it may hold are looked up
+# The logged in user's own name counts as available, so the account form doesn't report it as taken
+@api.route("/username-available", methods=["GET"])
+@use_replica
+def username_available():
+    username = request.args.get("username", "")
+    if not 2 <= len(username) <= 20:
+        abort(400, "Usernames are 2 to 20 characters long")
+    own = current_user.is_authenticated and username == current_user.username
+    available = own or not usernames.is_taken(username)
+    return json_response({"username": username, "available": available})
+
+
+# Content types accepted and sent by the bulk endpoints
+BULK_MIMETYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+# Create many posts from an NDJSON or CSV body, all written by the logged in user
+# The body is read line by line and written in batches, so large imports use constant memory
+# Browsers can't send these content types cross site without a CORS preflight, which keeps forms on other sites out
+@api.route("/posts/bulk", methods=["POST"])
+def bulk_import():
+    if not current_user.is_authenticated:
+        abort(401)
+    formats = {mimetype: fmt for fmt, mimetype in BULK_MIMETYPES.items()}
+    fmt = formats.get(request.mimetype)
+    if fmt is None:
+        abort(415, f"Send {' or '.join(BULK_MIMETYPES.values())}")
+    if request.content_length is None:
+        abort(411)
+    if request.content_length > current_app.config["POST_IMPORT_MAX_BYTES"]:
+        abort(413)
+    skip_invalid = request.args.get("skip_invalid") == "1"
+    imported, invalid, errors = import_posts(
+        read_records(request.stream, fmt),
+        user_id=current_user.id,
+        batch_size=current_app.config["POST_IMPORT_BATCH_SIZE"],
+        skip_invalid=skip_invalid,
+    )
+    data = {
+        "imported": imported,
+        "invalid": invalid,
+        "errors": [{"line": e.line, "message": e.message} for e in errors],
+    }
+    # Without skip_invalid the import stops at the first invalid record, earlier batches are kept
+    return json_response(data, status=422 if invalid and not skip_invalid else 200)
+
+
+# Every post as NDJSON or CSV, streamed from the database in chunks, for logged in users like the import
+@api.route("/posts/export", methods=["GET"])
+@use_replica
+def bulk_export():
+    if not current_user.is_authenticated:
+        abort(401)
+    fmt = request.args.get("format", "ndjson")
+    if fmt not in BULK_MIMETYPES:
+        abort(400, f"Unknown format: {fmt}")
+    category = request.args.get("category")
+    if category is not None and category not in dict(CATEGORIES):
+        abort(400, f"Unknown category: {category}")
+    chunks = encode_rows(export_rows(category=category), fmt)
+    return current_app.response_class(
+        stream_with_context(chunk.encode("utf-8") for chunk in chunks),
+        mimetype=BULK_MIMETYPES[fmt],
+    )
@@ -0,0 +1,189 @@
+import gzip
+import hashlib
+import json
+from flask import abort, current_app, request, url_for
+from sqlalchemy.orm import joinedload
+from fitnessblog import db
+from fitnessblog.models import Post, User
+from fitnessblog.posts.utils import cursor_paginate
+from fitnessblog.users.utils import picture_url
+
+# orjson and brotli are optional, the standard library is used when they aren't installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Fields a client can ask for with ?fields=, all of them are returned by default
+POST_FIELDS = {
+    "id": lambda post: post.id,
+    "title": lambda post: post.title,
+    "content": lambda post: post.content,
+    "content_html": lambda post: post.content_html,
+    "category": lambda post: post.category,
+    "date_posted": lambda post: post.date_posted.isoformat(),
+    "date_updated": lambda post: post.date_updated.isoformat(),
+    "author": lambda post: {
+        "username": post.author.username,
+        "profile_type": post.author.profile_type,
+        "image_url": picture_url(post.author.image_file, 130),
+    },
+    "url": lambda post: url_for("api.get_post", post_id=post.id, _external=True),
+}
+
+
+# Parse ?fields=id,title into a list of field names, 400 for unknown fields
+def requested_fields():
+    value = request.args.get("fields")
+    if not value:
+        return list(POST_FIELDS)
+    fields = [field.strip() for field in value.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in POST_FIELDS]
+    if unknown or not fields:
+        abort(400, f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def serialize_post(post, fields):
+    return {field: POST_FIELDS[field](post) for field in fields}
+
+
+# Page size from ?limit=, capped so a client can't ask for the whole table at once
+def requested_limit():
+    limit = request.args.get("limit", current_app.config["API_PAGE_SIZE"], type=int)
+    if limit < 1:
+        abort(400, "limit must be at least 1")
+    return min(limit, current_app.config["API_MAX_PAGE_SIZE"])
+
+
+# Light version of a feed that only reads what the ETag depends on, never the post content
+def etag_feed(*criteria):
+    return (
+        db.session.query(
+            Post.id,
+            Post.date_posted,
+            Post.date_updated,
+            Post.render_version,
+            User.username,
+            User.image_file,
+            User.profile_type,
+        )
+        .join(Post.author)
+        .filter(*criteria)
+        .order_by(Post.date_posted.desc(), Post.id.desc())
+    )
+
+
+# Strong ETag built from everything that makes up a response
+# Any new, edited, deleted or rerendered post or a changed author gives a different tag
+def make_etag(*parts):
+    digest = hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+    return digest[:32]
+
+
+# A page of a feed as (page of light rows, etag)
+# The full posts are only loaded by load_posts once we know the client's copy is out of date
+def feed_page(query, total, key):
+    page = cursor_paginate(
+        query,
+        before=request.args.get("before"),
+        after=request.args.get("after"),
+        total=total,
+        per_page=requested_limit(),
+    )
+    etag = make_etag(
+        key,
+        request.args.get("fields"),
+        total,
+        page.has_newer,
+        page.has_older,
+        [tuple(row) for row in page.items],
+    )
+    return page, etag
+
+
+# Load the full posts for a page of light rows, in the same order
+def load_posts(rows):
+    ids = [row.id for row in rows]
+    if not ids:
+        return []
+    posts = Post.query.options(joinedload(Post.author)).filter(Post.id.in_(ids))
+    by_id = {post.id: post for post in posts}
+    return [by_id[post_id] for post_id in ids]
+
+
+# Links to the neighbouring pages of a feed, keeping the other query args
+def page_links(page):
+    args = {k: v for k, v in request.args.items() if k not in ("before", "after")}
+    return {
+        "newer": url_for(
+            request.endpoint,
+            **request.view_args,
+            **args,
+            after=page.newer_cursor,
+            _external=True,
+        )
+        if page.has_newer
+        else None,
+        "older": url_for(
+            request.endpoint,
+            **request.view_args,
+            **args,
+            before=page.older_cursor,
+            _external=True,
+        )
+        if page.has_older
+        else None,
+    }
+
+
+# A 304 response if the client's copy matches the tag, or the tag given to one of its compressed copies
+def not_modified(etag):
+    for tag in (etag, f"{etag}-gzip", f"{etag}-br"):
+        if request.if_none_match.contains(tag):
+            response = current_app.response_class(status=304)
+            response.set_etag(tag)
+            response.vary.add("Accept-Encoding")
+            response.cache_control.no_cache = True
+            return response
+    return None
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+# Compress a body with the best encoding the client accepts
+# Returns (body, encoding), encoding is None when the body is sent as is
+def compress(body):
+    if len(body) < current_app.config["API_COMPRESS_MIN_BYTES"]:
+        return body, None
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return brotli.compress(body, quality=5), "br"
+    if accepted["gzip"]:
+        return gzip.compress(body, compresslevel=6), "gzip"
+    return body, None
+
+
+# Build a JSON response with an ETag, clients revalidate every time and get a 304 when nothing changed
+def json_response(data, etag=None, status=200):
+    body, encoding = compress(dumps(data))
+    response = current_app.response_class(
+        body, status=status, mimetype="application/json"
+    )
+    response.vary.add("Accept-Encoding")
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    if etag is not None:
+        response.set_etag(f"{etag}-{encoding}" if encoding else etag)
+        response.cache_control.no_cache = True
+    return response
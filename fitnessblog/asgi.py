@@ -0,0 +1,490 @@
+import asyncio
+import io
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import wraps
+from types import SimpleNamespace
+from flask import (
+    Response,
+    _app_ctx_stack,
+    _request_ctx_stack,
+    abort,
+    current_app,
+    g,
+    render_template,
+    request,
+)
+from flask_login import current_user
+from werkzeug.exceptions import HTTPException
+from fitnessblog import cache, db, events
+from fitnessblog.asyncdb import AsyncDatabase
+from fitnessblog.events import EVENT_STREAM_HEADERS, async_event_stream
+from fitnessblog.database import choose_replica
+from fitnessblog.metrics import record_statement
+from fitnessblog.models import Post, User
+from fitnessblog.posts.utils import (
+    category_feed,
+    cursor_page,
+    cursor_query,
+    feed_page_args,
+    feed_total_query,
+    home_feed,
+    latest_feed,
+    offset_page,
+    offset_query,
+    post_page_query,
+    user_feed,
+)
+from fitnessblog.timeline.forms import FollowForm
+from fitnessblog.timeline.utils import follow_query
+
+# Views served as coroutines by the ASGI app, by endpoint. Their sync versions stay registered for the WSGI app
+ASYNC_VIEWS = {}
+
+# Methods the async views answer, other methods go to the Flask app like every other route
+ASYNC_METHODS = ("GET", "HEAD")
+
+
+# ASGI front end for the Flask app, e.g. "uvicorn asgi:app" (see asgi.py in the project root)
+# The read only feed views in ASYNC_VIEWS run on the event loop and wait for the database without holding a
+# thread, as does the latest posts event stream while it waits for posts. Their request hooks, user loading,
+# page cache and template rendering still block, so those parts hop to the thread pool with run_sync.
+# Every other route runs unchanged on the Flask app in a pool of ASGI_THREADS threads
+class ASGIApp:
+    def __init__(self, app):
+        app.config.setdefault("ASGI_THREADS", 32)
+        # Waiting event streams don't hold a thread here, so the live latest posts page is on by default
+        if app.config.get("EVENTS_STREAM_ENABLED") is None:
+            app.config["EVENTS_STREAM_ENABLED"] = True
+        self.app = app
+        self.database = AsyncDatabase(app)
+        self.executor = ThreadPoolExecutor(
+            app.config["ASGI_THREADS"], thread_name_prefix="wsgi"
+        )
+        app.extensions["asgi"] = self
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            raise RuntimeError(f"Unsupported ASGI scope {scope['type']}")
+        environ = _environ(scope, _RequestBody(receive, asyncio.get_running_loop()))
+        view = self._async_view(environ)
+        if view is None:
+            await self._call_wsgi(environ, send)
+        else:
+            await self._call_async(view, environ, receive, send)
+
+    def _async_view(self, environ):
+        if environ["REQUEST_METHOD"] not in ASYNC_METHODS:
+            return None
+        adapter = self.app.create_url_adapter(self.app.request_class(environ))
+        try:
+            endpoint, _ = adapter.match()
+        except HTTPException:
+            # Not found, redirects and so on are left to Flask
+            return None
+        return ASYNC_VIEWS.get(endpoint)
+
+    # Run a request through an async view, with the same hooks, error handlers and teardown as Flask's wsgi_app
+    async def _call_async(self, view, environ, receive, send):
+        app = self.app
+        ctx = app.request_context(environ)
+        error = None
+        ctx.push()
+        try:
+            try:
+                rv = await run_sync(_preprocess_request)
+                if rv is None:
+                    rv = await view(**request.view_args)
+            except Exception as e:
+                rv = await run_sync(_handling, app.handle_user_exception, e)
+            response = await run_sync(app.finalize_request, rv)
+            headers = response.get_wsgi_headers(environ)
+            stream = getattr(response, "async_body", None)
+            body = b"" if stream else b"".join(response.get_app_iter(environ))
+        except Exception as e:
+            error = e
+            stream = None
+            response = await run_sync(_handling, app.handle_exception, e)
+            headers = response.get_wsgi_headers(environ)
+            body = b"".join(response.get_app_iter(environ))
+        finally:
+            if app.should_ignore_error(error):
+                error = None
+            ctx.auto_pop(error)
+        await send(
+            {
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": _encode_headers(headers.to_wsgi_list()),
+            }
+        )
+        if stream is None:
+            await send({"type": "http.response.body", "body": body})
+        elif environ["REQUEST_METHOD"] == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+        else:
+            await self._stream(stream, receive, send)
+
+    # Send a streamed response body until it ends or the client goes away
+    # A disconnect is noticed at the next chunk, which for event streams is at most a keepalive away
+    async def _stream(self, body, receive, send):
+        disconnected = asyncio.ensure_future(_disconnected(receive))
+        try:
+            async for chunk in body:
+                if disconnected.done():
+                    return
+                await send(
+                    {"type": "http.response.body", "body": chunk, "more_body": True}
+                )
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            disconnected.cancel()
+            await body.aclose()
+
+    # Run a request on the Flask app in the thread pool, streaming the response back as it is produced
+    async def _call_wsgi(self, environ, send):
+        loop = asyncio.get_running_loop()
+
+        def send_from_thread(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def run():
+            started = []
+
+            def start_response(status, headers, exc_info=None):
+                if exc_info and started:
+                    raise exc_info[1].with_traceback(exc_info[2])
+                started[:] = [int(status.split(" ", 1)[0]), headers]
+
+            def send_start():
+                status, headers = started
+                send_from_thread(
+                    {
+                        "type": "http.response.start",
+                        "status": status,
+                        "headers": _encode_headers(headers),
+                    }
+                )
+                started.append(True)
+
+            result = self.app(environ, start_response)
+            try:
+                for chunk in result:
+                    if not chunk:
+                        continue
+                    if len(started) == 2:
+                        send_start()
+                    send_from_thread(
+                        {"type": "http.response.body", "body": chunk, "more_body": True}
+                    )
+                if len(started) == 2:
+                    send_start()
+                send_from_thread({"type": "http.response.body", "body": b""})
+            finally:
+                if hasattr(result, "close"):
+                    result.close()
+
+        await loop.run_in_executor(self.executor, run)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.database.close()
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+# Response with a body produced by an async iterator, which _call_async streams after the request has finished
+# The iterator can't use the request context
+class AsyncStreamResponse(Response):
+    automatically_set_content_length = False
+
+    def __init__(self, body, **kwargs):
+        super().__init__(**kwargs)
+        self.async_body = body
+
+
+async def _disconnected(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+# Request body for the WSGI app, read from the ASGI receive channel by the thread running the request
+class _RequestBody(io.RawIOBase):
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._buffer = b""
+        self._more = True
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer and self._more:
+            message = asyncio.run_coroutine_threadsafe(
+                self._receive(), self._loop
+            ).result()
+            self._buffer = message.get("body", b"")
+            self._more = message.get("more_body", False)
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+# WSGI environ for an ASGI HTTP scope (PEP 3333)
+def _environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BufferedReader(body),
+        # There may be no Content-Length, the body ends when the ASGI server says so
+        "wsgi.input_terminated": True,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1").upper().replace("-", "_")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = "HTTP_" + name
+        value = value.decode("latin-1")
+        if name in environ:
+            value = environ[name] + ("; " if name == "HTTP_COOKIE" else ",") + value
+        environ[name] = value
+    return environ
+
+
+def _encode_headers(headers):
+    return [
+        (name.lower().encode("latin-1"), value.encode("latin-1"))
+        for name, value in headers
+    ]
+
+
+# Flask 1.1 keeps the request context in thread locals and every request on the event loop shares one thread
+# While an async view waits, its context is taken off the stacks (without tearing it down) and put back afterwards,
+# so requests taking turns on the loop only ever see their own request, session and g
+@contextmanager
+def _suspended():
+    ctx = _request_ctx_stack.pop()
+    app_ctx = _app_ctx_stack.pop()
+    try:
+        yield
+    finally:
+        _app_ctx_stack.push(app_ctx)
+        _request_ctx_stack.push(ctx)
+
+
+# Run blocking Flask code in the thread pool with the current request's contexts, so a database or Redis round trip
+# it makes (loading the user on an identity cache miss, cache.versions, the sidebar counts) doesn't stall the
+# other requests on the event loop
+async def run_sync(f, *args, **kwargs):
+    app_ctx, ctx = _app_ctx_stack.top, _request_ctx_stack.top
+    executor = current_app.extensions["asgi"].executor
+
+    def run():
+        _app_ctx_stack.push(app_ctx)
+        _request_ctx_stack.push(ctx)
+        try:
+            return f(*args, **kwargs)
+        finally:
+            # The scoped session belongs to this thread, teardown on the event loop would never close it
+            db.session.remove()
+            _request_ctx_stack.pop()
+            _app_ctx_stack.pop()
+
+    with _suspended():
+        return await asyncio.get_running_loop().run_in_executor(executor, run)
+
+
+# Request hooks, plus loading the user so current_user never queries the database on the event loop afterwards
+def _preprocess_request():
+    app = current_app._get_current_object()
+    app.try_trigger_before_first_request_functions()
+    rv = app.preprocess_request()
+    current_user._get_current_object()
+    return rv
+
+
+# Flask's exception handlers read the exception being handled from sys.exc_info(), which is per thread
+def _handling(handler, e):
+    try:
+        raise e
+    except Exception:
+        return handler(e)
+
+
+async def render(template_name, **context):
+    return await run_sync(render_template, template_name, **context)
+
+
+# Run a query on the async database, reading from a replica the same way the sync views would
+async def fetch_all(query):
+    if "db_replica" not in g:
+        g.db_replica = choose_replica()
+    database = current_app.extensions["asgi"].database
+    bind = g.db_replica
+    start = time.perf_counter()
+    with _suspended():
+        rows = await database.fetch_all(query, bind=bind)
+    record_statement(time.perf_counter() - start)
+    return rows
+
+
+async def fetch_scalar(query):
+    rows = await fetch_all(query)
+    return rows[0][0] if rows else None
+
+
+# Posts (with .author) or users for a feed or user query, as plain objects with the fields the templates read
+async def fetch_objects(query):
+    statement = query.statement
+    columns = [(column.table.name, column.name) for column in statement.inner_columns]
+    objects = []
+    for row in await fetch_all(statement):
+        fields = {}
+        for (table, name), value in zip(columns, row):
+            fields.setdefault(table, {})[name] = value
+        author = SimpleNamespace(**fields[User.__tablename__])
+        if Post.__tablename__ in fields:
+            objects.append(SimpleNamespace(author=author, **fields[Post.__tablename__]))
+        else:
+            objects.append(author)
+    return objects
+
+
+# Async version of paginate_feed
+async def paginate_feed(query, count_key):
+    total = await fetch_scalar(feed_total_query(count_key)) or 0
+    page, before, after = feed_page_args()
+    if page is None:
+        items = await fetch_objects(cursor_query(query, before, after))
+        return cursor_page(items, before, after, total)
+    items = await fetch_objects(offset_query(query, page))
+    return offset_page(query, page, items, total)
+
+
+def async_view(endpoint):
+    def decorator(f):
+        ASYNC_VIEWS[endpoint] = f
+        return f
+
+    return decorator
+
+
+# Async versions of flask_login.login_required and FragmentCache.cached_page
+def login_required(f):
+    @wraps(f)
+    async def decorated_function(*args, **kwargs):
+        if not current_app.config.get("LOGIN_DISABLED") and not (
+            current_user.is_authenticated
+        ):
+            return current_app.login_manager.unauthorized()
+        return await f(*args, **kwargs)
+
+    return decorated_function
+
+
+def cached_page(f):
+    @wraps(f)
+    async def decorated_function(*args, **kwargs):
+        key = await run_sync(cache.page_key)
+        if key is None:
+            return await f(*args, **kwargs)
+        page = await run_sync(cache.get, key, kind="page")
+        if page is not None:
+            return page
+        page = await f(*args, **kwargs)
+        if isinstance(page, str):
+            await run_sync(cache.set, key, page, timeout=cache.page_timeout)
+        return page
+
+    return decorated_function
+
+
+@async_view("main.home")
+@cached_page
+async def home():
+    posts = await paginate_feed(home_feed(), "home")
+    return await render("home.html", posts=posts)
+
+
+@async_view("posts.post")
+async def post(post_id):
+    posts = await fetch_objects(post_page_query(post_id))
+    if not posts:
+        abort(404)
+    return await render("post.html", title=posts[0].title, post=posts[0])
+
+
+@async_view("posts.filter_by_category")
+@login_required
+async def filter_by_category(category):
+    posts = await paginate_feed(category_feed(category), ("category", category))
+    return await render("category_list.html", posts=posts, category=category)
+
+
+@async_view("posts.latest_posts")
+@login_required
+async def latest_posts():
+    posts = await paginate_feed(latest_feed(), "latest")
+    return await render("latest_posts.html", posts=posts)
+
+
+@async_view("users.user_posts")
+@cached_page
+async def user_posts(username):
+    users = await fetch_objects(User.query.filter_by(username=username).limit(1))
+    if not users:
+        abort(404)
+    user = users[0]
+    posts = await paginate_feed(user_feed(user), ("user", user.id))
+    following = current_user.is_authenticated and (
+        await fetch_scalar(follow_query(current_user.id, user.id).limit(1)) is not None
+    )
+    return await render(
+        "user_posts.html",
+        posts=posts,
+        user=user,
+        following=following,
+        form=FollowForm(),
+    )
+
+
+@async_view("posts.latest_stream")
+@login_required
+async def latest_stream():
+    if not events.stream_enabled:
+        abort(404)
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get(
+        "last_event_id"
+    )
+    stream = async_event_stream(
+        events, last_event_id, current_app.config["EVENTS_KEEPALIVE_SECONDS"]
+    )
+    return AsyncStreamResponse(
+        stream, mimetype="text/event-stream", headers=EVENT_STREAM_HEADERS
+    )
@@ -0,0 +1,242 @@
+import base64
+import glob
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import urllib.request
+import click
+from flask import current_app, request, send_from_directory, url_for
+from flask.cli import AppGroup, with_appcontext
+
+# brotli is optional, only .gz variants are written when it isn't installed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+assets_cli = AppGroup("assets", help="Vendor and build the static assets.")
+
+# Third party files served from static/vendor instead of their CDNs, with the subresource integrity hash they are checked against
+VENDOR = {
+    "vendor/bootstrap-4.3.1.min.css": (
+        "https://stackpath.bootstrapcdn.com/bootstrap/4.3.1/css/bootstrap.min.css",
+        "sha384-ggOyR0iXCbMQv3Xipma34MD+dH/1fQ784/j6cY/iJTQUOhcWr7x9JvoRxT2MZw1T",
+    ),
+    "vendor/jquery-3.3.1.slim.min.js": (
+        "https://code.jquery.com/jquery-3.3.1.slim.min.js",
+        "sha384-q8i/X+965DzO0rT7abK41JStQIAqVgRVzpbzo5smXKp4YfRvH+8abtTE1Pi6jizo",
+    ),
+    "vendor/popper-1.14.7.min.js": (
+        "https://cdnjs.cloudflare.com/ajax/libs/popper.js/1.14.7/umd/popper.min.js",
+        "sha384-UO2eT0CpHqdSJQ6hJty5KVphtPhzWj9WO1clHTMGa3JDZwrnQq4sF86dIHNDz0W1",
+    ),
+    "vendor/bootstrap-4.3.1.min.js": (
+        "https://stackpath.bootstrapcdn.com/bootstrap/4.3.1/js/bootstrap.min.js",
+        "sha384-JjSmVgyd0p3pXB1rRibZUAYoIIy6OrQ6VrjIEaFf/nJGzIxFDsf4x0xIM+B07jRM",
+    ),
+}
+
+# Bundles built into a single file each, sources are paths under static in the order they are joined
+BUNDLES = {
+    "site.css": ["vendor/bootstrap-4.3.1.min.css", "main.css"],
+    "site.js": [
+        "vendor/jquery-3.3.1.slim.min.js",
+        "vendor/popper-1.14.7.min.js",
+        "vendor/bootstrap-4.3.1.min.js",
+    ],
+    "latest.js": ["latest.js"],
+    "username.js": ["username.js"],
+}
+
+# Other static files copied under a content hashed name, patterns are relative to static
+FINGERPRINT = ("announcement_pics/*", "profile_pics/default.jpg")
+
+# Built files go here, next to manifest.json mapping each logical name to its hashed file
+DIST_DIR = "dist"
+
+# Processed profile pictures live in a folder named after their content hash, so they never change either
+_IMMUTABLE = re.compile(r"^(dist/|profile_pics/[0-9a-f]{20}/)")
+
+_CSS_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+_CSS_SPACE = re.compile(r"\s*([{};,>])\s*")
+
+
+# Small CSS minifier for our own stylesheets, vendored files are already minified
+def minify_css(css):
+    css = _CSS_COMMENT.sub("", css)
+    css = _CSS_SPACE.sub(r"\1", " ".join(css.split()))
+    return css.replace(";}", "}").strip()
+
+
+def _hashed_name(filename, content):
+    stem, ext = os.path.splitext(filename)
+    return f"{DIST_DIR}/{stem}.{hashlib.sha256(content).hexdigest()[:12]}{ext}"
+
+
+def _write(static, filename, content):
+    path = os.path.join(static, filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(content)
+    # Precompressed variants, picked by the static view from Accept-Encoding
+    if os.path.splitext(filename)[1] in (".css", ".js", ".svg"):
+        with open(path + ".gz", "wb") as f:
+            f.write(gzip.compress(content, compresslevel=9))
+        if brotli is not None:
+            with open(path + ".br", "wb") as f:
+                f.write(brotli.compress(content, quality=11))
+
+
+def _bundle_content(static, sources):
+    parts = []
+    for source in sources:
+        with open(os.path.join(static, source), "rb") as f:
+            content = f.read()
+        if source.endswith(".css") and not source.endswith(".min.css"):
+            content = minify_css(content.decode("utf-8")).encode("utf-8")
+        parts.append(content)
+    # A newline keeps a file that ends in a comment from swallowing the next one
+    return b"\n".join(parts)
+
+
+# Build the bundles and fingerprinted copies into static/dist and write the manifest
+# Files from earlier builds are left in place so pages cached before a deploy keep working
+def build_assets(static):
+    missing = [
+        source
+        for sources in BUNDLES.values()
+        for source in sources
+        if not os.path.exists(os.path.join(static, source))
+    ]
+    if missing:
+        raise click.ClickException(
+            f"Missing {', '.join(missing)}, run 'flask assets vendor' first"
+        )
+
+    manifest = {}
+    for name, sources in BUNDLES.items():
+        content = _bundle_content(static, sources)
+        manifest[name] = _hashed_name(name, content)
+        _write(static, manifest[name], content)
+    for pattern in FINGERPRINT:
+        for path in sorted(glob.glob(os.path.join(static, pattern))):
+            filename = os.path.relpath(path, static).replace(os.sep, "/")
+            with open(path, "rb") as f:
+                content = f.read()
+            manifest[filename] = _hashed_name(filename, content)
+            _write(static, manifest[filename], content)
+
+    with open(os.path.join(static, DIST_DIR, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def _integrity(content, algorithm):
+    digest = hashlib.new(algorithm, content).digest()
+    return f"{algorithm}-{base64.b64encode(digest).decode('ascii')}"
+
+
+# Fingerprinted static files served with far future cache headers and precompressed variants
+# Templates keep using url_for("static", filename=...), built files are swapped in through the manifest
+class Assets:
+    def __init__(self, app=None):
+        self.manifest = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("ASSETS_MAX_AGE", 365 * 24 * 3600)
+        app.extensions["assets"] = self
+        app.cli.add_command(assets_cli)
+        self.manifest = self.load_manifest(app)
+        app.url_defaults(self._fingerprint)
+        app.view_functions["static"] = self.static_view
+        app.add_template_global(self.bundle_urls)
+
+    def load_manifest(self, app):
+        path = os.path.join(app.static_folder, DIST_DIR, "manifest.json")
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    # Debug mode serves the source files so edits show up without a build
+    def _use_manifest(self):
+        return bool(self.manifest) and not current_app.debug
+
+    def _fingerprint(self, endpoint, values):
+        if endpoint == "static" and self._use_manifest():
+            filename = values.get("filename")
+            values["filename"] = self.manifest.get(filename, filename)
+
+    # URLs for a bundle, the built file or its sources before a build and in debug mode
+    # Vendored files that haven't been downloaded yet fall back to their CDN
+    def bundle_urls(self, name):
+        if self._use_manifest() and name in self.manifest:
+            return [url_for("static", filename=name)]
+        static = current_app.static_folder
+        return [
+            url_for("static", filename=source)
+            if os.path.exists(os.path.join(static, source))
+            else VENDOR[source][0]
+            for source in BUNDLES[name]
+        ]
+
+    def static_view(self, filename):
+        if not _IMMUTABLE.match(filename):
+            return current_app.send_static_file(filename)
+
+        static = current_app.static_folder
+        served = filename
+        encoding = None
+        if filename.startswith(DIST_DIR + "/"):
+            accepted = request.accept_encodings
+            for suffix, name in ((".br", "br"), (".gz", "gzip")):
+                if accepted[name] and os.path.exists(
+                    os.path.join(static, filename + suffix)
+                ):
+                    served, encoding = filename + suffix, name
+                    break
+        response = send_from_directory(
+            static,
+            served,
+            mimetype=mimetypes.guess_type(filename)[0],
+            cache_timeout=current_app.config["ASSETS_MAX_AGE"],
+        )
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        response.vary.add("Accept-Encoding")
+        if encoding is not None:
+            response.headers["Content-Encoding"] = encoding
+        return response
+
+
+@assets_cli.command("vendor")
+@with_appcontext
+def vendor_command():
+    """Download the third party CSS and JS into static/vendor."""
+    static = current_app.static_folder
+    for filename, (url, integrity) in VENDOR.items():
+        with urllib.request.urlopen(url, timeout=30) as response:
+            content = response.read()
+        algorithm = integrity.split("-", 1)[0]
+        if _integrity(content, algorithm) != integrity:
+            raise click.ClickException(f"{url} does not match its integrity hash")
+        path = os.path.join(static, filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(content)
+        click.echo(f"Saved {filename}")
+
+
+@assets_cli.command("build")
+@with_appcontext
+def build_command():
+    """Build the CSS and JS bundles and fingerprint the static files."""
+    manifest = build_assets(current_app.static_folder)
+    current_app.extensions["assets"].manifest = manifest
+    for name, built in sorted(manifest.items()):
+        click.echo(f"{name} -> {built}")
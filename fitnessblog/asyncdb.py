@@ -0,0 +1,153 @@
+import asyncio
+import re
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine.url import make_url
+from fitnessblog.database import sqlite_path, sqlite_pragmas
+
+# SQLAlchemy renders numbered placeholders as :1, asyncpg expects $1
+_NUMERIC_PARAM = re.compile(r"(?<!:):(\d+)\b")
+
+
+# Compile an ORM query or Core select for a dialect
+# Returns (sql, positional parameters, result processor for each column or None)
+# Parameters and results go through the column types, the same as when SQLAlchemy runs the query itself
+def compile_statement(statement, dialect):
+    statement = getattr(statement, "statement", statement)
+    compiled = statement.compile(dialect=dialect)
+    params = compiled.construct_params()
+    values = []
+    for name in compiled.positiontup:
+        process = (
+            compiled.binds[name].type.dialect_impl(dialect).bind_processor(dialect)
+        )
+        values.append(process(params[name]) if process else params[name])
+    processors = [
+        column.type.dialect_impl(dialect).result_processor(dialect, None)
+        for column in statement.inner_columns
+    ]
+    return compiled.string, values, processors
+
+
+# Pool of aiosqlite connections to one database file, opened as they are needed
+# aiosqlite runs each connection on its own thread, so the pool size is how many queries run at once
+class SQLitePool:
+    dialect = sqlite.dialect()
+
+    def __init__(self, path, config, size):
+        self.path = path
+        self.timeout = config["SQLITE_BUSY_TIMEOUT_MS"] / 1000
+        # The async views only read, query_only makes sure of it
+        self.pragmas = sqlite_pragmas(config) + ["PRAGMA query_only = ON"]
+        self.size = size
+        self._opened = 0
+        self._idle = None
+
+    async def _acquire(self):
+        import aiosqlite
+
+        if self._idle is None:
+            self._idle = asyncio.LifoQueue()
+        if self._idle.empty() and self._opened < self.size:
+            self._opened += 1
+            try:
+                connection = await aiosqlite.connect(self.path, timeout=self.timeout)
+                for pragma in self.pragmas:
+                    await connection.execute(pragma)
+            except Exception:
+                self._opened -= 1
+                raise
+            return connection
+        return await self._idle.get()
+
+    async def fetch(self, sql, params):
+        connection = await self._acquire()
+        try:
+            async with connection.execute(sql, params) as cursor:
+                return await cursor.fetchall()
+        finally:
+            self._idle.put_nowait(connection)
+
+    async def close(self):
+        while self._idle is not None and not self._idle.empty():
+            await self._idle.get_nowait().close()
+        self._opened = 0
+
+
+# asyncpg pool for one PostgreSQL database, created on first use inside the running event loop
+class PostgresPool:
+    dialect = postgresql.dialect(paramstyle="numeric")
+
+    def __init__(self, url, size):
+        url = make_url(url)
+        url.drivername = "postgresql"
+        self.dsn = str(url)
+        self.size = size
+        self._pool = None
+
+    async def fetch(self, sql, params):
+        import asyncpg
+
+        if self._pool is None:
+            self._pool = asyncio.ensure_future(
+                asyncpg.create_pool(self.dsn, min_size=1, max_size=self.size)
+            )
+        pool = await self._pool
+        async with pool.acquire() as connection:
+            return await connection.fetch(_NUMERIC_PARAM.sub(r"$\1", sql), *params)
+
+    async def close(self):
+        if self._pool is not None:
+            await (await self._pool).close()
+            self._pool = None
+
+
+# Read only access to the app's databases from async code, used by the async views (see asgi.py)
+# Queries are built with the same models and query helpers as the sync views and compiled for the async driver
+# The aiosqlite or asyncpg driver is only imported by the first query
+class AsyncDatabase:
+    def __init__(self, app):
+        self.app = app
+        self._pools = {}
+
+    def _pool(self, bind):
+        pool = self._pools.get(bind)
+        if pool is not None:
+            return pool
+        config = self.app.config
+        uri = (
+            config["SQLALCHEMY_BINDS"][bind]
+            if bind
+            else config["SQLALCHEMY_DATABASE_URI"]
+        )
+        url = make_url(uri)
+        size = max(config["DATABASE_POOL_SIZE"] + config["DATABASE_MAX_OVERFLOW"], 1)
+        backend = url.get_backend_name()
+        if backend == "sqlite":
+            path = sqlite_path(self.app, url)
+            if path is None:
+                raise RuntimeError("The async views can't use an in memory database")
+            pool = SQLitePool(path, config, size)
+        elif backend == "postgresql":
+            pool = PostgresPool(uri, size)
+        else:
+            raise RuntimeError(f"No async driver for {backend} databases")
+        self._pools[bind] = pool
+        return pool
+
+    # Run a query on the primary, or on a replica bind, returning its rows as tuples
+    async def fetch_all(self, statement, bind=None):
+        pool = self._pool(bind)
+        sql, params, processors = compile_statement(statement, pool.dialect)
+        rows = await pool.fetch(sql, params)
+        return [
+            tuple(
+                process(value) if process else value
+                for process, value in zip(processors, row)
+            )
+            for row in rows
+        ]
+
+    async def close(self):
+        for pool in self._pools.values():
+            await pool.close()
+        self._pools.clear()
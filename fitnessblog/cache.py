@@ -0,0 +1,177 @@
+import threading
+import time
+from collections import OrderedDict, Counter
+from functools import wraps
+from flask import request, session
+from flask_login import current_user
+
+
+# In-process least recently used cache, the default backend
+# Counters (the version numbers, see FragmentCache.bump) are kept apart and never evicted: a counter dropped
+# from the cache would start again from 0 and bring back entries cached under versions already used
+class LRUBackend:
+    def __init__(self, max_entries=2000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._counters:
+                return self._counters[key]
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def get_many(self, keys):
+        return [self.get(key) for key in keys]
+
+    def set(self, key, value, timeout=None):
+        expires = time.monotonic() + timeout if timeout else None
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            # Drop the least recently used entries once the cache is full
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def incr(self, key):
+        with self._lock:
+            value = self._counters.get(key, 0) + 1
+            self._counters[key] = value
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._counters.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Shared backend so every worker process sees the same entries and invalidations
+# Requires the redis package, which is only imported when this backend is configured
+class RedisBackend:
+    def __init__(self, url, prefix="fitnessblog:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return value.decode("utf-8") if value is not None else None
+
+    def get_many(self, keys):
+        values = self.client.mget([self.prefix + key for key in keys])
+        return [
+            value.decode("utf-8") if value is not None else None for value in values
+        ]
+
+    def set(self, key, value, timeout=None):
+        self.client.set(self.prefix + key, value, ex=timeout)
+
+    def incr(self, key):
+        return self.client.incr(self.prefix + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + "*"):
+            self.client.delete(key)
+
+    def __len__(self):
+        return sum(1 for _ in self.client.scan_iter(self.prefix + "*"))
+
+
+# Cache for rendered HTML fragments and whole pages
+# Entries are keyed by version numbers (see versions/bump) so invalidating never has to find old keys
+class FragmentCache:
+    def __init__(self, app=None):
+        self.backend = None
+        self.hits = Counter()
+        self.misses = Counter()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("CACHE_BACKEND", "lru")
+        app.config.setdefault("CACHE_MAX_ENTRIES", 2000)
+        app.config.setdefault("CACHE_REDIS_URL", None)
+        app.config.setdefault("CACHE_PAGE_SECONDS", 60)
+        if app.config["CACHE_BACKEND"] == "redis":
+            self.backend = RedisBackend(app.config["CACHE_REDIS_URL"])
+        else:
+            self.backend = LRUBackend(app.config["CACHE_MAX_ENTRIES"])
+        self.page_timeout = app.config["CACHE_PAGE_SECONDS"]
+        app.extensions["fragment_cache"] = self
+
+    # Get a cached value, counting the hit or miss under the given kind
+    def get(self, key, kind="fragment"):
+        value = self.backend.get(key)
+        if value is None:
+            self.misses[kind] += 1
+        else:
+            self.hits[kind] += 1
+        return value
+
+    def set(self, key, value, timeout=None):
+        self.backend.set(key, value, timeout)
+
+    # Current version numbers for a list of names, e.g. "post:1" or "user:3"
+    def versions(self, *names):
+        return [int(v or 0) for v in self.backend.get_many(["v:" + n for n in names])]
+
+    # Bump a version so every entry keyed on the old version is no longer used
+    def bump(self, *names):
+        for name in names:
+            self.backend.incr("v:" + name)
+
+    def clear(self):
+        self.backend.clear()
+        self.hits.clear()
+        self.misses.clear()
+
+    def stats(self):
+        kinds = set(self.hits) | set(self.misses)
+        return {
+            "entries": len(self.backend),
+            "hits": dict(self.hits),
+            "misses": dict(self.misses),
+            "hit_rate": {
+                kind: round(self.hits[kind] / (self.hits[kind] + self.misses[kind]), 4)
+                for kind in kinds
+            },
+        }
+
+    # Key the current page is cached under, None for pages that are always rendered
+    # Pages are keyed on the "feeds" version so any post or author change invalidates them
+    def page_key(self):
+        # Logged in users and pages with flashed messages are always rendered
+        if current_user.is_authenticated or session.get("_flashes"):
+            return None
+        (version,) = self.versions("feeds")
+        return f"page:{version}:{request.full_path}"
+
+    # Decorator caching a whole rendered page for anonymous visitors
+    def cached_page(self, f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            key = self.page_key()
+            if key is None:
+                return f(*args, **kwargs)
+            page = self.get(key, kind="page")
+            if page is not None:
+                return page
+            page = f(*args, **kwargs)
+            if isinstance(page, str):
+                self.set(key, page, timeout=self.page_timeout)
+            return page
+
+        return decorated_function
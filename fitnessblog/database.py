@@ -0,0 +1,202 @@
+import os
+import random
+import sqlite3
+import time
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import event, exc, orm
+from sqlalchemy.pool import Pool, QueuePool
+
+
+# Turn DATABASE_URL style postgres:// URLs into the postgresql:// scheme SQLAlchemy expects
+def normalize_database_uri(uri):
+    if uri.startswith("postgres://"):
+        return "postgresql://" + uri[len("postgres://") :]
+    return uri
+
+
+# SQLite connections are opened here so every connection gets the same PRAGMAs
+# WAL lets readers carry on while a post is being written, busy_timeout makes writers wait for the lock instead of failing
+def sqlite_pragmas(config):
+    pragmas = [f"PRAGMA busy_timeout = {int(config['SQLITE_BUSY_TIMEOUT_MS'])}"]
+    if config["SQLITE_JOURNAL_MODE"]:
+        pragmas.append(f"PRAGMA journal_mode = {config['SQLITE_JOURNAL_MODE']}")
+    if config["SQLITE_SYNCHRONOUS"]:
+        pragmas.append(f"PRAGMA synchronous = {config['SQLITE_SYNCHRONOUS']}")
+    return pragmas
+
+
+def sqlite_connector(path, config):
+    pragmas = sqlite_pragmas(config)
+
+    def connect():
+        connection = sqlite3.connect(
+            path,
+            timeout=config["SQLITE_BUSY_TIMEOUT_MS"] / 1000,
+            check_same_thread=False,
+        )
+        for pragma in pragmas:
+            connection.execute(pragma)
+        return connection
+
+    return connect
+
+
+# File path of a SQLite URL, None for an in memory database
+# Relative paths are relative to the app package, the same as Flask-SQLAlchemy
+def sqlite_path(app, url):
+    if url.database in (None, "", ":memory:"):
+        return None
+    return os.path.join(app.root_path, url.database)
+
+
+# Engine options for one database URL, merged into SQLALCHEMY_ENGINE_OPTIONS for each engine (see Database)
+def engine_options(app, url):
+    config = app.config
+    options = {
+        "pool_pre_ping": config["DATABASE_POOL_PRE_PING"],
+        "pool_recycle": config["DATABASE_POOL_RECYCLE"],
+    }
+    if url.get_backend_name() != "sqlite":
+        options.update(
+            pool_size=config["DATABASE_POOL_SIZE"],
+            max_overflow=config["DATABASE_MAX_OVERFLOW"],
+            pool_timeout=config["DATABASE_POOL_TIMEOUT"],
+        )
+        return options
+
+    # In memory databases are left to Flask-SQLAlchemy, which keeps them on a single connection
+    path = sqlite_path(app, url)
+    if path is None:
+        return {}
+    options["creator"] = sqlite_connector(path, config)
+    # A pool size of 0 opens a new connection for every checkout, the SQLAlchemy default for SQLite files
+    if config["DATABASE_POOL_SIZE"]:
+        options.update(
+            poolclass=QueuePool,
+            pool_size=config["DATABASE_POOL_SIZE"],
+            max_overflow=config["DATABASE_MAX_OVERFLOW"],
+            pool_timeout=config["DATABASE_POOL_TIMEOUT"],
+        )
+    return options
+
+
+# Mark a view as read only so its queries can be sent to a replica
+# Put it directly under the route decorator
+def use_replica(f):
+    f.use_replica = True
+    return f
+
+
+# Pick the replica bind for this request, or None to use the primary
+# Users who wrote something in the last DATABASE_REPLICA_LAG_SECONDS read from the primary so they see their own changes
+def choose_replica():
+    replicas = current_app.config["DATABASE_REPLICA_BINDS"]
+    if not replicas:
+        return None
+    view = current_app.view_functions.get(request.endpoint)
+    if not getattr(view, "use_replica", False):
+        return None
+    wrote_at = session.get("_wrote_at")
+    if (
+        wrote_at
+        and time.time() - wrote_at < current_app.config["DATABASE_REPLICA_LAG_SECONDS"]
+    ):
+        return None
+    return random.choice(replicas)
+
+
+# Session sending the reads of read only views to a replica, everything else goes to the primary
+# Once the session has written anything, the rest of the request stays on the primary
+class RoutingSession(SignallingSession):
+    def __init__(self, db, **options):
+        self.db = db
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing or self.info.get("wrote") or not has_request_context():
+            return super().get_bind(mapper, clause)
+        if "db_replica" not in g:
+            g.db_replica = choose_replica()
+        if g.db_replica is None:
+            return super().get_bind(mapper, clause)
+        return self.db.get_engine(self.app, bind=g.db_replica)
+
+
+def _mark_written(db_session, flush_context):
+    db_session.info["wrote"] = True
+
+
+# Remember that this user just wrote, see choose_replica
+def _remember_write(db_session):
+    if db_session.info.get("wrote") and has_request_context():
+        g.db_wrote = True
+
+
+def _set_wrote_marker(response):
+    if g.get("db_wrote"):
+        session["_wrote_at"] = time.time()
+    return response
+
+
+# Pooled connections opened before a fork belong to the parent process
+# With a preloaded app each server worker throws away what it inherited and opens its own connections
+def _remember_pid(dbapi_connection, connection_record):
+    connection_record.info["pid"] = os.getpid()
+
+
+def _check_pid(dbapi_connection, connection_record, connection_proxy):
+    if connection_record.info["pid"] != os.getpid():
+        connection_record.connection = connection_proxy.connection = None
+        raise exc.DisconnectionError("Connection was opened by another process")
+
+
+# Flask-SQLAlchemy with per database engine options and read replica routing
+class Database(SQLAlchemy):
+    def init_app(self, app):
+        super().init_app(app)
+        app.after_request(_set_wrote_marker)
+        if not event.contains(Pool, "connect", _remember_pid):
+            event.listen(Pool, "connect", _remember_pid)
+            event.listen(Pool, "checkout", _check_pid)
+
+    def create_session(self, options):
+        factory = orm.sessionmaker(class_=RoutingSession, db=self, **options)
+        event.listen(factory, "after_flush", _mark_written)
+        event.listen(factory, "after_commit", _remember_write)
+        return factory
+
+    # Called for every engine, so the primary and each replica get options for their own URL
+    def apply_driver_hacks(self, app, sa_url, options):
+        for name, value in engine_options(app, sa_url).items():
+            options.setdefault(name, value)
+        return super().apply_driver_hacks(app, sa_url, options)
+
+
+# Apply the database settings before Flask-SQLAlchemy creates its engines
+# Replicas are added as SQLALCHEMY_BINDS named replica0, replica1 and so on
+def configure_database(app):
+    app.config.setdefault("DATABASE_POOL_SIZE", 5)
+    app.config.setdefault("DATABASE_MAX_OVERFLOW", 10)
+    app.config.setdefault("DATABASE_POOL_TIMEOUT", 10)
+    app.config.setdefault("DATABASE_POOL_RECYCLE", 1800)
+    app.config.setdefault("DATABASE_POOL_PRE_PING", True)
+    app.config.setdefault("DATABASE_REPLICA_URLS", [])
+    app.config.setdefault("DATABASE_REPLICA_LAG_SECONDS", 5)
+    app.config.setdefault("SQLITE_BUSY_TIMEOUT_MS", 5000)
+    app.config.setdefault("SQLITE_JOURNAL_MODE", "WAL")
+    app.config.setdefault("SQLITE_SYNCHRONOUS", "NORMAL")
+    if not app.config.get("SQLALCHEMY_DATABASE_URI"):
+        raise RuntimeError(
+            "No database configured, set DATABASE_URL or SQLALCHEMY_DATABASE_URI in config_secret.py"
+        )
+    app.config["SQLALCHEMY_DATABASE_URI"] = normalize_database_uri(
+        app.config["SQLALCHEMY_DATABASE_URI"]
+    )
+    binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+    replicas = []
+    for i, url in enumerate(app.config["DATABASE_REPLICA_URLS"]):
+        binds[f"replica{i}"] = normalize_database_uri(url)
+        replicas.append(f"replica{i}")
+    app.config["SQLALCHEMY_BINDS"] = binds or None
+    app.config["DATABASE_REPLICA_BINDS"] = replicas
@@ -14,6 +14,18 @@ def error_403(error):
     return render_template("errors/403.html"), 403
 
 
+# Handle 413 errors
+@errors.app_errorhandler(413)
+def error_413(error):
+    return render_template("errors/413.html"), 413
+
+
+# Handle 429 errors
+@errors.app_errorhandler(429)
+def error_429(error):
+    return render_template("errors/429.html"), 429
+
+
 # Handle 500 errors
 @errors.app_errorhandler(500)
 def error_500(error):
@@ -0,0 +1,321 @@
+import json
+import logging
+import secrets
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# How long a browser waits before reconnecting a closed event stream, in milliseconds
+RETRY_MS = 2000
+
+# Event streams must reach the browser as they are written, not cached or buffered by a proxy
+EVENT_STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+# One published event, encoded once as a server-sent event and written as is to every subscriber
+# id is "<stream>-<sequence>", the stream changes when the sequence starts over (a restarted memory hub)
+class Event:
+    __slots__ = ("id", "sequence", "message")
+
+    def __init__(self, stream, sequence, name, data):
+        self.id = f"{stream}-{sequence}"
+        self.sequence = sequence
+        self.message = f"id: {self.id}\nevent: {name}\ndata: {data}\n\n".encode("utf-8")
+
+
+# A subscriber's queue of events not yet written to its connection
+# Holds at most max_queued events, a subscriber that falls further behind is evicted and its stream ends.
+# The browser reconnects and resumes from the hub's buffer with Last-Event-ID
+class Subscription:
+    def __init__(self, max_queued):
+        self.max_queued = max_queued
+        self.evicted = False
+        # Set when the events since Last-Event-ID are no longer buffered, the page has to reload instead
+        self.reset = False
+        self._events = deque()
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+
+    # Called by the hub for each event, returns False once the subscriber has fallen too far behind
+    def deliver(self, event):
+        with self._lock:
+            if self.evicted:
+                return False
+            if len(self._events) >= self.max_queued:
+                self.evicted = True
+            else:
+                self._events.append(event)
+        self._wake()
+        return not self.evicted
+
+    def _wake(self):
+        self._ready.set()
+
+    def _take(self):
+        with self._lock:
+            events = list(self._events)
+            self._events.clear()
+        return events
+
+    # Wait up to timeout seconds for events, returns the queued events (none on timeout)
+    def get(self, timeout):
+        self._ready.wait(timeout)
+        self._ready.clear()
+        return self._take()
+
+
+# Subscription for an async view, waits on the event loop instead of blocking a thread
+# Events are delivered from other threads (the publishing request or the Redis listener)
+class AsyncSubscription(Subscription):
+    def __init__(self, max_queued, loop):
+        import asyncio
+
+        super().__init__(max_queued)
+        self._loop = loop
+        self._async_ready = asyncio.Event()
+
+    def _wake(self):
+        try:
+            self._loop.call_soon_threadsafe(self._async_ready.set)
+        except RuntimeError:
+            # The loop has closed, the subscription is about to be dropped
+            pass
+
+    async def get(self, timeout):
+        import asyncio
+
+        try:
+            await asyncio.wait_for(self._async_ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._async_ready.clear()
+        return self._take()
+
+
+# Events stay in the process that published them, for a single worker
+class MemoryBackend:
+    def __init__(self, hub):
+        self.hub = hub
+        # A new stream id each time the process starts, so ids from before a restart are never resumed
+        self.stream = secrets.token_hex(4)
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def publish(self, name, data):
+        with self._lock:
+            self._sequence += 1
+            self.hub.dispatch(Event(self.stream, self._sequence, name, data))
+
+
+# Lua script numbering and publishing an event in one step, so every process receives events in id order
+# KEYS[1] sequence counter, KEYS[2] channel, ARGV[1] "<name> <data>"
+_REDIS_PUBLISH = """
+local sequence = redis.call('INCR', KEYS[1])
+redis.call('PUBLISH', KEYS[2], sequence .. ' ' .. ARGV[1])
+return sequence
+"""
+
+
+# Events published through Redis and delivered to the subscribers of every worker process and server
+# Each process listens on the channel from a background thread, started by the first publish or subscribe
+# Requires the redis package, which is only imported when this backend is configured
+class RedisBackend:
+    stream = "r"
+
+    def __init__(self, hub, url, prefix="fitnessblog:events:"):
+        import redis
+
+        self.hub = hub
+        self.client = redis.Redis.from_url(url)
+        self.channel = prefix + "channel"
+        self.sequence_key = prefix + "sequence"
+        self._publish = self.client.register_script(_REDIS_PUBLISH)
+        self._listener = threading.Thread(
+            target=self._listen, name="events-listener", daemon=True
+        )
+        self._listener.start()
+
+    def publish(self, name, data):
+        self._publish(keys=[self.sequence_key, self.channel], args=[f"{name} {data}"])
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    sequence, name, data = message["data"].decode("utf-8").split(" ", 2)
+                    self.hub.dispatch(Event(self.stream, int(sequence), name, data))
+            except Exception:
+                logger.exception("Lost the event channel, reconnecting")
+                # Events published while disconnected are missed, so older ids can't be resumed any more
+                self.hub.clear_buffer()
+                time.sleep(1)
+
+
+# Publish/subscribe hub pushing site events (new, updated and deleted posts) to open event streams
+# Each event is encoded once and copied into the queue of every subscriber, no subscriber touches the database.
+# The last EVENTS_BUFFER_SIZE events are kept so a reconnecting browser gets what it missed (Last-Event-ID)
+# EVENTS_BACKEND "memory" keeps events in one process, "redis" shares them between processes and servers
+class EventHub:
+    def __init__(self, app=None):
+        self.backend = None
+        self.published = 0
+        self.evicted = 0
+        self._subscribers = set()
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("EVENTS_STREAM_ENABLED", None)
+        app.config.setdefault("EVENTS_BACKEND", "memory")
+        app.config.setdefault("EVENTS_REDIS_URL", None)
+        app.config.setdefault("EVENTS_BUFFER_SIZE", 1000)
+        app.config.setdefault("EVENTS_QUEUE_SIZE", 100)
+        app.config.setdefault("EVENTS_KEEPALIVE_SECONDS", 15)
+        if app.config["EVENTS_BACKEND"] not in ("memory", "redis"):
+            raise ValueError(f"Unknown EVENTS_BACKEND {app.config['EVENTS_BACKEND']!r}")
+        self.config = app.config
+        self._buffer = deque(maxlen=app.config["EVENTS_BUFFER_SIZE"])
+        app.extensions["events"] = self
+
+    # The backend is created on first use, so creating the app starts no threads or connections
+    def _backend(self):
+        if self.backend is None:
+            with self._lock:
+                if self.backend is None:
+                    if self.config["EVENTS_BACKEND"] == "redis":
+                        url = self.config["EVENTS_REDIS_URL"] or self.config.get(
+                            "CACHE_REDIS_URL"
+                        )
+                        self.backend = RedisBackend(self, url)
+                    else:
+                        self.backend = MemoryBackend(self)
+        return self.backend
+
+    # Whether this app serves event streams. The ASGI app turns them on unless EVENTS_STREAM_ENABLED is False
+    @property
+    def stream_enabled(self):
+        return bool(self.config["EVENTS_STREAM_ENABLED"])
+
+    # Whether published events can reach anyone, through this app's streams or other servers sharing Redis
+    @property
+    def publishing(self):
+        return self.stream_enabled or self.config["EVENTS_BACKEND"] == "redis"
+
+    # Send an event to every subscriber, data is JSON encoded here once for all of them
+    # Publishing never fails the request that triggered it
+    def publish(self, name, data):
+        if not self.publishing:
+            return
+        try:
+            self._backend().publish(name, json.dumps(data, separators=(",", ":")))
+        except Exception:
+            logger.exception("Failed to publish %s event", name)
+
+    # Called by the backend with each event, in order
+    def dispatch(self, event):
+        with self._lock:
+            self._buffer.append(event)
+            self.published += 1
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            if not subscription.deliver(event):
+                self.unsubscribe(subscription)
+                self.evicted += 1
+
+    # Start receiving events, starting after last_event_id when a browser reconnects
+    # Pass the running event loop to get an AsyncSubscription
+    def subscribe(self, last_event_id=None, loop=None):
+        backend = self._backend()
+        max_queued = self.config["EVENTS_QUEUE_SIZE"]
+        if loop is None:
+            subscription = Subscription(max_queued)
+        else:
+            subscription = AsyncSubscription(max_queued, loop)
+        with self._lock:
+            missed = self._missed(backend.stream, last_event_id)
+            if missed is None:
+                subscription.reset = True
+            else:
+                subscription._events.extend(missed)
+            self._subscribers.add(subscription)
+        return subscription
+
+    # Buffered events after last_event_id, or None if some of them have already left the buffer
+    def _missed(self, stream, last_event_id):
+        if not last_event_id:
+            return []
+        event_stream, _, sequence = last_event_id.rpartition("-")
+        if event_stream != stream or not sequence.isdigit():
+            return None
+        sequence = int(sequence)
+        newest = self._buffer[-1].sequence if self._buffer else 0
+        oldest = self._buffer[0].sequence if self._buffer else newest + 1
+        if sequence > newest or sequence < oldest - 1:
+            return None
+        return [event for event in self._buffer if event.sequence > sequence]
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def clear_buffer(self):
+        with self._lock:
+            self._buffer.clear()
+
+    # Id of the newest event this process has seen. A page passes it to its stream, so posts published between
+    # rendering the page and opening the stream aren't missed
+    @property
+    def last_event_id(self):
+        buffer = self._buffer
+        return buffer[-1].id if buffer else None
+
+    @property
+    def subscribers(self):
+        return len(self._subscribers)
+
+
+def _stream_start(subscription):
+    yield f"retry: {RETRY_MS}\n\n".encode("utf-8")
+    if subscription.reset:
+        yield b"event: reset\ndata: {}\n\n"
+
+
+# Body of a text/event-stream response, subscribing when the response starts
+# Ends when the subscriber is evicted, or when writing fails because the browser went away
+def event_stream(hub, last_event_id, keepalive):
+    subscription = hub.subscribe(last_event_id)
+    try:
+        yield from _stream_start(subscription)
+        while not subscription.evicted:
+            events = subscription.get(keepalive)
+            if not events:
+                # Comments keep proxies from closing an idle connection, and show when the browser has gone
+                yield b": keepalive\n\n"
+            for event in events:
+                yield event.message
+    finally:
+        hub.unsubscribe(subscription)
+
+
+# Async version of event_stream, for the ASGI app
+async def async_event_stream(hub, last_event_id, keepalive):
+    import asyncio
+
+    subscription = hub.subscribe(last_event_id, loop=asyncio.get_running_loop())
+    try:
+        for chunk in _stream_start(subscription):
+            yield chunk
+        while not subscription.evicted:
+            events = await subscription.get(keepalive)
+            if not events:
+                yield b": keepalive\n\n"
+            for event in events:
+                yield event.message
+    finally:
+        hub.unsubscribe(subscription)
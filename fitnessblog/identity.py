@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import Counter, OrderedDict
+from flask import session, has_request_context
+from flask_login import UserMixin
+
+
+# Lightweight stand in for the logged in User row, holding only the fields templates and routes read
+# Routes that change the user load the real row with User.query.get(current_user.id)
+# The email is left out: the session cookie is signed, not encrypted, so anyone holding it can read these
+class SessionUser(UserMixin):
+    FIELDS = ("id", "username", "image_file", "profile_type")
+
+    def __init__(self, **fields):
+        for field in self.FIELDS:
+            setattr(self, field, fields[field])
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(**{field: getattr(user, field) for field in cls.FIELDS})
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def __repr__(self):
+        return f"SessionUser('{self.username}', '{self.image_file}')"
+
+
+# Identity layer in front of the Flask-Login user loader
+# The user's fields are kept in the signed session cookie and in a short lived in-process cache,
+# so most requests never query the user table
+# The in-process cache holds the IDENTITY_CACHE_MAX_ENTRIES most recently used users, like LRUBackend
+class IdentityCache:
+    def __init__(self, app=None):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = Counter()
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("IDENTITY_CACHE_SECONDS", 60)
+        app.config.setdefault("IDENTITY_SESSION_SECONDS", 300)
+        app.config.setdefault("IDENTITY_CACHE_MAX_ENTRIES", 10000)
+        self.cache_seconds = app.config["IDENTITY_CACHE_SECONDS"]
+        self.max_entries = app.config["IDENTITY_CACHE_MAX_ENTRIES"]
+        self.session_seconds = app.config["IDENTITY_SESSION_SECONDS"]
+        app.extensions["identity"] = self
+
+    # Load the identity for a user id, falling back to load_from_db(user_id) only when nothing fresh is cached
+    def load(self, user_id, load_from_db):
+        now = time.time()
+        payload = session.get("_identity")
+        if payload and payload["id"] == user_id and payload["expires"] > now:
+            self.hits["session"] += 1
+            return SessionUser(**payload)
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry:
+                self._entries.move_to_end(user_id)
+        if entry and entry[0] > now:
+            self.hits["cache"] += 1
+            identity = entry[1]
+        else:
+            self.misses += 1
+            user = load_from_db(user_id)
+            if user is None:
+                return None
+            identity = SessionUser.from_user(user)
+            self._cache(identity)
+        self._store_in_session(identity)
+        return identity
+
+    # Save the user's current fields after logging in or changing the account
+    def remember(self, user):
+        identity = SessionUser.from_user(user)
+        self._cache(identity)
+        if has_request_context():
+            self._store_in_session(identity)
+        return identity
+
+    # Drop everything cached for a user so the next request reloads them
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+        if has_request_context():
+            payload = session.get("_identity")
+            if payload and payload["id"] == user_id:
+                session.pop("_identity")
+
+    # Drop the least recently used entries once the cache is full
+    def _cache(self, identity):
+        with self._lock:
+            self._entries[identity.id] = (time.time() + self.cache_seconds, identity)
+            self._entries.move_to_end(identity.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def forget_session(self):
+        session.pop("_identity", None)
+
+    def _store_in_session(self, identity):
+        session["_identity"] = dict(
+            identity.to_dict(), expires=time.time() + self.session_seconds
+        )
+
+    def stats(self):
+        hits = sum(self.hits.values())
+        total = hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": dict(self.hits),
+            "misses": self.misses,
+            "hit_rate": round(hits / total, 4) if total else None,
+        }
@@ -0,0 +1,202 @@
+import json
+import logging
+import time
+import traceback
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+
+logger = logging.getLogger(__name__)
+
+jobs_cli = AppGroup("jobs", help="Run and manage background jobs.")
+
+
+# Persistent background job queue stored in the job table
+# Handlers are registered with @jobs.task("name") and run by "flask jobs work"
+class JobQueue:
+    def __init__(self, db, app=None):
+        self.db = db
+        self.handlers = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # Run jobs inside the request that queued them, handy for development without a worker
+        app.config.setdefault("JOBS_EAGER", False)
+        app.config.setdefault("JOBS_MAX_ATTEMPTS", 5)
+        app.config.setdefault("JOBS_BACKOFF_SECONDS", 10)
+        app.config.setdefault("JOBS_POLL_SECONDS", 1)
+        app.config.setdefault("JOBS_VISIBILITY_TIMEOUT_SECONDS", 300)
+        app.extensions["jobs"] = self
+        app.cli.add_command(jobs_cli)
+
+    # Decorator registering a function as the handler for a job name
+    def task(self, name):
+        def decorator(f):
+            self.handlers[name] = f
+            return f
+
+        return decorator
+
+    # Save a job to the queue, the handler is called later with the keyword arguments given here
+    # This commits the session, so a worker can claim the job straight away. Call it after committing your own
+    # changes, anything still pending in the session is committed along with the job
+    def enqueue(self, name, **payload):
+        from fitnessblog.models import Job
+
+        if name not in self.handlers:
+            raise KeyError(f"No job handler registered for '{name}'")
+        job = Job(name=name, payload=json.dumps(payload))
+        self.db.session.add(job)
+        self.db.session.commit()
+        if current_app.config["JOBS_EAGER"]:
+            self.run(job)
+        return job
+
+    # Claim the next due job, the conditional update stops two workers taking the same job
+    # A claimed job's run_at is pushed JOBS_VISIBILITY_TIMEOUT_SECONDS ahead. A running job still there by then
+    # lost its worker (crashed or killed mid-handler), so it is claimed again and that counts as another attempt
+    def claim_next(self):
+        from fitnessblog.models import Job
+
+        max_attempts = current_app.config["JOBS_MAX_ATTEMPTS"]
+        timeout = current_app.config["JOBS_VISIBILITY_TIMEOUT_SECONDS"]
+        while True:
+            now = datetime.utcnow()
+            job = (
+                Job.query.filter(
+                    Job.status.in_(("queued", "running")), Job.run_at <= now
+                )
+                .order_by(Job.run_at)
+                .first()
+            )
+            if job is None:
+                return None
+            claim = Job.query.filter_by(id=job.id, status=job.status, run_at=job.run_at)
+            if job.status == "running" and job.attempts >= max_attempts:
+                claim.update(
+                    {
+                        "status": "dead",
+                        "last_error": "The worker running the job stopped before it finished",
+                    },
+                    synchronize_session=False,
+                )
+                self.db.session.commit()
+                logger.error("Job %s (%s) failed permanently", job.id, job.name)
+                continue
+            claimed = claim.update(
+                {
+                    "status": "running",
+                    "attempts": Job.attempts + 1,
+                    "run_at": now + timedelta(seconds=timeout),
+                },
+                synchronize_session=False,
+            )
+            self.db.session.commit()
+            if claimed:
+                self.db.session.refresh(job)
+                return job
+
+    # Run a claimed job, retrying with exponential backoff and dead-lettering after too many failures
+    def run(self, job):
+        try:
+            self.handlers[job.name](**json.loads(job.payload))
+        except Exception:
+            self.db.session.rollback()
+            job.attempts = max(job.attempts, 1)
+            job.last_error = traceback.format_exc()
+            if job.attempts >= current_app.config["JOBS_MAX_ATTEMPTS"]:
+                job.status = "dead"
+                logger.error("Job %s (%s) failed permanently", job.id, job.name)
+            else:
+                delay = current_app.config["JOBS_BACKOFF_SECONDS"] * 2 ** (
+                    job.attempts - 1
+                )
+                job.status = "queued"
+                job.run_at = datetime.utcnow() + timedelta(seconds=delay)
+                logger.warning(
+                    "Job %s (%s) failed, retrying in %ss", job.id, job.name, delay
+                )
+            self.db.session.commit()
+            return False
+        # Finished jobs are removed so the table only holds pending and dead jobs
+        self.db.session.delete(job)
+        self.db.session.commit()
+        return True
+
+    # Worker loop, with burst set it stops once no jobs are due
+    def work(self, burst=False):
+        poll_seconds = current_app.config["JOBS_POLL_SECONDS"]
+        while True:
+            job = self.claim_next()
+            if job is not None:
+                self.run(job)
+            elif burst:
+                return
+            else:
+                time.sleep(poll_seconds)
+
+
+def _worker_process(app, burst):
+    # Each forked worker needs its own database connections
+    with app.app_context():
+        jobs = app.extensions["jobs"]
+        jobs.db.engine.dispose()
+        jobs.work(burst=burst)
+
+
+@jobs_cli.command("work")
+@click.option("--processes", default=1, help="Number of worker processes to run.")
+@click.option("--burst", is_flag=True, help="Exit once the queue is empty.")
+@with_appcontext
+def work_command(processes, burst):
+    """Run background job workers."""
+    app = current_app._get_current_object()
+    jobs = app.extensions["jobs"]
+    if processes <= 1:
+        jobs.work(burst=burst)
+        return
+    import multiprocessing
+
+    jobs.db.engine.dispose()
+    context = multiprocessing.get_context("fork")
+    workers = [
+        context.Process(target=_worker_process, args=(app, burst))
+        for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+@jobs_cli.command("status")
+@with_appcontext
+def status_command():
+    """Show the number of jobs in each state."""
+    from fitnessblog.models import Job
+
+    jobs = current_app.extensions["jobs"]
+    counts = (
+        jobs.db.session.query(Job.status, jobs.db.func.count(Job.id))
+        .group_by(Job.status)
+        .all()
+    )
+    for status, count in counts:
+        click.echo(f"{status}: {count}")
+
+
+@jobs_cli.command("requeue-dead")
+@with_appcontext
+def requeue_dead_command():
+    """Put dead-lettered jobs back on the queue."""
+    from fitnessblog.models import Job
+
+    jobs = current_app.extensions["jobs"]
+    count = Job.query.filter_by(status="dead").update(
+        {"status": "queued", "attempts": 0, "run_at": datetime.utcnow()},
+        synchronize_session=False,
+    )
+    jobs.db.session.commit()
+    click.echo(f"Requeued {count} jobs")
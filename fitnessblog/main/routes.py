@@ -1,18 +1,20 @@
-from flask import render_template, request, Blueprint
-from fitnessblog.models import Post
+from flask import render_template, jsonify, abort, current_app, Blueprint
+from fitnessblog import cache, identity
+from fitnessblog.database import use_replica
+from fitnessblog.posts.utils import home_feed, paginate_feed
 
 main = Blueprint("main", __name__)
 
 # Handle multiple routes using the same function
 @main.route("/")
 @main.route("/home")
+@use_replica
+@cache.cached_page
 # url_for refers to the function name below (home)
 def home():
-    # Get page argument (start at default page 1)
-    page = request.args.get("page", 1, type=int)
-    # Fetch all posts from db sorting by date desc, using pagination
-    # Page is taken from arg above, per_page is number of results per page
-    posts = Post.query.order_by(Post.date_posted.desc()).paginate(page=page, per_page=5)
+    # Fetch all posts (with their authors) from db sorting by date desc, using pagination
+    # The page number or cursor is taken from the request args
+    posts = paginate_feed(home_feed(), "home")
     return render_template("home.html", posts=posts)
 
 
@@ -25,3 +27,11 @@ def about():
 @main.route("/announcements")
 def announcements():
     return render_template("announcements.html", title="Announcements")
+
+
+# Fragment and identity cache hit/miss counters, used to size the caches
+@main.route("/cache/stats")
+def cache_stats():
+    if not current_app.config["CACHE_STATS_ENABLED"]:
+        abort(404)
+    return jsonify(dict(cache.stats(), identity=identity.stats()))
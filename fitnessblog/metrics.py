@@ -0,0 +1,338 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from flask import (
+    current_app,
+    g,
+    has_app_context,
+    has_request_context,
+    request,
+    before_render_template,
+    template_rendered,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Histogram buckets in seconds, the same defaults the Prometheus client libraries use
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Buckets for the number of SQL statements run by one request
+STATEMENT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+
+# A labelled Prometheus style histogram, one set of buckets per combination of label values
+class Histogram:
+    def __init__(self, name, help, labels, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    # Lines of the Prometheus text exposition format
+    def expose(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = [(k, [list(v[0]), v[1], v[2]]) for k, v in self._series.items()]
+        for label_values, (counts, total, count) in sorted(series):
+            labels = _format_labels(zip(self.labels, label_values))
+            for bound, bucket_count in zip(self.buckets, counts):
+                le = _format_labels([("le", repr(float(bound)))])
+                yield f"{self.name}_bucket{_join_labels(labels, le)} {bucket_count}"
+            inf = _format_labels([("le", "+Inf")])
+            yield f"{self.name}_bucket{_join_labels(labels, inf)} {count}"
+            yield f"{self.name}_sum{labels} {total}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(pairs):
+    pairs = list(pairs)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _join_labels(labels, extra):
+    if not labels:
+        return extra
+    return labels[:-1] + "," + extra[1:]
+
+
+# Time a block of work, e.g. with timed("password_hash"): ...
+# Recorded under operation_duration_seconds when instrumentation is enabled, otherwise a no-op
+@contextmanager
+def timed(operation):
+    metrics = current_app.extensions.get("metrics") if has_app_context() else None
+    if metrics is None or not metrics.enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.operation_seconds.observe(time.perf_counter() - start, operation)
+
+
+# Samples the stacks of threads serving requests so slow requests can be dumped as flamegraph input
+# Only requests running while profiling is enabled are sampled, the sampler thread starts on first use
+class SamplingProfiler:
+    def __init__(self, interval):
+        self.interval = interval
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, thread_id):
+        stacks = Counter()
+        with self._lock:
+            self._active[thread_id] = stacks
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="request-profiler", daemon=True
+                )
+                self._thread.start()
+        return stacks
+
+    def stop(self, thread_id):
+        with self._lock:
+            return self._active.pop(thread_id, None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                active = list(self._active.items())
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for thread_id, stacks in active:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    stacks[_collapse(frame)] += 1
+
+
+# Stack as "outermost;...;innermost" frames, the collapsed format flamegraph.pl and speedscope read
+def _collapse(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(
+            f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+        )
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+# Request instrumentation: per endpoint latency, SQL statements and template render times, served at /metrics
+# Each worker process keeps its own numbers, so scrape every worker
+class Metrics:
+    def __init__(self, app=None):
+        self.enabled = False
+        self.profiler = None
+        self.request_seconds = Histogram(
+            "http_request_duration_seconds",
+            "Time spent handling requests.",
+            ("endpoint", "method", "status"),
+        )
+        self.request_statements = Histogram(
+            "http_request_sql_statements",
+            "SQL statements run by each request.",
+            ("endpoint",),
+            buckets=STATEMENT_BUCKETS,
+        )
+        self.sql_seconds = Histogram(
+            "sql_statement_duration_seconds",
+            "Time spent running SQL statements.",
+            ("endpoint",),
+        )
+        self.template_seconds = Histogram(
+            "template_render_duration_seconds",
+            "Time spent rendering templates, including the templates they include.",
+            ("template",),
+        )
+        self.operation_seconds = Histogram(
+            "operation_duration_seconds",
+            "Time spent in slow operations such as password hashing, image resizing and sending mail.",
+            ("operation",),
+        )
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("METRICS_ENABLED", False)
+        app.config.setdefault("PROFILE_SLOW_REQUESTS", False)
+        app.config.setdefault("PROFILE_THRESHOLD_SECONDS", 0.5)
+        app.config.setdefault("PROFILE_SAMPLE_SECONDS", 0.005)
+        app.extensions["metrics"] = self
+        self.enabled = app.config["METRICS_ENABLED"]
+        if not self.enabled:
+            return
+        if app.config["PROFILE_SLOW_REQUESTS"]:
+            self.profiler = SamplingProfiler(app.config["PROFILE_SAMPLE_SECONDS"])
+            self.profile_threshold = app.config["PROFILE_THRESHOLD_SECONDS"]
+            self.profile_dir = os.path.join(app.instance_path, "profiles")
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        # Listening on the Engine class covers every engine, including ones created after this
+        if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+            event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        before_render_template.connect(_before_render_template, app)
+        template_rendered.connect(_template_rendered, app)
+        app.add_url_rule("/metrics", "metrics", self.metrics_view)
+
+    def _before_request(self):
+        g.metrics_start = time.perf_counter()
+        g.metrics_statements = 0
+        g.metrics_templates = []
+        if self.profiler is not None:
+            g.metrics_stacks = self.profiler.start(threading.get_ident())
+
+    def _after_request(self, response):
+        g.metrics_status = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        start = g.pop("metrics_start", None)
+        if start is None:
+            return
+        duration = time.perf_counter() - start
+        endpoint = request.endpoint or "none"
+        status = g.pop("metrics_status", 500)
+        self.request_seconds.observe(duration, endpoint, request.method, str(status))
+        self.request_statements.observe(g.pop("metrics_statements", 0), endpoint)
+        if self.profiler is not None:
+            stacks = self.profiler.stop(threading.get_ident())
+            if stacks and duration >= self.profile_threshold:
+                self._dump_profile(endpoint, duration, stacks)
+
+    # Write the sampled stacks of a slow request, one "stack count" line each
+    def _dump_profile(self, endpoint, duration, stacks):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{int(duration * 1000)}ms.folded"
+        with open(os.path.join(self.profile_dir, name), "w") as profile:
+            for stack, count in stacks.most_common():
+                profile.write(f"{stack} {count}\n")
+
+    def clear(self):
+        for histogram in self.histograms():
+            histogram.clear()
+
+    def histograms(self):
+        return (
+            self.request_seconds,
+            self.request_statements,
+            self.sql_seconds,
+            self.template_seconds,
+            self.operation_seconds,
+        )
+
+    # Prometheus text format, including the fragment cache, identity cache, rate limit, event stream and username
+    # check counters
+    def expose(self):
+        lines = []
+        for histogram in self.histograms():
+            lines.extend(histogram.expose())
+        cache = current_app.extensions.get("fragment_cache")
+        if cache is not None:
+            lines.append("# TYPE fragment_cache_requests_total counter")
+            for result, counts in (("hit", cache.hits), ("miss", cache.misses)):
+                for kind, count in sorted(counts.items()):
+                    labels = _format_labels([("kind", kind), ("result", result)])
+                    lines.append(f"fragment_cache_requests_total{labels} {count}")
+        identity = current_app.extensions.get("identity")
+        if identity is not None:
+            lines.append("# TYPE identity_cache_requests_total counter")
+            for source, count in sorted(identity.hits.items()):
+                labels = _format_labels([("result", source)])
+                lines.append(f"identity_cache_requests_total{labels} {count}")
+            labels = _format_labels([("result", "miss")])
+            lines.append(f"identity_cache_requests_total{labels} {identity.misses}")
+        limiter = current_app.extensions.get("ratelimit")
+        if limiter is not None:
+            lines.append("# TYPE ratelimit_rejected_requests_total counter")
+            for (endpoint, scope), count in sorted(limiter.rejected.items()):
+                labels = _format_labels([("endpoint", endpoint), ("scope", scope)])
+                lines.append(f"ratelimit_rejected_requests_total{labels} {count}")
+        events = current_app.extensions.get("events")
+        if events is not None:
+            lines.append("# TYPE event_stream_subscribers gauge")
+            lines.append(f"event_stream_subscribers {events.subscribers}")
+            lines.append("# TYPE events_published_total counter")
+            lines.append(f"events_published_total {events.published}")
+            lines.append("# TYPE event_stream_evictions_total counter")
+            lines.append(f"event_stream_evictions_total {events.evicted}")
+        usernames = current_app.extensions.get("usernames")
+        if usernames is not None:
+            lines.append("# TYPE username_checks_total counter")
+            for answered_by, count in sorted(usernames.checks.items()):
+                labels = _format_labels([("answered_by", answered_by)])
+                lines.append(f"username_checks_total{labels} {count}")
+        return "\n".join(lines) + "\n"
+
+    def metrics_view(self):
+        return current_app.response_class(
+            self.expose(), mimetype="text/plain; version=0.0.4"
+        )
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info["metrics_query_start"].pop()
+    record_statement(time.perf_counter() - start)
+
+
+# Count a SQL statement against the current request, also used for queries run without an Engine (see asyncdb)
+def record_statement(duration):
+    if not has_app_context():
+        return
+    metrics = current_app.extensions.get("metrics")
+    if metrics is None or not metrics.enabled:
+        return
+    endpoint = "none"
+    if has_request_context():
+        endpoint = request.endpoint or "none"
+        g.metrics_statements = g.get("metrics_statements", 0) + 1
+    metrics.sql_seconds.observe(duration, endpoint)
+
+
+def _before_render_template(app, template, context, **extra):
+    g.setdefault("metrics_templates", []).append(time.perf_counter())
+
+
+def _template_rendered(app, template, context, **extra):
+    templates = g.get("metrics_templates")
+    if templates:
+        duration = time.perf_counter() - templates.pop()
+        app.extensions["metrics"].template_seconds.observe(
+            duration, template.name or "string"
+        )
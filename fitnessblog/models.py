@@ -1,14 +1,14 @@
-from fitnessblog import db, login_manager
+from fitnessblog import db, login_manager, identity
 from datetime import datetime
 from flask_login import UserMixin
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
-from config_secret import SECRET
 from flask import current_app
 
 
+# Returns a cached SessionUser snapshot, only querying the db when the cached copy is missing or expired
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return identity.load(int(user_id), User.query.get)
 
 
 # DB models
@@ -19,18 +19,21 @@ class User(db.Model, UserMixin):
     profile_type = db.Column(db.String(20), nullable=False)
     image_file = db.Column(db.String(20), nullable=False, default="default.jpg")
     password = db.Column(db.String(60), nullable=False)
+    # Set once the user has too many followers to copy each new post into every follower's timeline
+    # Their posts are read at request time instead (see fitnessblog/timeline/utils.py)
+    large_audience = db.Column(db.Boolean, nullable=False, default=False)
     # This line sets the relationship to the post model (one to many), backref allows us to get author of post
     posts = db.relationship("Post", backref="author", lazy=True)
 
     # Create a reset token using secret
     def get_reset_token(self, expires_sec=1800):
-        s = Serializer(SECRET, expires_sec)
+        s = Serializer(current_app.config["SECRET_KEY"], expires_sec)
         return s.dumps({"user_id": self.id}).decode("utf-8")
 
     # Verify the reset token and return user if good
     @staticmethod
     def verify_reset_token(token):
-        s = Serializer(SECRET)
+        s = Serializer(current_app.config["SECRET_KEY"])
         try:
             user_id = s.loads(token)["user_id"]
         except:
@@ -43,10 +46,26 @@ class User(db.Model, UserMixin):
 
 
 class Post(db.Model):
+    # Indexes matching the feed access paths, every feed orders by date_posted desc
+    __table_args__ = (
+        db.Index("ix_post_date_posted", "date_posted"),
+        db.Index("ix_post_category_date_posted", "category", "date_posted"),
+        db.Index("ix_post_user_id_date_posted", "user_id", "date_posted"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
     date_posted = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Changes whenever the post is edited, used to build ETags for the API
+    date_updated = db.Column(
+        db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
+    # Markdown source as written, content_html and excerpt_html are rendered from it when the post is saved
+    # (see fitnessblog/posts/render.py). render_version is the renderer version that produced them
     content = db.Column(db.Text, nullable=False)
+    content_html = db.Column(db.Text, nullable=False)
+    excerpt_html = db.Column(db.Text, nullable=False)
+    render_version = db.Column(db.Integer, nullable=False, default=0)
     category = db.Column(db.Text, nullable=False)
     # Set foreign key relationship for user
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
@@ -54,3 +73,80 @@ class Post(db.Model):
     # Used to indicate how the post will look when printed
     def __repr__(self):
         return f"User('{self.title}', '{self.date_posted}')"
+
+
+# Who follows whom, e.g. students following instructors
+class Follow(db.Model):
+    # Fanning out a new post looks up its author's followers
+    __table_args__ = (db.Index("ix_follow_followed_id", "followed_id"),)
+
+    follower_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    followed_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    # Used to indicate how the follow will look when printed
+    def __repr__(self):
+        return f"Follow('{self.follower_id}', '{self.followed_id}')"
+
+
+# A post in a user's personal timeline, copied in by a background job when the post is written
+# date_posted is copied from the post so a page of the timeline is read from this table's index alone
+class TimelineEntry(db.Model):
+    __table_args__ = (
+        db.Index(
+            "ix_timeline_entry_user_id_date_posted", "user_id", "date_posted", "post_id"
+        ),
+        db.Index("ix_timeline_entry_post_id", "post_id"),
+    )
+
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey("post.id"), primary_key=True)
+    date_posted = db.Column(db.DateTime, nullable=False)
+
+    # Used to indicate how the entry will look when printed
+    def __repr__(self):
+        return f"TimelineEntry('{self.user_id}', '{self.post_id}')"
+
+
+# Post counts kept up to date as posts are saved (see fitnessblog/posts/stats.py)
+# scope is "all", "category" or "user", key is the category name or user id ("" for all)
+class PostCount(db.Model):
+    scope = db.Column(db.String(20), primary_key=True)
+    key = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    # Used to indicate how the count will look when printed
+    def __repr__(self):
+        return f"PostCount('{self.scope}', '{self.key}', '{self.count}')"
+
+
+# Posts created per category in each hour, summed to get rolling 24 hour counts
+class PostHourlyCount(db.Model):
+    hour = db.Column(db.DateTime, primary_key=True)
+    category = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    # Used to indicate how the count will look when printed
+    def __repr__(self):
+        return f"PostHourlyCount('{self.hour}', '{self.category}', '{self.count}')"
+
+
+# Background job waiting to be run by a worker (see fitnessblog/jobs.py)
+class Job(db.Model):
+    # Workers look for queued jobs that are due to run
+    __table_args__ = (db.Index("ix_job_status_run_at", "status", "run_at"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False)
+    # Job arguments stored as JSON
+    payload = db.Column(db.Text, nullable=False)
+    # queued, running or dead (failed too many times)
+    status = db.Column(db.String(20), nullable=False, default="queued")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+
+    # Used to indicate how the job will look when printed
+    def __repr__(self):
+        return f"Job('{self.name}', '{self.status}', '{self.attempts}')"
@@ -0,0 +1,100 @@
+import os
+import threading
+from werkzeug.exceptions import TooManyRequests
+from fitnessblog.metrics import timed
+
+
+# Raised when every hashing slot is taken, handled as a 429 response
+class HashingBusy(TooManyRequests):
+    description = "The server is busy. Please try again in a moment."
+
+
+# These run inside the worker processes so they have to be importable module level functions
+# bcrypt is imported on first use so starting the app doesn't load it
+def _hash_password(password, rounds):
+    import bcrypt
+
+    salt = bcrypt.gensalt(rounds=rounds, prefix=b"2b")
+    return bcrypt.hashpw(password.encode("utf-8"), salt).decode("utf-8")
+
+
+def _check_password(pw_hash, password):
+    import bcrypt
+
+    return bcrypt.checkpw(password.encode("utf-8"), pw_hash.encode("utf-8"))
+
+
+# Password hashing service
+# Hashing runs in a bounded process pool so slow bcrypt rounds never pin the request threads
+class PasswordHasher:
+    def __init__(self, app=None):
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        # A pool inherited through fork belongs to the parent, so each forked server worker starts its own
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("BCRYPT_LOG_ROUNDS", 12)
+        app.config.setdefault("PASSWORD_HASH_WORKERS", 2)
+        app.config.setdefault("PASSWORD_HASH_MAX_PENDING", 8)
+        app.config.setdefault("PASSWORD_HASH_WAIT_SECONDS", 0.5)
+        self.rounds = app.config["BCRYPT_LOG_ROUNDS"]
+        self.workers = app.config["PASSWORD_HASH_WORKERS"]
+        self.wait_seconds = app.config["PASSWORD_HASH_WAIT_SECONDS"]
+        # Hashes queued or running at once, anything over this is rejected with a 429
+        self._slots = threading.BoundedSemaphore(
+            app.config["PASSWORD_HASH_MAX_PENDING"]
+        )
+        app.extensions["password_hasher"] = self
+
+    # The pool is started on first use so forked server workers each get their own
+    def _get_pool(self):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._pool
+
+    # Timings include the wait for a free worker
+    def _run(self, operation, fn, *args):
+        if not self._slots.acquire(timeout=self.wait_seconds):
+            raise HashingBusy()
+        try:
+            with timed(operation):
+                if not self.workers:
+                    return fn(*args)
+                return self._get_pool().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def generate_password_hash(self, password):
+        return self._run("password_hash", _hash_password, password, self.rounds)
+
+    def check_password_hash(self, pw_hash, password):
+        return self._run("password_check", _check_password, pw_hash, password)
+
+    # Check if a hash was made with a different work factor than the one configured
+    def needs_rehash(self, pw_hash):
+        try:
+            return int(pw_hash.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    # Stop the worker processes, used when shutting down
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False)
+                self._pool = None
+
+    def _after_fork(self):
+        self._pool = None
+        self._pool_lock = threading.Lock()
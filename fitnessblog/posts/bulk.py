@@ -0,0 +1,264 @@
+import csv
+import io
+import json
+import re
+from datetime import datetime
+from fitnessblog import db
+from fitnessblog.models import Post, User
+from fitnessblog.posts.forms import CATEGORIES
+from fitnessblog.posts.render import rendered_columns
+from fitnessblog.posts.stats import count_new_posts
+from fitnessblog.posts.utils import invalidate_post
+from fitnessblog.search.utils import index_new_posts
+from fitnessblog.timeline.utils import fan_out_posts
+
+# Import and export formats, NDJSON has one JSON object per line
+FORMATS = ("ndjson", "csv")
+
+# Columns written by an export, an import reads the same columns and ignores id and date_updated
+EXPORT_FIELDS = (
+    "id",
+    "title",
+    "content",
+    "category",
+    "date_posted",
+    "date_updated",
+    "author",
+)
+
+# Same limit as the post title column
+TITLE_MAX_LENGTH = 100
+
+# Only the first errors are kept, so skipping invalid records in a huge file doesn't use up memory
+MAX_REPORTED_ERRORS = 100
+
+
+# A record that can't be imported, line is the line number in the input
+class InvalidRecord(ValueError):
+    def __init__(self, line, message):
+        super().__init__(f"line {line}: {message}")
+        self.line = line
+        self.message = message
+
+
+# Guess the format from a file name, NDJSON unless it ends in .csv
+def format_for(filename):
+    return "csv" if filename and filename.lower().endswith(".csv") else "ndjson"
+
+
+# Parse records one at a time from an iterable of byte lines, such as a file or request.stream
+# Yields (line number, record dict), records that can't be parsed are yielded as InvalidRecord
+def read_records(lines, fmt):
+    text = (line.decode("utf-8-sig") for line in lines)
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for number, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield number, InvalidRecord(number, f"invalid JSON ({e})")
+            continue
+        if not isinstance(record, dict):
+            record = InvalidRecord(number, "expected a JSON object")
+        yield number, record
+
+
+# Check a record against the same rules as PostForm and turn it into a row for the post table
+def validate_record(line, record):
+    if isinstance(record, InvalidRecord):
+        raise record
+    title = (record.get("title") or "").strip()
+    content = record.get("content") or ""
+    category = record.get("category")
+    if not title:
+        raise InvalidRecord(line, "title is required")
+    if len(title) > TITLE_MAX_LENGTH:
+        raise InvalidRecord(line, f"title is longer than {TITLE_MAX_LENGTH} characters")
+    if not content.strip():
+        raise InvalidRecord(line, "content is required")
+    if category not in dict(CATEGORIES):
+        raise InvalidRecord(line, f"unknown category {category!r}")
+    date_posted = record.get("date_posted")
+    if date_posted:
+        try:
+            # fromisoformat doesn't read the Z suffix for UTC
+            date_posted = datetime.fromisoformat(re.sub("Z$", "+00:00", date_posted))
+        except (TypeError, ValueError):
+            raise InvalidRecord(line, "date_posted is not an ISO 8601 date")
+        # Posts are stored in naive UTC
+        if date_posted.utcoffset() is not None:
+            date_posted = (date_posted - date_posted.utcoffset()).replace(tzinfo=None)
+    else:
+        date_posted = datetime.utcnow()
+    return {
+        "title": title,
+        "content": content,
+        "category": category,
+        "date_posted": date_posted,
+        "date_updated": date_posted,
+        "author": record.get("author"),
+        **rendered_columns(content),
+    }
+
+
+# Look up the author ids for a batch, rows without an author are given default_user_id
+# Returns the rows that have an author and an InvalidRecord for each row that doesn't
+def _resolve_authors(batch, default_user_id):
+    usernames = {row["author"] for _, row in batch if row["author"]}
+    user_ids = dict(
+        db.session.query(User.username, User.id).filter(User.username.in_(usernames))
+        if usernames
+        else []
+    )
+    rows, errors = [], []
+    for line, row in batch:
+        author = row.pop("author")
+        if not author and default_user_id is not None:
+            row["user_id"] = default_user_id
+        elif author in user_ids:
+            row["user_id"] = user_ids[author]
+        elif not author:
+            errors.append(InvalidRecord(line, "author is required"))
+            continue
+        else:
+            errors.append(InvalidRecord(line, f"unknown author {author!r}"))
+            continue
+        rows.append(row)
+    return rows, errors
+
+
+# Give each row of a batch the id it is inserted with, the search index and the timeline fan out need them
+# PostgreSQL hands out the ids from the post id sequence before the insert. On SQLite the ids are read back
+# afterwards: the transaction holds the write lock and post.id is a rowid without AUTOINCREMENT, so a batch
+# always gets consecutive ids ending at last_insert_rowid()
+def _insert_rows(rows):
+    table = Post.__table__
+    if db.engine.dialect.name == "postgresql":
+        ids = db.session.execute(
+            "SELECT nextval(pg_get_serial_sequence('post', 'id')) "
+            "FROM generate_series(1, :count)",
+            {"count": len(rows)},
+        )
+        for row, (post_id,) in zip(rows, ids.fetchall()):
+            row["id"] = post_id
+        db.session.execute(table.insert(), rows)
+        return
+    db.session.execute(table.insert(), rows)
+    last_id = db.session.execute("SELECT last_insert_rowid()").scalar()
+    for post_id, row in enumerate(rows, last_id - len(rows) + 1):
+        row["id"] = post_id
+
+
+# Insert one batch in a single transaction together with its post counts and search index rows
+# The posts are written with one executemany, not a statement per row
+def _write_batch(rows):
+    _insert_rows(rows)
+    count_new_posts(db.session.connection(), rows)
+    index_new_posts(rows)
+    db.session.commit()
+    fan_out_posts([row["id"] for row in rows])
+
+
+# Import posts from parsed records, committing every batch_size posts
+# user_id makes every post belong to that user (the bulk endpoint), otherwise records name their author
+# and default_user_id is used for records that don't
+# Stops at the first invalid record unless skip_invalid is set, posts from earlier batches stay imported
+# Returns (number imported, number invalid, the first MAX_REPORTED_ERRORS InvalidRecords)
+def import_posts(
+    records, user_id=None, default_user_id=None, batch_size=500, skip_invalid=False
+):
+    imported, invalid, errors, batch = 0, 0, [], []
+
+    def reject(error):
+        nonlocal invalid
+        invalid += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append(error)
+
+    def flush():
+        nonlocal imported, batch
+        rows, unknown_authors = _resolve_authors(batch, user_id or default_user_id)
+        batch = []
+        if unknown_authors and not skip_invalid:
+            raise unknown_authors[0]
+        for error in unknown_authors:
+            reject(error)
+        if rows:
+            _write_batch(rows)
+            imported += len(rows)
+
+    try:
+        for line, record in records:
+            try:
+                row = validate_record(line, record)
+            except InvalidRecord as e:
+                if not skip_invalid:
+                    raise
+                reject(e)
+                continue
+            if user_id is not None:
+                row["author"] = None
+            batch.append((line, row))
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+    except InvalidRecord as e:
+        db.session.rollback()
+        reject(e)
+    finally:
+        if imported:
+            invalidate_post()
+    return imported, invalid, errors
+
+
+# Export rows for every post, oldest first, fetched in chunks so the whole table is never in memory
+# On PostgreSQL stream_results uses a server side cursor
+def export_rows(category=None, chunk_size=1000):
+    query = (
+        db.session.query(
+            Post.id,
+            Post.title,
+            Post.content,
+            Post.category,
+            Post.date_posted,
+            Post.date_updated,
+            User.username,
+        )
+        .join(User, User.id == Post.user_id)
+        .order_by(Post.id)
+        .execution_options(stream_results=True)
+    )
+    if category is not None:
+        query = query.filter(Post.category == category)
+    for row in query.yield_per(chunk_size):
+        yield {
+            "id": row.id,
+            "title": row.title,
+            "content": row.content,
+            "category": row.category,
+            "date_posted": row.date_posted.isoformat(),
+            "date_updated": row.date_updated.isoformat(),
+            "author": row.username,
+        }
+
+
+# Encode export rows as NDJSON or CSV, yielding one chunk of text per post
+def encode_rows(rows, fmt):
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, EXPORT_FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+        return
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + "\n"
@@ -2,17 +2,21 @@ from flask_wtf import FlaskForm
 from wtforms import StringField, SubmitField, TextAreaField, SelectField
 from wtforms.validators import DataRequired
 
+# Post categories as (value, label) pairs
+CATEGORIES = [
+    ("cardio", "Cardio"),
+    ("weight", "Weight Training"),
+    ("diet", "Diet"),
+    ("other", "Other"),
+]
+
 
 class PostForm(FlaskForm):
     title = StringField("Title", validators=[DataRequired()])
-    content = TextAreaField("Content", validators=[DataRequired()])
-    category = SelectField(
-        "Category",
-        choices=[
-            ("cardio", "Cardio"),
-            ("weight", "Weight Training"),
-            ("diet", "Diet"),
-            ("other", "Other"),
-        ],
+    content = TextAreaField(
+        "Content",
+        validators=[DataRequired()],
+        description="Markdown formatting is supported, e.g. **bold**, lists and links.",
     )
+    category = SelectField("Category", choices=CATEGORIES)
     submit = SubmitField("Post")
@@ -0,0 +1,163 @@
+from html import escape
+from html.parser import HTMLParser
+from sqlalchemy import bindparam
+from fitnessblog import db
+from fitnessblog.models import Post
+
+# Version of the output below. Bump it after changing the Markdown settings, the allowed tags or the excerpt
+# length, then run "flask posts rerender" to render existing posts again
+RENDER_VERSION = 1
+
+# Feed cards show about this many characters of a post, cut at a word
+EXCERPT_CHARS = 300
+
+MARKDOWN_EXTENSIONS = ["fenced_code", "tables", "sane_lists", "nl2br"]
+
+# Everything else the Markdown produces, or raw HTML typed into a post, is escaped
+ALLOWED_TAGS = [
+    "p",
+    "br",
+    "hr",
+    "h1",
+    "h2",
+    "h3",
+    "h4",
+    "h5",
+    "h6",
+    "strong",
+    "em",
+    "del",
+    "blockquote",
+    "code",
+    "pre",
+    "ul",
+    "ol",
+    "li",
+    "a",
+    "table",
+    "thead",
+    "tbody",
+    "tr",
+    "th",
+    "td",
+]
+ALLOWED_ATTRIBUTES = {"a": ["href", "title"], "th": ["align"], "td": ["align"]}
+ALLOWED_PROTOCOLS = ["http", "https", "mailto"]
+
+# Elements without a closing tag
+_VOID_TAGS = {"br", "hr"}
+
+
+# Markdown to HTML that is safe to show as is, links to other sites get rel="nofollow"
+# markdown and bleach are imported on first use, so starting the app doesn't load them
+def render_markdown(source):
+    import bleach
+    import markdown
+
+    html = markdown.markdown(source, extensions=MARKDOWN_EXTENSIONS)
+    html = bleach.clean(
+        html,
+        tags=ALLOWED_TAGS,
+        attributes=ALLOWED_ATTRIBUTES,
+        protocols=ALLOWED_PROTOCOLS,
+    )
+    return bleach.linkify(html, skip_tags=["pre", "code"])
+
+
+# Cuts sanitized HTML after limit characters of text, closing the elements left open
+class _Truncator(HTMLParser):
+    def __init__(self, limit):
+        super().__init__(convert_charrefs=True)
+        self.remaining = limit
+        self.parts = []
+        self.open_tags = []
+        self.truncated = False
+
+    def handle_starttag(self, tag, attrs):
+        if self.truncated:
+            return
+        attributes = "".join(
+            f' {name}="{escape(value, quote=True)}"' for name, value in attrs
+        )
+        self.parts.append(f"<{tag}{attributes}>")
+        if tag not in _VOID_TAGS:
+            self.open_tags.append(tag)
+
+    def handle_endtag(self, tag):
+        if self.truncated or tag in _VOID_TAGS:
+            return
+        if self.open_tags and self.open_tags[-1] == tag:
+            self.open_tags.pop()
+            self.parts.append(f"</{tag}>")
+
+    def handle_data(self, data):
+        if self.truncated:
+            return
+        if len(data) > self.remaining:
+            cut = data[: self.remaining]
+            # Back up to the last space so no word is cut in half
+            if " " in cut.strip():
+                cut = cut[: cut.rstrip().rfind(" ")]
+            data = cut.rstrip() + "…"
+            self.truncated = True
+        self.remaining -= len(data)
+        self.parts.append(escape(data, quote=False))
+
+    def result(self):
+        return "".join(self.parts) + "".join(
+            f"</{tag}>" for tag in reversed(self.open_tags)
+        )
+
+
+# The start of a post's rendered HTML for feed cards, whole if it is short enough
+def render_excerpt(html, limit=EXCERPT_CHARS):
+    truncator = _Truncator(limit)
+    truncator.feed(html)
+    truncator.close()
+    return truncator.result() if truncator.truncated else html
+
+
+# Rendered columns for a post's Markdown source, stored beside it when the post is written
+def rendered_columns(content):
+    html = render_markdown(content)
+    return {
+        "content_html": html,
+        "excerpt_html": render_excerpt(html),
+        "render_version": RENDER_VERSION,
+    }
+
+
+# Render a post's content into its HTML columns, call whenever the content changes
+def render_post(post):
+    for name, value in rendered_columns(post.content).items():
+        setattr(post, name, value)
+
+
+# Render posts again with the current renderer, either those rendered by an older version or all of them
+# Posts are read and written batch_size at a time by id, each batch in its own transaction
+# date_updated is left alone, the post itself didn't change. Returns the number of posts rendered
+def rerender_posts(everything=False, batch_size=500):
+    table = Post.__table__
+    query = db.session.query(Post.id, Post.content).order_by(Post.id)
+    if not everything:
+        query = query.filter(Post.render_version < RENDER_VERSION)
+    update = (
+        table.update()
+        .where(table.c.id == bindparam("post_id"))
+        .values(date_updated=table.c.date_updated)
+    )
+    rendered, last_id = 0, 0
+    while True:
+        rows = query.filter(Post.id > last_id).limit(batch_size).all()
+        if not rows:
+            return rendered
+        db.session.execute(
+            update,
+            [
+                dict(post_id=post_id, **rendered_columns(content))
+                for post_id, content in rows
+            ],
+        )
+        db.session.commit()
+        rendered += len(rows)
+        last_id = rows[-1].id
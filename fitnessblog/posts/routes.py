@@ -1,12 +1,44 @@
-import datetime
+import click
 from flask import render_template, url_for, flash, redirect, request, abort, Blueprint
+from flask import current_app
 from flask_login import current_user, login_required
-from fitnessblog import db
-from fitnessblog.models import Post
-from fitnessblog.posts.forms import PostForm
+from fitnessblog import db, events
+from fitnessblog.events import EVENT_STREAM_HEADERS, event_stream
+from fitnessblog.database import use_replica
+from fitnessblog.models import Post, User
+from fitnessblog.posts.forms import CATEGORIES, PostForm
+from fitnessblog.posts.stats import count_drift, rebuild_counts
+from fitnessblog.posts.render import RENDER_VERSION, render_post, rerender_posts
+from fitnessblog.posts.bulk import (
+    FORMATS,
+    encode_rows,
+    export_rows,
+    format_for,
+    import_posts,
+    read_records,
+)
+from fitnessblog.search.utils import index_post, remove_post
+from fitnessblog.timeline.utils import fan_out_posts, remove_from_timelines
+from fitnessblog.posts.utils import (
+    category_feed,
+    latest_feed,
+    paginate_feed,
+    invalidate_post,
+    get_post_or_404,
+    render_post_card,
+    category_counts,
+    publish_post,
+    publish_post_deleted,
+    latest_stream_url,
+)
 
 posts = Blueprint("posts", __name__)
 
+# Feed templates render each post through the fragment cache
+posts.add_app_template_global(render_post_card)
+posts.add_app_template_global(latest_stream_url)
+posts.add_app_template_global(category_counts)
+
 # Create a new post
 @posts.route("/post/new", methods=["GET", "POST"])
 @login_required
@@ -18,10 +50,17 @@ def new_post():
             title=form.title.data,
             content=form.content.data,
             category=form.category.data,
-            author=current_user,
+            user_id=current_user.id,
         )
+        render_post(post)
         db.session.add(post)
+        # Flush to get the new post id for the search index, both are saved in the same commit
+        db.session.flush()
+        index_post(post)
         db.session.commit()
+        invalidate_post()
+        fan_out_posts([post.id])
+        publish_post("created", post)
         flash("Your post has been created!", "success")
         return redirect(url_for("main.home"))
     return render_template(
@@ -31,8 +70,9 @@ def new_post():
 
 # Get a specific post by id
 @posts.route("/post/<int:post_id>")
+@use_replica
 def post(post_id):
-    post = Post.query.get_or_404(post_id)
+    post = get_post_or_404(post_id)
     return render_template("post.html", title=post.title, post=post)
 
 
@@ -42,7 +82,7 @@ def post(post_id):
 def update_post(post_id):
     post = Post.query.get_or_404(post_id)
     # Check if user owns post before updating
-    if post.author != current_user:
+    if post.user_id != current_user.id:
         abort(403)
     form = PostForm()
     # Validate form data, update db, redirect to post page
@@ -50,7 +90,11 @@ def update_post(post_id):
         post.title = form.title.data
         post.content = form.content.data
         post.category = form.category.data
+        render_post(post)
+        index_post(post)
         db.session.commit()
+        invalidate_post(post.id)
+        publish_post("updated", post)
         flash("Your post has been updated!", "success")
         return redirect(url_for("posts.post", post_id=post.id))
     # If get request, populate form with the current values from db
@@ -69,31 +113,133 @@ def update_post(post_id):
 def delete_post(post_id):
     post = Post.query.get_or_404(post_id)
     # Check if user owns post before updating
-    if post.author != current_user:
+    if post.user_id != current_user.id:
         abort(403)
     # Remove post from db, flash message, redirect to home
     db.session.delete(post)
+    remove_post(post_id)
+    remove_from_timelines(post_id)
     db.session.commit()
+    invalidate_post(post_id)
+    publish_post_deleted(post_id)
     flash("Your post has been deleted!", "success")
     return redirect(url_for("main.home"))
 
 
 # Filter posts by category
 @posts.route("/category/<string:category>", methods=["GET"])
+@use_replica
 @login_required
 def filter_by_category(category):
-    page = request.args.get("page", 1, type=int)
-    posts = Post.query.filter_by(category=category).paginate(page=page, per_page=5)
-    return render_template("category_list.html", posts=posts)
+    posts = paginate_feed(category_feed(category), ("category", category))
+    return render_template("category_list.html", posts=posts, category=category)
 
 
 # Filter posts by latest posts within 24 hours
 @posts.route("/latest", methods=["GET"])
+@use_replica
 @login_required
 def latest_posts():
-    time_24_hours_ago = datetime.datetime.now() - datetime.timedelta(hours=24)
-    page = request.args.get("page", 1, type=int)
-    posts = Post.query.filter(Post.date_posted > time_24_hours_ago).paginate(
-        page=page, per_page=5
-    )
+    posts = paginate_feed(latest_feed(), "latest")
     return render_template("latest_posts.html", posts=posts)
+
+
+# Live updates for the latest posts page as server-sent events, see fitnessblog/events.py
+# A browser reconnecting after a dropped connection sends Last-Event-ID and gets the posts it missed
+@posts.route("/latest/stream", methods=["GET"])
+@login_required
+def latest_stream():
+    if not events.stream_enabled:
+        abort(404)
+    # EventSource sends Last-Event-ID when it reconnects, the first connection passes the page's id in the URL
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get(
+        "last_event_id"
+    )
+    stream = event_stream(
+        events, last_event_id, current_app.config["EVENTS_KEEPALIVE_SECONDS"]
+    )
+    return current_app.response_class(
+        stream, mimetype="text/event-stream", headers=EVENT_STREAM_HEADERS
+    )
+
+
+# Compare the maintained post counts with a fresh count of the post table
+@posts.cli.command("check-counts")
+@click.option("--fix", is_flag=True, help="Rebuild the counts if they have drifted.")
+def check_counts_command(fix):
+    """Check the post counts against the post table."""
+    drift = count_drift()
+    for (table, key), (stored, expected) in sorted(drift.items(), key=str):
+        click.echo(f"{table} {key}: stored {stored}, expected {expected}")
+    if not drift:
+        click.echo("Post counts are up to date")
+    elif fix:
+        rebuild_counts()
+        invalidate_post()
+        click.echo("Rebuilt post counts")
+
+
+# Render post bodies again after the renderer changed (RENDER_VERSION in fitnessblog/posts/render.py)
+@posts.cli.command("rerender")
+@click.option("--all", "everything", is_flag=True, help="Render every post again.")
+@click.option("--batch-size", default=500, help="Posts rendered per transaction.")
+def rerender_command(everything, batch_size):
+    """Render posts saved by an older renderer version."""
+    rendered = rerender_posts(everything=everything, batch_size=batch_size)
+    if rendered:
+        invalidate_post()
+    click.echo(f"Rendered {rendered} posts with renderer version {RENDER_VERSION}")
+
+
+# Import posts from an NDJSON or CSV file, e.g. one written by "flask posts export"
+@posts.cli.command("import")
+@click.argument("input", type=click.File("rb"))
+@click.option(
+    "--format",
+    "fmt",
+    type=click.Choice(FORMATS),
+    help="Defaults to the file extension.",
+)
+@click.option("--author", help="Username for records without an author column.")
+@click.option("--batch-size", default=500, help="Posts written per transaction.")
+@click.option(
+    "--skip-invalid", is_flag=True, help="Report invalid records and carry on."
+)
+def import_command(input, fmt, author, batch_size, skip_invalid):
+    """Import posts from an NDJSON or CSV file ("-" for stdin)."""
+    default_user_id = None
+    if author is not None:
+        user = User.query.filter_by(username=author).first()
+        if user is None:
+            raise click.BadParameter(f"No user named {author}", param_hint="--author")
+        default_user_id = user.id
+    records = read_records(input, fmt or format_for(input.name))
+    imported, invalid, errors = import_posts(
+        records,
+        default_user_id=default_user_id,
+        batch_size=batch_size,
+        skip_invalid=skip_invalid,
+    )
+    for error in sorted(errors, key=lambda e: e.line):
+        click.echo(f"Invalid record on {error}", err=True)
+    click.echo(f"Imported {imported} posts, {invalid} invalid records")
+    if invalid and not skip_invalid:
+        raise click.ClickException("Import stopped at the first invalid record")
+
+
+# Export posts as NDJSON or CSV, streaming them so memory use doesn't grow with the table
+@posts.cli.command("export")
+@click.argument("output", type=click.File("w", encoding="utf-8"), default="-")
+@click.option(
+    "--format",
+    "fmt",
+    type=click.Choice(FORMATS),
+    help="Defaults to the file extension.",
+)
+@click.option("--category", type=click.Choice([value for value, _ in CATEGORIES]))
+def export_command(output, fmt, category):
+    """Export posts to an NDJSON or CSV file (stdout by default)."""
+    for chunk in encode_rows(
+        export_rows(category=category), fmt or format_for(output.name)
+    ):
+        output.write(chunk)
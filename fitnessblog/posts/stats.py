@@ -0,0 +1,200 @@
+import datetime
+from collections import Counter
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects import postgresql
+from fitnessblog import db
+from fitnessblog.models import Post, PostCount, PostHourlyCount
+
+# Hourly counts older than this are no longer needed for the rolling 24 hour counts
+HOURLY_RETENTION = datetime.timedelta(hours=48)
+
+
+# Start of the hour a post was created in
+def hour_bucket(date_posted):
+    return date_posted.replace(minute=0, second=0, microsecond=0)
+
+
+def _add(deltas, hourly, category, user_id, date_posted, change):
+    deltas["all", ""] += change
+    deltas["category", category] += change
+    deltas["user", str(user_id)] += change
+    if date_posted is not None:
+        hourly[hour_bucket(date_posted), category] += change
+
+
+# Deleted posts and category/author changes are counted before the flush, while the old values can still be read
+@event.listens_for(db.session, "before_flush")
+def _collect_post_count_changes(session, flush_context, instances):
+    deltas = session.info.setdefault("post_count_deltas", Counter())
+    hourly = session.info.setdefault("post_hourly_deltas", Counter())
+    for obj in session.deleted:
+        if isinstance(obj, Post):
+            _add(deltas, hourly, obj.category, obj.user_id, obj.date_posted, -1)
+    for obj in session.dirty:
+        if not isinstance(obj, Post) or obj in session.deleted:
+            continue
+        state = inspect(obj)
+        category = state.attrs.category.history
+        user_id = state.attrs.user_id.history
+        if category.has_changes() or user_id.has_changes():
+            old_category = (category.deleted or category.unchanged)[0]
+            old_user_id = (user_id.deleted or user_id.unchanged)[0]
+            _add(deltas, hourly, old_category, old_user_id, obj.date_posted, -1)
+            _add(deltas, hourly, obj.category, obj.user_id, obj.date_posted, 1)
+
+
+# New posts are counted after the flush, once their author id and date_posted are filled in
+# All changes are written in the same transaction as the posts themselves
+@event.listens_for(db.session, "after_flush")
+def _apply_post_count_changes(session, flush_context):
+    deltas = session.info.pop("post_count_deltas", Counter())
+    hourly = session.info.pop("post_hourly_deltas", Counter())
+    for obj in session.new:
+        if isinstance(obj, Post):
+            _add(deltas, hourly, obj.category, obj.user_id, obj.date_posted, 1)
+    _apply_changes(session.connection(), deltas, hourly)
+
+
+# Count posts inserted without the ORM, e.g. by a bulk import, in the transaction that inserted them
+# rows are dicts with the category, user_id and date_posted of each new post
+def count_new_posts(connection, rows):
+    deltas, hourly = Counter(), Counter()
+    since = hour_bucket(datetime.datetime.utcnow() - HOURLY_RETENTION)
+    for row in rows:
+        date_posted = row["date_posted"]
+        # Old posts never show up in the rolling counts, so they don't need an hourly row
+        if hour_bucket(date_posted) < since:
+            date_posted = None
+        _add(deltas, hourly, row["category"], row["user_id"], date_posted, 1)
+    _apply_changes(connection, deltas, hourly)
+
+
+def _apply_changes(connection, deltas, hourly):
+    for (scope, key), change in deltas.items():
+        if change:
+            _increment(connection, PostCount.__table__, change, scope=scope, key=key)
+    for (hour, category), change in hourly.items():
+        if change:
+            _increment(
+                connection,
+                PostHourlyCount.__table__,
+                change,
+                hour=hour,
+                category=category,
+            )
+
+
+# Add to a counter row, creating it if this is the first post counted under it
+# PostgreSQL allows concurrent writers, so there it's a single upsert that can't race another insert
+def _increment(connection, table, change, **key):
+    if connection.dialect.name == "postgresql":
+        statement = postgresql.insert(table).values(count=change, **key)
+        connection.execute(
+            statement.on_conflict_do_update(
+                index_elements=list(key), set_={"count": table.c.count + change}
+            )
+        )
+        return
+    where = [table.c[name] == value for name, value in key.items()]
+    result = connection.execute(
+        table.update().where(db.and_(*where)).values(count=table.c.count + change)
+    )
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(count=change, **key))
+
+
+# Query for the number of posts counted under a scope ("all", "category" or "user") and key
+def post_count_query(scope, key=""):
+    return db.session.query(PostCount.count).filter_by(scope=scope, key=str(key))
+
+
+def post_count(scope, key=""):
+    return post_count_query(scope, key).scalar() or 0
+
+
+# Start of the rolling window: the last hours hours, rounded out to the start of the oldest hour
+# The counts are kept per hour, so latest_feed lists the posts from this same time on to match them
+def rolling_since(hours=24):
+    return hour_bucket(datetime.datetime.utcnow() - datetime.timedelta(hours=hours))
+
+
+# Query for the number of posts created since rolling_since(hours)
+def rolling_count_query(category=None, hours=24):
+    query = db.session.query(db.func.sum(PostHourlyCount.count)).filter(
+        PostHourlyCount.hour >= rolling_since(hours)
+    )
+    if category is not None:
+        query = query.filter(PostHourlyCount.category == category)
+    return query
+
+
+def rolling_count(category=None, hours=24):
+    return rolling_count_query(category, hours).scalar() or 0
+
+
+# Rolling 24 hour counts for every category in one query
+def rolling_counts_by_category(hours=24):
+    rows = (
+        db.session.query(PostHourlyCount.category, db.func.sum(PostHourlyCount.count))
+        .filter(PostHourlyCount.hour >= rolling_since(hours))
+        .group_by(PostHourlyCount.category)
+    )
+    return dict(rows)
+
+
+# Count every post from scratch, returning the same shape as the stored counts
+def recompute_counts():
+    expected = Counter()
+    expected_hourly = Counter()
+    since = hour_bucket(datetime.datetime.utcnow() - HOURLY_RETENTION)
+    rows = db.session.query(Post.category, Post.user_id, Post.date_posted)
+    for category, user_id, date_posted in rows.yield_per(1000):
+        if hour_bucket(date_posted) < since:
+            date_posted = None
+        _add(expected, expected_hourly, category, user_id, date_posted, 1)
+    return expected, expected_hourly
+
+
+# Compare the stored counts with a fresh count, returning {(table, key): (stored, expected)} for each mismatch
+def count_drift():
+    expected, expected_hourly = recompute_counts()
+    since = hour_bucket(datetime.datetime.utcnow() - HOURLY_RETENTION)
+    stored = Counter(
+        {(row.scope, row.key): row.count for row in PostCount.query if row.count}
+    )
+    stored_hourly = Counter(
+        {
+            (row.hour, row.category): row.count
+            for row in PostHourlyCount.query.filter(PostHourlyCount.hour >= since)
+            if row.count
+        }
+    )
+    drift = {}
+    for name, have, want in (
+        ("post_count", stored, expected),
+        ("post_hourly_count", stored_hourly, expected_hourly),
+    ):
+        for key in set(have) | set(want):
+            if have[key] != want[key]:
+                drift[name, key] = (have[key], want[key])
+    return drift
+
+
+# Replace the stored counts with a fresh count and drop hourly rows that are too old to matter
+def rebuild_counts():
+    expected, expected_hourly = recompute_counts()
+    PostCount.query.delete()
+    PostHourlyCount.query.delete()
+    db.session.bulk_insert_mappings(
+        PostCount,
+        [{"scope": s, "key": k, "count": c} for (s, k), c in expected.items() if c],
+    )
+    db.session.bulk_insert_mappings(
+        PostHourlyCount,
+        [
+            {"hour": h, "category": k, "count": c}
+            for (h, k), c in expected_hourly.items()
+            if c
+        ],
+    )
+    db.session.commit()
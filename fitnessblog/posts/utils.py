@@ -0,0 +1,294 @@
+import base64
+import datetime
+import json
+from flask import abort, current_app, request, render_template, url_for
+from markupsafe import Markup
+from flask_sqlalchemy import Pagination
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import contains_eager, joinedload, load_only
+from fitnessblog import cache, events
+from fitnessblog.models import Post
+from fitnessblog.posts.forms import CATEGORIES
+from fitnessblog.posts.stats import (
+    post_count,
+    post_count_query,
+    rolling_count_query,
+    rolling_counts_by_category,
+    rolling_since,
+)
+
+# Number of posts shown on each page of a feed
+POSTS_PER_PAGE = 5
+
+# Columns the post card templates read from each post and its author
+# Cards show the excerpt rendered when the post was saved, the full content is only read by the post page
+POST_CARD_COLUMNS = (
+    "title",
+    "date_posted",
+    "date_updated",
+    "excerpt_html",
+    "render_version",
+    "category",
+    "user_id",
+)
+POST_PAGE_COLUMNS = POST_CARD_COLUMNS + ("content_html",)
+AUTHOR_CARD_COLUMNS = ("username", "image_file", "profile_type")
+
+
+# Base query shared by every post feed
+# Posts are joined to their author so a whole page loads in one SELECT instead of one extra query per post
+def feed_query(*criteria):
+    return card_query(*criteria).order_by(Post.date_posted.desc(), Post.id.desc())
+
+
+# Posts with the columns and author fields their cards need, in no particular order
+def card_query(*criteria, columns=POST_CARD_COLUMNS):
+    return (
+        Post.query.join(Post.author)
+        .options(
+            load_only(*columns),
+            contains_eager(Post.author).load_only(*AUTHOR_CARD_COLUMNS),
+        )
+        .filter(*criteria)
+    )
+
+
+# Query for a single post with what its page shows, the full rendered content instead of the excerpt
+def post_page_query(post_id):
+    return card_query(Post.id == post_id, columns=POST_PAGE_COLUMNS)
+
+
+# All posts, newest first
+def home_feed():
+    return feed_query()
+
+
+# Posts in a single category, newest first
+def category_feed(category):
+    return feed_query(Post.category == category)
+
+
+# Posts created within the last 24 hours, newest first
+# The window starts at the top of the hour, like the rolling counts that give the feed's total and the sidebar's
+# numbers, so the pager never links past the last post. date_posted is stored in UTC, so the window is in UTC too
+def latest_feed():
+    return feed_query(Post.date_posted >= rolling_since())
+
+
+# Posts written by a specific user, newest first
+def user_feed(user):
+    return feed_query(Post.user_id == user.id)
+
+
+# Query for the number of posts in a feed, read from the maintained post counts instead of running COUNT(*)
+def feed_total_query(count_key):
+    if count_key == "home":
+        return post_count_query("all")
+    if count_key == "latest":
+        return rolling_count_query()
+    scope, key = count_key
+    return post_count_query(scope, key)
+
+
+def feed_total(count_key):
+    return feed_total_query(count_key).scalar() or 0
+
+
+# Cursors are the (date_posted, id) of the post at the edge of a page, encoded for use in a URL
+def encode_cursor(post):
+    raw = f"{post.date_posted.isoformat()}|{post.id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    try:
+        date_posted, post_id = (
+            base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        )
+        return datetime.datetime.fromisoformat(date_posted), int(post_id)
+    except (ValueError, UnicodeError):
+        abort(404)
+
+
+# A single page of a feed fetched by cursor instead of by page number
+class CursorPage:
+    def __init__(self, items, has_newer, has_older, total):
+        self.items = items
+        self.has_newer = has_newer and bool(items)
+        self.has_older = has_older and bool(items)
+        self.total = total
+
+    @property
+    def newer_cursor(self):
+        return encode_cursor(self.items[0]) if self.has_newer else None
+
+    @property
+    def older_cursor(self):
+        return encode_cursor(self.items[-1]) if self.has_older else None
+
+
+# Query for one page of a feed using keyset pagination on (date_posted, id)
+# Only the rows on the page are read, so deep pages cost the same as the first one
+# One extra row is fetched to tell whether there is another page, see cursor_page
+# key is the pair of columns the query is ordered by, e.g. a copy of the post's date and id in another table
+# The plain date bound next to each OR lets the database read a range of the date index instead of
+# splitting the OR into two lookups and sorting their results
+def cursor_query(query, before=None, after=None, per_page=POSTS_PER_PAGE, key=None):
+    date_column, id_column = key or (Post.date_posted, Post.id)
+    if after:
+        date_posted, post_id = decode_cursor(after)
+        # Walk towards newer posts, cursor_page flips the page back into newest first order
+        return (
+            query.filter(
+                date_column >= date_posted,
+                or_(
+                    date_column > date_posted,
+                    and_(date_column == date_posted, id_column > post_id),
+                ),
+            )
+            .order_by(None)
+            .order_by(date_column.asc(), id_column.asc())
+            .limit(per_page + 1)
+        )
+
+    if before:
+        date_posted, post_id = decode_cursor(before)
+        query = query.filter(
+            date_column <= date_posted,
+            or_(
+                date_column < date_posted,
+                and_(date_column == date_posted, id_column < post_id),
+            ),
+        )
+    return query.limit(per_page + 1)
+
+
+# Turn the rows fetched by cursor_query into a page
+def cursor_page(items, before=None, after=None, total=None, per_page=POSTS_PER_PAGE):
+    if after:
+        has_newer = len(items) > per_page
+        items = items[:per_page][::-1]
+        return CursorPage(items, has_newer=has_newer, has_older=True, total=total)
+    has_older = len(items) > per_page
+    return CursorPage(
+        items[:per_page], has_newer=bool(before), has_older=has_older, total=total
+    )
+
+
+def cursor_paginate(
+    query, before=None, after=None, total=None, per_page=POSTS_PER_PAGE
+):
+    items = cursor_query(query, before, after, per_page).all()
+    return cursor_page(items, before, after, total, per_page)
+
+
+# The page number or cursors to show from the request args, as (page, before, after)
+# Cursor pagination is used when enabled in config or when the request already carries a cursor, page is None then
+def feed_page_args():
+    before = request.args.get("before")
+    after = request.args.get("after")
+    if before or after or current_app.config["FEED_PAGINATION"] == "cursor":
+        return None, before, after
+    page = request.args.get("page", 1, type=int)
+    if page < 1:
+        abort(404)
+    return page, None, None
+
+
+# Query for one page of a feed by page number
+def offset_query(query, page):
+    return query.limit(POSTS_PER_PAGE).offset((page - 1) * POSTS_PER_PAGE)
+
+
+# Turn the rows fetched by offset_query into a page, pages past the end are not found
+def offset_page(query, page, items, total):
+    if not items and page != 1:
+        abort(404)
+    return Pagination(query, page, POSTS_PER_PAGE, total, items)
+
+
+# Paginate a feed query using the page number or cursor from the request args
+def paginate_feed(query, count_key):
+    total = feed_total(count_key)
+    page, before, after = feed_page_args()
+    if page is None:
+        return cursor_paginate(query, before=before, after=after, total=total)
+    return offset_page(query, page, offset_query(query, page).all(), total)
+
+
+# Get a single post with its author loaded in the same query, or 404
+def get_post_or_404(post_id):
+    return Post.query.options(joinedload(Post.author)).get_or_404(post_id)
+
+
+# Render the card for a post in a feed, reusing the cached markup when neither the post nor its author changed
+def render_post_card(post):
+    post_version, author_version = cache.versions(
+        f"post:{post.id}", f"user:{post.user_id}"
+    )
+    # The row's own timestamp and author fields are part of the key too, so a card rendered from a
+    # replica that hasn't caught up yet is never served once the replica has the new row
+    author = post.author
+    key = (
+        f"card:{post.id}:{post_version}:{author_version}:{post.date_updated.timestamp()}:"
+        f"{post.render_version}:{author.username}:{author.image_file}:{author.profile_type}"
+    )
+    card = cache.get(key, kind="post_card")
+    if card is None:
+        card = render_template("includes/post_card.html", post=post)
+        cache.set(key, card)
+    return Markup(card)
+
+
+# Push a created or updated post to the open latest posts pages, call after the post is committed
+# The card is rendered once here, the pages only insert it. Nothing is rendered when no stream can receive it
+def publish_post(event, post):
+    if events.publishing:
+        events.publish(event, {"id": post.id, "card": str(render_post_card(post))})
+
+
+def publish_post_deleted(post_id):
+    events.publish("deleted", {"id": post_id})
+
+
+# Event stream URL for the latest posts page, resuming after the newest event seen when the page was rendered
+# None when this app doesn't serve event streams
+def latest_stream_url():
+    if not events.stream_enabled:
+        return None
+    return url_for("posts.latest_stream", last_event_id=events.last_event_id)
+
+
+# Invalidate cached markup after a post is created, updated or deleted
+def invalidate_post(post_id=None):
+    if post_id is not None:
+        cache.bump(f"post:{post_id}")
+    cache.bump("feeds")
+
+
+# Invalidate cached markup after an author's name, picture or profile type changes
+def invalidate_author(user_id):
+    cache.bump(f"user:{user_id}", "feeds")
+
+
+# Post counts for each category plus the last 24 hours, shown in the sidebar
+# Cached until the next post change so rendering the sidebar doesn't query the db on every page
+def category_counts():
+    (version,) = cache.versions("feeds")
+    key = f"category_counts:{version}"
+    cached = cache.get(key, kind="category_counts")
+    if cached is None:
+        latest = rolling_counts_by_category()
+        counts = [
+            {
+                "category": category,
+                "label": label,
+                "count": post_count("category", category),
+                "latest": latest.get(category, 0),
+            }
+            for category, label in CATEGORIES
+        ]
+        cached = json.dumps(counts)
+        # Expire so rolling 24 hour counts still drop as posts age
+        cache.set(key, cached, timeout=300)
+    return json.loads(cached)
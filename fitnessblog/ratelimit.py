@@ -0,0 +1,212 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import Counter, OrderedDict
+from flask import g, request
+from werkzeug.exceptions import TooManyRequests
+
+logger = logging.getLogger(__name__)
+
+# Seconds in each unit a limit can be given in, e.g. "5/minute"
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+# Requests limits apply to, page views (GET) are cheap and not limited
+LIMITED_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+
+
+# Raised when a bucket is empty, handled as a 429 response with a Retry-After header
+class RateLimited(TooManyRequests):
+    description = "Too many attempts. Please wait a moment and try again."
+
+    def __init__(self, retry_after):
+        super().__init__()
+        self.retry_after = retry_after
+
+
+# A limit such as "5/minute": up to 5 requests in a burst, refilled at 5 per minute
+class Rate:
+    def __init__(self, spec):
+        count, _, unit = spec.partition("/")
+        if unit not in PERIODS or not count.isdigit() or int(count) < 1:
+            raise ValueError(f"Invalid rate limit {spec!r}, expected e.g. '5/minute'")
+        self.spec = spec
+        self.burst = int(count)
+        # Seconds for one token to refill
+        self.interval = PERIODS[unit] / self.burst
+
+    def __repr__(self):
+        return f"Rate({self.spec!r})"
+
+
+# Token buckets are stored as a single number, the time at which the bucket will be full again (GCRA)
+# Taking a token moves that time forward by one interval, the bucket is empty once it is a whole burst ahead
+# Returns (allowed, new full time, seconds to wait)
+def take_token(full_at, now, rate):
+    full_at = max(full_at or now, now)
+    # The same as new full time - now - burst * interval, but exactly 0 for a full bucket despite rounding
+    wait = full_at - now - (rate.burst - 1) * rate.interval
+    if wait > 0:
+        return False, full_at, wait
+    return True, full_at + rate.interval, 0
+
+
+# In-process store, each worker process keeps its own buckets
+# Buckets are kept in least recently used order, past max_keys the oldest one is dropped. That bucket has had
+# the longest to refill and a missing bucket counts as full, so dropping it forgives the least
+class MemoryStore:
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, rate):
+        now = time.monotonic()
+        with self._lock:
+            allowed, full_at, wait = take_token(self._buckets.get(key), now, rate)
+            # A rejected hit uses the bucket too, so a client being limited stays limited
+            if allowed or key in self._buckets:
+                self._buckets[key] = full_at
+                self._buckets.move_to_end(key)
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+        return allowed, wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+# Lua script doing the same as take_token inside Redis, so every worker shares the buckets atomically
+# KEYS[1] bucket, ARGV burst, interval. Redis' clock is used so the workers' clocks don't matter
+_REDIS_TAKE_TOKEN = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local burst = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local full_at = tonumber(redis.call('GET', KEYS[1]) or now)
+if full_at < now then full_at = now end
+local wait = full_at - now - (burst - 1) * interval
+if wait > 0 then return {0, tostring(wait)} end
+local new_full_at = full_at + interval
+redis.call('SET', KEYS[1], tostring(new_full_at), 'PX', math.ceil((new_full_at - now) * 1000))
+return {1, '0'}
+"""
+
+
+# Shared store for several worker processes or servers
+# Requires the redis package, which is only imported when this store is configured
+class RedisStore:
+    def __init__(self, url, prefix="fitnessblog:ratelimit:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._take_token = self.client.register_script(_REDIS_TAKE_TOKEN)
+
+    def hit(self, key, rate):
+        allowed, wait = self._take_token(
+            keys=[self.prefix + key], args=[rate.burst, rate.interval]
+        )
+        return bool(allowed), float(wait)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + "*"):
+            self.client.delete(key)
+
+
+# Key for an account, from the email address typed into a form
+# Hashed so the store never holds email addresses
+def _account_key(email):
+    email = (email or "").strip().lower()
+    if not email:
+        return None
+    return hashlib.sha1(email.encode("utf-8")).hexdigest()[:20]
+
+
+# What each scope checked before the view limits on, None skips the limit for this request
+REQUEST_SCOPES = {"ip": lambda: request.remote_addr}
+
+# Scopes the view checks itself with RateLimiter.check once its form is validated, mapping the value it passes
+# to the key limited on. Reading the form before the view would parse every request body, even the ones the
+# limits on the client address are about to reject
+VIEW_SCOPES = {"account": _account_key}
+
+
+# Rate limits checked before a request reaches its view, so rejected requests never parse a form or hash a password
+# Limits on what the form holds (the account) are checked by the view, before it hashes a password or sends mail
+# Limits are configured per endpoint or per blueprint in RATELIMIT_LIMITS, e.g. {"users.login": {"ip": "20/minute"}}
+class RateLimiter:
+    def __init__(self, app=None):
+        self.store = None
+        self.limits = {}
+        self.rejected = Counter()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("RATELIMIT_ENABLED", True)
+        app.config.setdefault("RATELIMIT_STORAGE", "memory")
+        app.config.setdefault("RATELIMIT_REDIS_URL", None)
+        app.config.setdefault("RATELIMIT_MAX_KEYS", 100000)
+        app.config.setdefault("RATELIMIT_LIMITS", {})
+        app.extensions["ratelimit"] = self
+        if not app.config["RATELIMIT_ENABLED"]:
+            return
+        if app.config["RATELIMIT_STORAGE"] == "redis":
+            self.store = RedisStore(
+                app.config["RATELIMIT_REDIS_URL"] or app.config.get("CACHE_REDIS_URL")
+            )
+        else:
+            self.store = MemoryStore(app.config["RATELIMIT_MAX_KEYS"])
+        # Parsed once here, so a bad limit fails at startup instead of on the first request
+        self.limits = {}
+        for name, scopes in app.config["RATELIMIT_LIMITS"].items():
+            for scope in scopes:
+                if scope not in REQUEST_SCOPES and scope not in VIEW_SCOPES:
+                    raise ValueError(f"Unknown rate limit scope {scope!r} for {name}")
+            self.limits[name] = [(scope, Rate(spec)) for scope, spec in scopes.items()]
+        app.before_request(self._check)
+        app.after_request(self._add_retry_after)
+
+    def _request_limits(self):
+        if request.method not in LIMITED_METHODS:
+            return []
+        limits = self.limits.get(request.endpoint)
+        if limits is None:
+            limits = self.limits.get(request.blueprint)
+        return limits or []
+
+    def _check(self):
+        for scope, rate in self._request_limits():
+            if scope in REQUEST_SCOPES:
+                self._hit(scope, REQUEST_SCOPES[scope](), rate)
+
+    # Check the request's limits on a view scope, e.g. limiter.check("account", form.email.data)
+    # Raises RateLimited when one is used up, does nothing for endpoints without a limit on the scope
+    def check(self, scope, value):
+        for limit_scope, rate in self._request_limits():
+            if limit_scope == scope:
+                self._hit(scope, VIEW_SCOPES[scope](value), rate)
+
+    def _hit(self, scope, value, rate):
+        if value is None:
+            return
+        key = f"{request.endpoint}:{scope}:{value}"
+        try:
+            allowed, wait = self.store.hit(key, rate)
+        except Exception:
+            # A broken shared store shouldn't take the site down with it
+            logger.exception("Rate limit store failed, allowing the request")
+            return
+        if not allowed:
+            self.rejected[request.endpoint, scope] += 1
+            g.ratelimit_retry_after = wait
+            raise RateLimited(wait)
+
+    def _add_retry_after(self, response):
+        wait = g.pop("ratelimit_retry_after", None)
+        if wait is not None:
+            response.headers["Retry-After"] = str(math.ceil(wait))
+        return response
@@ -0,0 +1,33 @@
+import os
+import click
+
+# Flask-Migrate imports Alembic, which takes longer to import than the rest of the app put together
+# It is only set up for the flask command and when migrations are applied from code, never when serving requests
+MIGRATIONS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations"
+)
+
+
+# Register Flask-Migrate on an app, safe to call more than once
+def init_migrate(app):
+    from flask_migrate import Migrate
+    from fitnessblog import db
+
+    if "migrate" not in app.extensions:
+        Migrate(app, db, directory=MIGRATIONS_DIR, render_as_batch=True)
+
+
+# Apply every migration, the same as "flask db upgrade"
+# Call with an app context, e.g. from test and benchmark setup code
+def upgrade(revision="head"):
+    from flask import current_app
+    import flask_migrate
+
+    init_migrate(current_app)
+    flask_migrate.upgrade(directory=MIGRATIONS_DIR, revision=revision)
+
+
+# Set up Flask-Migrate if the app is being created by the flask command, whose "db" commands need it
+def init_cli_migrate(app):
+    if click.get_current_context(silent=True) is not None:
+        init_migrate(app)
@@ -0,0 +1,25 @@
+import click
+from flask import render_template, request, Blueprint
+from fitnessblog.database import use_replica
+from fitnessblog.search.utils import search_posts, reindex_all
+
+search = Blueprint("search", __name__)
+
+# Search posts by keyword, optionally within a category
+@search.route("/search", methods=["GET"])
+@use_replica
+def search_results():
+    query = request.args.get("q", "").strip()
+    category = request.args.get("category")
+    results = search_posts(query, category=category, before=request.args.get("before"))
+    return render_template(
+        "search.html", title="Search", query=query, category=category, results=results,
+    )
+
+
+# Rebuild the search index, use after bulk changes made outside the app
+@search.cli.command("reindex")
+def reindex_command():
+    """Rebuild the post search index."""
+    count = reindex_all()
+    click.echo(f"Indexed {count} posts")
@@ -0,0 +1,165 @@
+import base64
+from flask import abort
+from fitnessblog import db
+from fitnessblog.models import Post
+from fitnessblog.posts.utils import feed_query, POSTS_PER_PAGE
+
+# Title matches count for more than content matches when ranking results
+TITLE_WEIGHT = 10.0
+CONTENT_WEIGHT = 1.0
+
+# SQLite searches the post_search FTS5 table, kept in step with the posts by index_post and remove_post
+SQLITE_HITS = (
+    "SELECT rowid AS id, category, bm25(post_search, :title_weight, :content_weight) AS rank "
+    "FROM post_search WHERE post_search MATCH :match"
+)
+SQLITE_FACETS = (
+    "SELECT category, count(*) FROM post_search WHERE post_search MATCH :match "
+    "GROUP BY category ORDER BY count(*) DESC"
+)
+
+# PostgreSQL searches the post table directly through a GIN index on this expression (see migration 0004)
+# Titles are weighted A and content D, ranks are negated so lower is better like bm25
+POSTGRESQL_VECTOR = (
+    "(setweight(to_tsvector('english', title), 'A') || "
+    "setweight(to_tsvector('english', content), 'D'))"
+)
+POSTGRESQL_HITS = (
+    "SELECT id, category, -ts_rank("
+    "CAST(ARRAY[:content_weight, 0, 0, :title_weight] AS float4[]),"
+    f" {POSTGRESQL_VECTOR}, plainto_tsquery('english', :match)) AS rank "
+    f"FROM post WHERE {POSTGRESQL_VECTOR} @@ plainto_tsquery('english', :match)"
+)
+POSTGRESQL_FACETS = (
+    f"SELECT category, count(*) FROM post WHERE {POSTGRESQL_VECTOR} "
+    "@@ plainto_tsquery('english', :match) GROUP BY category ORDER BY count(*) DESC"
+)
+
+
+def _uses_fts_table():
+    return db.engine.dialect.name == "sqlite"
+
+
+# Add or replace a post in the search index, call before committing the post
+def index_post(post):
+    if not _uses_fts_table():
+        return
+    db.session.execute("DELETE FROM post_search WHERE rowid = :id", {"id": post.id})
+    db.session.execute(
+        "INSERT INTO post_search (rowid, title, content, category) "
+        "VALUES (:id, :title, :content, :category)",
+        {
+            "id": post.id,
+            "title": post.title,
+            "content": post.content,
+            "category": post.category,
+        },
+    )
+
+
+# Add newly inserted posts to the search index in one statement, rows are dicts with id, title, content and category
+def index_new_posts(rows):
+    if not _uses_fts_table() or not rows:
+        return
+    db.session.execute(
+        "INSERT INTO post_search (rowid, title, content, category) "
+        "VALUES (:id, :title, :content, :category)",
+        [
+            {key: row[key] for key in ("id", "title", "content", "category")}
+            for row in rows
+        ],
+    )
+
+
+# Remove a deleted post from the search index, call before committing the delete
+def remove_post(post_id):
+    if not _uses_fts_table():
+        return
+    db.session.execute("DELETE FROM post_search WHERE rowid = :id", {"id": post_id})
+
+
+# Rebuild the whole search index from the post table
+def reindex_all():
+    if not _uses_fts_table():
+        return Post.query.count()
+    db.session.execute("DELETE FROM post_search")
+    db.session.execute(
+        "INSERT INTO post_search (rowid, title, content, category) "
+        "SELECT id, title, content, category FROM post"
+    )
+    db.session.commit()
+    return db.session.execute("SELECT count(*) FROM post_search").scalar()
+
+
+# Turn what the user typed into an FTS query matching every word, so search syntax in the input can't break the query
+# plainto_tsquery already treats the text as plain words on PostgreSQL
+def build_match_query(text):
+    if not _uses_fts_table():
+        return " ".join(text.split())
+    terms = ['"' + term.replace('"', '""') + '"' for term in text.split()]
+    return " ".join(terms)
+
+
+def encode_cursor(rank, post_id):
+    return base64.urlsafe_b64encode(f"{rank!r}|{post_id}".encode("utf-8")).decode(
+        "ascii"
+    )
+
+
+def decode_cursor(cursor):
+    try:
+        rank, post_id = (
+            base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        )
+        return float(rank), int(post_id)
+    except (ValueError, UnicodeError):
+        abort(404)
+
+
+# Number of matching posts in each category
+def category_facets(match):
+    sql = SQLITE_FACETS if _uses_fts_table() else POSTGRESQL_FACETS
+    rows = db.session.execute(sql, {"match": match})
+    return [(category, count) for category, count in rows]
+
+
+# One page of search results, best matches first
+class SearchResults:
+    def __init__(self, items, facets, older_cursor):
+        self.items = items
+        self.facets = facets
+        self.older_cursor = older_cursor
+        self.has_older = older_cursor is not None
+
+
+# Search posts, ranked by bm25 (ts_rank on PostgreSQL) and paginated by a (rank, id) cursor
+def search_posts(text, category=None, before=None):
+    match = build_match_query(text)
+    if not match:
+        return SearchResults([], [], None)
+
+    hits_sql = SQLITE_HITS if _uses_fts_table() else POSTGRESQL_HITS
+    sql = f"SELECT id, rank FROM ({hits_sql}) AS hits WHERE 1 = 1"
+    params = {
+        "match": match,
+        "title_weight": TITLE_WEIGHT,
+        "content_weight": CONTENT_WEIGHT,
+        "limit": POSTS_PER_PAGE + 1,
+    }
+    if category:
+        sql += " AND category = :category"
+        params["category"] = category
+    if before:
+        params["rank"], params["id"] = decode_cursor(before)
+        sql += " AND (rank > :rank OR (rank = :rank AND id > :id))"
+    sql += " ORDER BY rank, id LIMIT :limit"
+    hits = db.session.execute(sql, params).fetchall()
+
+    page = hits[:POSTS_PER_PAGE]
+    # Load the posts and their authors in one query, then put them back in rank order
+    posts = {post.id: post for post in feed_query(Post.id.in_([id for id, _ in page]))}
+    items = [posts[id] for id, _ in page if id in posts]
+    older_cursor = (
+        encode_cursor(page[-1][1], page[-1][0]) if len(hits) > POSTS_PER_PAGE else None
+    )
+    return SearchResults(items, category_facets(match), older_cursor)
@@ -0,0 +1,130 @@
+import random
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+# Share of posts in each category
+CATEGORY_WEIGHTS = {"cardio": 35, "weight": 35, "diet": 20, "other": 10}
+
+# Password every seeded user can log in with
+SEED_PASSWORD = "password"
+
+_WORDS = {
+    "cardio": ["run", "interval", "sprint", "tempo", "cycling", "rowing", "pace"],
+    "weight": ["squat", "deadlift", "bench", "press", "hypertrophy", "sets", "reps"],
+    "diet": ["protein", "meal prep", "macros", "calories", "fasting", "hydration"],
+    "other": ["sleep", "mobility", "recovery", "stretching", "motivation", "rest"],
+}
+_FILLER = (
+    "Today I focused on {a} and {b}. It took a while to get the form right, "
+    "but after a few weeks the progress is obvious. Next week the plan is more {a} "
+    "with a bit less {b}, and plenty of rest in between."
+)
+
+
+# Post dates skew towards the recent past, with a share of posts inside the last day so /latest has data
+def _post_date(rng, now, days):
+    if rng.random() < 0.05:
+        return now - timedelta(seconds=rng.uniform(0, 24 * 3600))
+    age_days = min(rng.expovariate(1 / (days / 4)), days)
+    return now - timedelta(days=age_days, seconds=rng.uniform(0, 3600))
+
+
+# rendered maps content to its rendered columns, generated posts repeat the same few bodies
+def _post_row(rng, author_weights, now, days, rendered):
+    from fitnessblog.posts.render import rendered_columns
+
+    category = rng.choices(list(CATEGORY_WEIGHTS), list(CATEGORY_WEIGHTS.values()))[0]
+    a, b = rng.sample(_WORDS[category], 2)
+    date_posted = _post_date(rng, now, days)
+    content = "\n\n".join(_FILLER.format(a=a, b=b) for _ in range(rng.randint(1, 4)))
+    if content not in rendered:
+        rendered[content] = rendered_columns(content)
+    return {
+        "title": f"{a.capitalize()} and {b}: week {rng.randint(1, 52)}",
+        "content": content,
+        **rendered[content],
+        "category": category,
+        "date_posted": date_posted,
+        "date_updated": date_posted,
+        "user_id": rng.choices(author_weights[0], cum_weights=author_weights[1])[0],
+    }
+
+
+# Bulk insert users and posts with executemany in batches, skipping the ORM's per object work
+# Post counts and the search index are rebuilt once at the end instead of row by row
+def seed_database(users, posts, seed=None, days=365, batch_size=1000):
+    from fitnessblog import db, passwords
+    from fitnessblog.models import User, Post
+    from fitnessblog.posts.stats import rebuild_counts
+    from fitnessblog.posts.utils import invalidate_post
+    from fitnessblog.search.utils import reindex_all
+
+    rng = random.Random(seed)
+    # Hashing once keeps seeding fast, every seeded user shares the same password
+    password = passwords.generate_password_hash(SEED_PASSWORD)
+    last_id = db.session.query(db.func.max(User.id)).scalar() or 0
+    for start in range(0, users, batch_size):
+        db.session.execute(
+            User.__table__.insert(),
+            [
+                {
+                    "username": f"user{last_id + i + 1}",
+                    "email": f"user{last_id + i + 1}@example.com",
+                    "profile_type": rng.choice(("instructor", "student")),
+                    "image_file": "default.jpg",
+                    "password": password,
+                }
+                for i in range(start, min(start + batch_size, users))
+            ],
+        )
+    # Ids come from the database so PostgreSQL's id sequence stays in step
+    user_ids = [
+        user_id
+        for (user_id,) in db.session.query(User.id)
+        .filter(User.id > last_id)
+        .order_by(User.id)
+    ]
+
+    # A few authors write most of the posts, like on a real blog
+    cum_weights, total = [], 0
+    for rank in range(1, len(user_ids) + 1):
+        total += 1 / rank
+        cum_weights.append(total)
+    author_weights = (list(user_ids), cum_weights)
+    now = datetime.utcnow()
+    rendered = {}
+    for start in range(0, posts, batch_size):
+        db.session.execute(
+            Post.__table__.insert(),
+            [
+                _post_row(rng, author_weights, now, days, rendered)
+                for _ in range(min(batch_size, posts - start))
+            ],
+        )
+    db.session.commit()
+
+    rebuild_counts()
+    reindex_all()
+    invalidate_post()
+
+
+@click.command("seed")
+@click.option("--users", default=50, help="Number of users to create.")
+@click.option("--posts", default=1000, help="Number of posts to create.")
+@click.option(
+    "--seed", type=int, help="Random seed, the same seed gives the same data."
+)
+@click.option("--days", default=365, help="How far back post dates go.")
+@with_appcontext
+def seed_command(users, posts, seed, days):
+    """Fill the database with generated users and posts."""
+    if users < 1 and posts:
+        raise click.UsageError("Posts need at least one user")
+    seed_database(users, posts, seed=seed, days=days)
+    click.echo(
+        f"Created {users} users and {posts} posts in "
+        f"{current_app.config['SQLALCHEMY_DATABASE_URI']}, "
+        f"log in as user<id>@example.com with password '{SEED_PASSWORD}'"
+    )
@@ -0,0 +1,48 @@
+// Live updates for the latest posts page, pushed by the server as server-sent events (posts.latest_stream)
+// Each event carries the post's rendered card, so showing it needs no further requests
+(function () {
+  var list = document.getElementById("latest-posts");
+  if (!list || !list.getAttribute("data-stream") || !window.EventSource) {
+    return;
+  }
+  var source = new EventSource(list.getAttribute("data-stream"));
+
+  function find(id) {
+    return list.querySelector('[data-post-id="' + id + '"]');
+  }
+
+  function card(post) {
+    var item = document.createElement("div");
+    item.setAttribute("data-post-id", post.id);
+    item.innerHTML = post.card;
+    return item;
+  }
+
+  source.addEventListener("created", function (event) {
+    var post = JSON.parse(event.data);
+    if (!find(post.id)) {
+      list.insertBefore(card(post), list.firstChild);
+    }
+  });
+
+  source.addEventListener("updated", function (event) {
+    var post = JSON.parse(event.data);
+    var old = find(post.id);
+    if (old) {
+      list.replaceChild(card(post), old);
+    }
+  });
+
+  source.addEventListener("deleted", function (event) {
+    var old = find(JSON.parse(event.data).id);
+    if (old) {
+      list.removeChild(old);
+    }
+  });
+
+  // The connection was down for longer than the server keeps events, reload to catch up
+  source.addEventListener("reset", function () {
+    source.close();
+    window.location.reload();
+  });
+})();
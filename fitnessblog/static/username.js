@@ -0,0 +1,48 @@
+// Live username check for the sign up and account forms (api.username_available)
+// The server answers most checks from memory, saving the form still reports a name taken in the meantime
+(function () {
+  var form = document.querySelector("form[data-username-check]");
+  var input = form && form.querySelector('input[name="username"]');
+  var status = document.getElementById("username-status");
+  if (!input || !status || !window.fetch) {
+    return;
+  }
+  var url = form.getAttribute("data-username-check");
+  var timer = null;
+
+  function show(text, className) {
+    status.textContent = text;
+    status.className = "form-text " + className;
+  }
+
+  function check() {
+    var username = input.value;
+    if (username.length < 2 || username.length > 20) {
+      show("", "");
+      return;
+    }
+    fetch(url + "?username=" + encodeURIComponent(username), { credentials: "same-origin" })
+      .then(function (response) {
+        return response.ok ? response.json() : null;
+      })
+      .then(function (data) {
+        // Ignore answers for what the user has since typed over
+        if (!data || data.username !== input.value) {
+          return;
+        }
+        if (data.available) {
+          show("Username is available.", "text-success");
+        } else {
+          show("Username is taken. Choose another username.", "text-danger");
+        }
+      })
+      .catch(function () {
+        show("", "");
+      });
+  }
+
+  input.addEventListener("input", function () {
+    clearTimeout(timer);
+    timer = setTimeout(check, 300);
+  });
+})();
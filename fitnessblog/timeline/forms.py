@@ -0,0 +1,6 @@
+from flask_wtf import FlaskForm
+
+
+# Follow and unfollow buttons, the form has no fields of its own but carries the CSRF token
+class FollowForm(FlaskForm):
+    pass
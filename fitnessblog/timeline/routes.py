@@ -0,0 +1,86 @@
+import click
+from flask import render_template, url_for, flash, redirect, request, Blueprint, abort
+from flask import current_app
+from flask_login import current_user, login_required
+from fitnessblog import db
+from fitnessblog.database import use_replica
+from fitnessblog.models import Follow, TimelineEntry, User
+from fitnessblog.timeline.forms import FollowForm
+from fitnessblog.timeline.utils import (
+    follow,
+    unfollow,
+    timeline_page,
+    trim_timeline,
+    rebuild_timeline,
+)
+
+timeline = Blueprint("timeline", __name__)
+
+# Personal timeline of posts by the users the current user follows
+@timeline.route("/feed", methods=["GET"])
+@use_replica
+@login_required
+def feed():
+    posts = timeline_page(
+        current_user.id,
+        before=request.args.get("before"),
+        after=request.args.get("after"),
+    )
+    return render_template("feed.html", title="Your Feed", posts=posts)
+
+
+# Follow a user, their posts show up in the follower's feed from now on
+@timeline.route("/user/<string:username>/follow", methods=["POST"])
+@login_required
+def follow_user(username):
+    if not FollowForm().validate_on_submit():
+        abort(400)
+    user = User.query.filter_by(username=username).first_or_404()
+    if user.id == current_user.id:
+        flash("You can't follow yourself", "warning")
+    elif follow(current_user.id, user):
+        flash(f"You are now following {user.username}", "success")
+    return redirect(url_for("users.user_posts", username=username))
+
+
+# Unfollow a user and take their posts out of the follower's feed
+@timeline.route("/user/<string:username>/unfollow", methods=["POST"])
+@login_required
+def unfollow_user(username):
+    if not FollowForm().validate_on_submit():
+        abort(400)
+    user = User.query.filter_by(username=username).first_or_404()
+    if unfollow(current_user.id, user.id):
+        flash(f"You are no longer following {user.username}", "info")
+    return redirect(url_for("users.user_posts", username=username))
+
+
+# Trim every timeline down to TIMELINE_MAX_ENTRIES, e.g. after lowering it
+@timeline.cli.command("trim")
+def trim_command():
+    """Trim every timeline to TIMELINE_MAX_ENTRIES."""
+    max_entries = current_app.config["TIMELINE_MAX_ENTRIES"]
+    removed = 0
+    for (user_id,) in db.session.query(TimelineEntry.user_id).distinct().all():
+        removed += trim_timeline(user_id, max_entries)
+        db.session.commit()
+    click.echo(f"Removed {removed} timeline entries")
+
+
+# Rebuild timelines from the follow graph, e.g. after raising TIMELINE_MAX_ENTRIES
+@timeline.cli.command("rebuild")
+@click.option("--user", "username", help="Only rebuild this user's timeline.")
+def rebuild_command(username):
+    """Rebuild timelines from the posts of followed users."""
+    query = db.session.query(Follow.follower_id).distinct()
+    if username is not None:
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            raise click.BadParameter(f"No user named {username}", param_hint="--user")
+        query = query.filter(Follow.follower_id == user.id)
+    max_entries = current_app.config["TIMELINE_MAX_ENTRIES"]
+    user_ids = [user_id for (user_id,) in query.all()]
+    for user_id in user_ids:
+        rebuild_timeline(user_id, max_entries)
+        db.session.commit()
+    click.echo(f"Rebuilt {len(user_ids)} timelines")
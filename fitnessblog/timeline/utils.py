@@ -0,0 +1,227 @@
+from flask import current_app
+from sqlalchemy import and_, exists, literal, or_
+from fitnessblog import db, jobs
+from fitnessblog.models import Follow, Post, TimelineEntry, User
+from fitnessblog.posts.utils import (
+    POSTS_PER_PAGE,
+    card_query,
+    cursor_page,
+    cursor_query,
+    feed_query,
+)
+
+# Timelines are ordered and paged by the post date and id copied into each entry
+TIMELINE_KEY = (TimelineEntry.date_posted, TimelineEntry.post_id)
+
+
+# Query for the follow row linking two users, empty if follower doesn't follow followed
+def follow_query(follower_id, followed_id):
+    return db.session.query(Follow.follower_id).filter_by(
+        follower_id=follower_id, followed_id=followed_id
+    )
+
+
+def is_following(follower_id, followed_id):
+    return follow_query(follower_id, followed_id).first() is not None
+
+
+# Follow a user and copy their latest posts into the follower's timeline
+# Returns False if the follower already follows them
+def follow(follower_id, followed):
+    if is_following(follower_id, followed.id):
+        return False
+    db.session.add(Follow(follower_id=follower_id, followed_id=followed.id))
+    if not followed.large_audience:
+        posts = (
+            db.session.query(Post.id, Post.date_posted)
+            .filter(Post.user_id == followed.id)
+            .order_by(Post.date_posted.desc(), Post.id.desc())
+            .limit(current_app.config["TIMELINE_FOLLOW_BACKFILL"])
+            .all()
+        )
+        # A fan out job running at the same time may have copied some of them already
+        copied = {
+            post_id
+            for (post_id,) in db.session.query(TimelineEntry.post_id).filter(
+                TimelineEntry.user_id == follower_id,
+                TimelineEntry.post_id.in_([post.id for post in posts]),
+            )
+        }
+        rows = [
+            {
+                "user_id": follower_id,
+                "post_id": post.id,
+                "date_posted": post.date_posted,
+            }
+            for post in posts
+            if post.id not in copied
+        ]
+        if rows:
+            db.session.execute(TimelineEntry.__table__.insert(), rows)
+    db.session.commit()
+    return True
+
+
+# Stop following a user and take their posts out of the follower's timeline
+# Returns False if the follower didn't follow them
+def unfollow(follower_id, followed_id):
+    deleted = Follow.query.filter_by(
+        follower_id=follower_id, followed_id=followed_id
+    ).delete()
+    TimelineEntry.query.filter(
+        TimelineEntry.user_id == follower_id,
+        TimelineEntry.post_id.in_(
+            db.session.query(Post.id).filter(Post.user_id == followed_id)
+        ),
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return bool(deleted)
+
+
+# Queue copying new posts into their authors' followers' timelines, call after the posts are committed
+def fan_out_posts(post_ids):
+    if post_ids:
+        jobs.enqueue("fan_out_posts", post_ids=list(post_ids))
+
+
+# Background job copying posts into the timelines of everyone following their author (fan out on write)
+# Authors with more than TIMELINE_FANOUT_MAX_FOLLOWERS followers are marked large_audience and skipped,
+# their posts are merged in when a timeline is read instead (fan out on read, see timeline_page)
+@jobs.task("fan_out_posts")
+def fan_out_posts_job(post_ids):
+    config = current_app.config
+    entry = TimelineEntry.__table__
+    large_audience = {}
+    posts = db.session.query(Post.id, Post.user_id, Post.date_posted).filter(
+        Post.id.in_(post_ids)
+    )
+    for post in posts.all():
+        author_id = post.user_id
+        if author_id not in large_audience:
+            large_audience[author_id] = _check_audience(
+                author_id, config["TIMELINE_FANOUT_MAX_FOLLOWERS"]
+            )
+        if large_audience[author_id]:
+            continue
+        followers = db.select(
+            [
+                Follow.follower_id,
+                literal(post.id, db.Integer),
+                literal(post.date_posted, db.DateTime),
+            ]
+        ).where(
+            and_(
+                Follow.followed_id == author_id,
+                # Makes a retried job harmless
+                ~exists().where(
+                    and_(
+                        entry.c.user_id == Follow.follower_id,
+                        entry.c.post_id == post.id,
+                    )
+                ),
+            )
+        )
+        db.session.execute(
+            entry.insert().from_select(["user_id", "post_id", "date_posted"], followers)
+        )
+        # Each timeline is trimmed on about one in TIMELINE_TRIM_EVERY posts copied into it, picked from the ids
+        # so no state is needed. Timelines stay close to TIMELINE_MAX_ENTRIES without trimming on every post
+        every = config["TIMELINE_TRIM_EVERY"]
+        to_trim = db.session.query(Follow.follower_id).filter(
+            Follow.followed_id == author_id,
+            (Follow.follower_id + post.id) % every == 0,
+        )
+        for (follower_id,) in to_trim.all():
+            trim_timeline(follower_id, config["TIMELINE_MAX_ENTRIES"])
+    db.session.commit()
+
+
+# Mark an author as large_audience once they have too many followers to fan out to, returns the flag
+# The flag is never cleared, so no post falls between being copied and being merged in on read
+def _check_audience(author_id, max_followers):
+    if db.session.query(User.large_audience).filter_by(id=author_id).scalar():
+        return True
+    followers = Follow.query.filter_by(followed_id=author_id).count()
+    if followers <= max_followers:
+        return False
+    User.query.filter_by(id=author_id).update({"large_audience": True})
+    return True
+
+
+# Drop the oldest entries from a user's timeline, keeping the newest max_entries
+# Returns the number of entries removed
+def trim_timeline(user_id, max_entries):
+    date_column, id_column = TIMELINE_KEY
+    oldest_kept = (
+        db.session.query(date_column, id_column)
+        .filter(TimelineEntry.user_id == user_id)
+        .order_by(date_column.desc(), id_column.desc())
+        .offset(max_entries - 1)
+        .first()
+    )
+    if oldest_kept is None:
+        return 0
+    date_posted, post_id = oldest_kept
+    return TimelineEntry.query.filter(
+        TimelineEntry.user_id == user_id,
+        or_(
+            date_column < date_posted,
+            and_(date_column == date_posted, id_column < post_id),
+        ),
+    ).delete(synchronize_session=False)
+
+
+# Refill a user's timeline from the latest posts of everyone they follow
+# Used after changing the timeline settings and to fill timelines for follows made outside the app
+def rebuild_timeline(user_id, max_entries):
+    TimelineEntry.query.filter_by(user_id=user_id).delete()
+    followed = (
+        db.session.query(Follow.followed_id)
+        .join(User, User.id == Follow.followed_id)
+        .filter(Follow.follower_id == user_id, User.large_audience == False)
+    )
+    latest = (
+        db.select([literal(user_id, db.Integer), Post.id, Post.date_posted])
+        .where(Post.user_id.in_(followed.subquery()))
+        .order_by(Post.date_posted.desc(), Post.id.desc())
+        .limit(max_entries)
+    )
+    db.session.execute(
+        TimelineEntry.__table__.insert().from_select(
+            ["user_id", "post_id", "date_posted"], latest
+        )
+    )
+
+
+# Remove a deleted post from every timeline, call before the post itself is deleted
+def remove_from_timelines(post_id):
+    TimelineEntry.query.filter_by(post_id=post_id).delete()
+
+
+# One page of a user's timeline, newest first and paged by cursor
+# Posts copied in by fan_out_posts_job are read from the timeline index, posts by followed authors with a
+# large audience are read from their own feeds and merged in. Either way only about a page of rows is read,
+# however many people the user follows
+def timeline_page(user_id, before=None, after=None, per_page=POSTS_PER_PAGE):
+    copied = card_query().join(TimelineEntry, TimelineEntry.post_id == Post.id)
+    copied = copied.filter(TimelineEntry.user_id == user_id).order_by(
+        *(column.desc() for column in TIMELINE_KEY)
+    )
+    items = cursor_query(copied, before, after, per_page, key=TIMELINE_KEY).all()
+
+    large_audience_ids = [
+        followed_id
+        for (followed_id,) in db.session.query(Follow.followed_id)
+        .join(User, User.id == Follow.followed_id)
+        .filter(Follow.follower_id == user_id, User.large_audience == True)
+    ]
+    if large_audience_ids:
+        pulled = feed_query(Post.user_id.in_(large_audience_ids))
+        items += cursor_query(pulled, before, after, per_page).all()
+        # Pages after a cursor are fetched oldest first, cursor_page puts them back in order
+        items = sorted(
+            {post.id: post for post in items}.values(),
+            key=lambda post: (post.date_posted, post.id),
+            reverse=not after,
+        )
+    return cursor_page(items[: per_page + 1], before, after, per_page=per_page)
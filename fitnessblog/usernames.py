@@ -0,0 +1,111 @@
+import hashlib
+import math
+import threading
+import time
+from collections import Counter
+
+
+# Set membership in a fixed size bit array. "Not in the filter" is always right, "in the filter" is wrong for
+# about error_rate of the items never added, as long as no more than capacity items are added
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(
+            8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        )
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    # Bit positions of an item, from two halves of one digest (double hashing)
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+
+# Answers "is this username taken?" mostly from memory, for the live check on the sign up and account forms
+# A Bloom filter of every username is built from the user table on first use and rebuilt every
+# USERNAME_FILTER_REBUILD_SECONDS. Names saved by this process are added as they are saved, names saved by other
+# worker processes show up after the next rebuild. Only names the filter may hold are looked up in the database.
+# The unique constraints on the user table still decide, this is only a hint for the forms
+class UsernameFilter:
+    def __init__(self, db, app=None):
+        self.db = db
+        self.filter = None
+        self.built_at = 0
+        self.checks = Counter()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("USERNAME_FILTER_CAPACITY", 100000)
+        app.config.setdefault("USERNAME_FILTER_ERROR_RATE", 0.01)
+        app.config.setdefault("USERNAME_FILTER_REBUILD_SECONDS", 600)
+        self.config = app.config
+        app.extensions["usernames"] = self
+
+    # Fill a new filter from the user table, sized for at least twice the current number of users
+    def rebuild(self):
+        from fitnessblog.models import User
+
+        usernames = [
+            username
+            for (username,) in self.db.session.query(User.username).yield_per(5000)
+        ]
+        bloom = BloomFilter(
+            max(self.config["USERNAME_FILTER_CAPACITY"], 2 * len(usernames)),
+            self.config["USERNAME_FILTER_ERROR_RATE"],
+        )
+        for username in usernames:
+            bloom.add(username)
+        self.filter, self.built_at = bloom, time.monotonic()
+        return bloom
+
+    # The current filter, rebuilt when it is too old or too full to be accurate
+    # Only one thread rebuilds, the others keep using the old filter until the new one is ready
+    def _current(self):
+        bloom = self.filter
+        stale = (
+            bloom is None
+            or time.monotonic() - self.built_at
+            > self.config["USERNAME_FILTER_REBUILD_SECONDS"]
+            or bloom.count > bloom.capacity
+        )
+        if stale and self._lock.acquire(blocking=bloom is None):
+            try:
+                if bloom is self.filter:
+                    bloom = self.rebuild()
+                else:
+                    bloom = self.filter
+            finally:
+                self._lock.release()
+        return bloom
+
+    # Call after a username is saved, so this process reports it as taken straight away
+    def add(self, username):
+        if self.filter is not None:
+            self.filter.add(username)
+
+    def is_taken(self, username):
+        from fitnessblog.models import User
+
+        if username not in self._current():
+            self.checks["filter"] += 1
+            return False
+        self.checks["database"] += 1
+        query = self.db.session.query(User.id).filter_by(username=username)
+        return self.db.session.query(query.exists()).scalar()
@@ -9,7 +9,6 @@ from wtforms.validators import (
     ValidationError,
     InputRequired,
 )
-from flask_login import current_user
 from fitnessblog.models import User
 
 
@@ -29,21 +28,11 @@ class RegistrationForm(FlaskForm):
     )
     submit = SubmitField("Sign Up")
 
-    # Check if username exists in db
-    def validate_username(self, username):
-        # Check for user and get first one there, if not return none
-        user = User.query.filter_by(username=username.data).first()
-        if user:
-            raise ValidationError("Username is taken. Choose another username.")
-
-    # Check if email exists in db
-    def validate_email(self, email):
-        # Check for email and get first one there, if not return none
-        email = User.query.filter_by(email=email.data).first()
-        if email:
-            raise ValidationError(
-                "Email address already registered. Choose another email."
-            )
+    # Errors shown when saving the user breaks the unique constraint on one of these fields
+    taken_messages = {
+        "username": "Username is taken. Choose another username.",
+        "email": "Email address already registered. Choose another email.",
+    }
 
 
 class LoginForm(FlaskForm):
@@ -67,22 +56,10 @@ class UpdateAccountForm(FlaskForm):
     submit = SubmitField("Update")
     # TODO: Add image update
 
-    # Check if username exists in db
-    def validate_username(self, username):
-        if username.data != current_user.username:
-            # Check for user and get first one there, if not return none
-            user = User.query.filter_by(username=username.data).first()
-            if user:
-                raise ValidationError("Username is taken. Choose another username.")
-
-    # Check if email exists in db
-    def validate_email(self, email):
-        if email.data != current_user.email:
-            user = User.query.filter_by(email=email.data).first()
-            if user:
-                raise ValidationError(
-                    "That email is taken. Please choose a different one."
-                )
+    taken_messages = {
+        "username": "Username is taken. Choose another username.",
+        "email": "That email is taken. Please choose a different one.",
+    }
 
 
 class RequestResetForm(FlaskForm):
@@ -1,7 +1,10 @@
+import click
 from flask import render_template, url_for, flash, redirect, request, Blueprint
 from flask_login import login_user, current_user, logout_user, login_required
-from fitnessblog import db, bcrypt
-from fitnessblog.models import User, Post
+from sqlalchemy.exc import IntegrityError
+from fitnessblog import db, passwords, cache, identity, usernames, limiter
+from fitnessblog.database import use_replica
+from fitnessblog.models import User
 from fitnessblog.users.forms import (
     RegistrationForm,
     LoginForm,
@@ -9,11 +12,26 @@ from fitnessblog.users.forms import (
     RequestResetForm,
     ResetPasswordForm,
 )
-from fitnessblog.users.utils import save_picture, send_reset_email
+from fitnessblog.users.utils import (
+    save_picture,
+    enqueue_picture,
+    send_reset_email,
+    picture_url,
+    is_legacy_picture,
+    remove_unused_pictures,
+    add_taken_errors,
+)
+from fitnessblog.posts.utils import user_feed, paginate_feed, invalidate_author
+from fitnessblog.timeline.forms import FollowForm
+from fitnessblog.timeline.utils import is_following
 
 # Create blueprint instance
 users = Blueprint("users", __name__)
 
+# Templates pick a profile picture size with picture_url(image_file, size)
+users.add_app_template_global(picture_url)
+users.add_app_template_global(is_legacy_picture)
+
 # Registration route using the register form in forms.py
 @users.route("/register", methods=["GET", "POST"])
 def register():
@@ -23,9 +41,7 @@ def register():
     form = RegistrationForm()
     if form.validate_on_submit():
         # Hash password
-        hashed_password = bcrypt.generate_password_hash(form.password.data).decode(
-            "utf-8"
-        )
+        hashed_password = passwords.generate_password_hash(form.password.data)
 
         # Construct new user
         user = User(
@@ -34,12 +50,18 @@ def register():
             password=hashed_password,
             profile_type=form.profile_type.data,
         )
-        # Save user to db
+        # Save user to db, the unique constraints reject a username or email that is already taken
         db.session.add(user)
-        db.session.commit()
-
-        flash("Your account has been created. Please log in", "success")
-        return redirect(url_for("users.login"))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            if not add_taken_errors(form):
+                raise
+        else:
+            usernames.add(user.username)
+            flash("Your account has been created. Please log in", "success")
+            return redirect(url_for("users.login"))
 
     return render_template("register.html", title="Register", form=form)
 
@@ -52,11 +74,17 @@ def login():
         return redirect("home")
     form = LoginForm()
     if form.validate_on_submit():
+        limiter.check("account", form.email.data)
         # Get user in db by email
         user = User.query.filter_by(email=form.email.data).first()
         # Check users hashed password matches typed password
-        if user and bcrypt.check_password_hash(user.password, form.password.data):
+        if user and passwords.check_password_hash(user.password, form.password.data):
+            # Upgrade hashes made with an older work factor now that we know the password
+            if passwords.needs_rehash(user.password):
+                user.password = passwords.generate_password_hash(form.password.data)
+                db.session.commit()
             login_user(user, remember=form.remember.data)
+            identity.remember(user)
             # Check for any next parameter arguments
             next_page = request.args.get("next")
             # Ternary to send user to next page if it exists, otherwise send user to home page
@@ -71,6 +99,7 @@ def login():
 @users.route("/logout")
 def logout():
     logout_user()
+    identity.forget_session()
     return redirect(url_for("main.home"))
 
 
@@ -81,43 +110,65 @@ def account():
     form = UpdateAccountForm()
     # Check if form data is valid, update user account info in database, redirect to account page
     if form.validate_on_submit():
+        # current_user is a cached snapshot, so load the user row to update it
+        user = User.query.get(current_user.id)
+        # Remember the fields shown on post cards so cached cards can be invalidated if they change
+        card_fields = (user.username, user.image_file, user.profile_type)
         # Check for picture data
+        upload_path = None
         if form.picture.data:
-            picture_file = save_picture(form.picture.data)
-            current_user.image_file = picture_file
-        current_user.username = form.username.data
-        current_user.email = form.email.data
-        current_user.profile_type = form.profile_type.data
-        db.session.commit()
-        flash("Your account has been updated!", "success")
-        return redirect(url_for("users.account"))
-    elif request.method == "GET":
+            picture_hash, upload_path = save_picture(form.picture.data)
+            if upload_path is None:
+                user.image_file = picture_hash
+        user.username = form.username.data
+        user.email = form.email.data
+        user.profile_type = form.profile_type.data
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            if not add_taken_errors(form, current_user.id):
+                raise
+        else:
+            # Queue the resizing only now, so a failed update never leaves a job behind
+            if upload_path is not None:
+                enqueue_picture(upload_path, picture_hash, user.id, user.image_file)
+                flash("Your new profile picture is being processed", "info")
+            usernames.add(user.username)
+            identity.remember(user)
+            if card_fields != (user.username, user.image_file, user.profile_type):
+                invalidate_author(user.id)
+            flash("Your account has been updated!", "success")
+            return redirect(url_for("users.account"))
+    # The email and picture come from the user row: the session snapshot leaves the email out, and a resize job
+    # finishing in a worker process can't update the identity cached by this process or kept in the session cookie
+    user = User.query.get(current_user.id)
+    if request.method == "GET":
         form.username.data = current_user.username
-        form.email.data = current_user.email
+        form.email.data = user.email
         form.profile_type.data = current_user.profile_type
-    # Set profile picture image file
-    image_file = url_for("static", filename="profile_pics/" + current_user.image_file)
-    return render_template(
-        "account.html", title="Account", image_file=image_file, form=form
-    )
+    return render_template("account.html", title="Account", form=form, user=user)
 
 
 # Show all posts by specific user
 @users.route("/user/<string:username>")
+@use_replica
+@cache.cached_page
 # url_for refers to the function name below (home)
 def user_posts(username):
-    # Get page argument (start at default page 1)
-    page = request.args.get("page", 1, type=int)
     # Get first user with this username or return 404
     user = User.query.filter_by(username=username).first_or_404()
     # Fetch all posts from db sorting by date desc, filter by specific user, using pagination
-    # Page is taken from arg above, per_page is number of results per page
-    posts = (
-        Post.query.filter_by(author=user)
-        .order_by(Post.date_posted.desc())
-        .paginate(page=page, per_page=5)
+    # The page number or cursor is taken from the request args
+    posts = paginate_feed(user_feed(user), ("user", user.id))
+    following = current_user.is_authenticated and is_following(current_user.id, user.id)
+    return render_template(
+        "user_posts.html",
+        posts=posts,
+        user=user,
+        following=following,
+        form=FollowForm(),
     )
-    return render_template("user_posts.html", posts=posts, user=user)
 
 
 # Create a request for password reset
@@ -129,6 +180,7 @@ def reset_request():
     form = RequestResetForm()
     # If valid form is submitted get the user based off of email, and send that user an email with token
     if form.validate_on_submit():
+        limiter.check("account", form.email.data)
         user = User.query.filter_by(email=form.email.data).first()
         send_reset_email(user)
         flash("An email has been sent with instructions to reset your password", "info")
@@ -152,12 +204,19 @@ def reset_token(token):
     form = ResetPasswordForm()
     if form.validate_on_submit():
         # Hash password
-        hashed_password = bcrypt.generate_password_hash(form.password.data).decode(
-            "utf-8"
-        )
+        hashed_password = passwords.generate_password_hash(form.password.data)
         # Update user password in db
         user.password = hashed_password
         db.session.commit()
+        identity.invalidate(user.id)
         flash("Password has been updated! Please log in", "success")
         return redirect(url_for("users.login"))
     return render_template("reset_token.html", title="Reset Password", form=form)
+
+
+# Remove profile pictures that are no longer used by any account
+@users.cli.command("remove-unused-pictures")
+def remove_unused_pictures_command():
+    """Delete unreferenced profile pictures and abandoned uploads."""
+    removed = remove_unused_pictures()
+    click.echo(f"Removed {len(removed)} unused pictures")
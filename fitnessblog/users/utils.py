@@ -1,43 +1,192 @@
+import hashlib
 import os
 import secrets
-from PIL import Image
-from flask import url_for
-from flask_mail import Message
-from fitnessblog import mail
+import shutil
+import time
+from flask import url_for, abort
+from sqlalchemy import or_
+from fitnessblog import db, jobs, identity
+from fitnessblog.metrics import timed
+from fitnessblog.models import User
+from fitnessblog.posts.utils import invalidate_author
 from flask import current_app
 
+# Folder (under static) holding profile pictures. Processed pictures live in a sub folder named after their content hash
+PROFILE_PICS_DIR = "profile_pics"
+
+
+# Profile pictures uploaded before the image pipeline are single files such as "1a2b3c4d.jpg"
+def is_legacy_picture(image_file):
+    return "." in image_file
+
+
+# URL of a user's profile picture at one of the configured sizes
+def picture_url(image_file, size, fmt="jpg"):
+    if is_legacy_picture(image_file):
+        return url_for("static", filename=f"{PROFILE_PICS_DIR}/{image_file}")
+    return url_for("static", filename=f"{PROFILE_PICS_DIR}/{image_file}/{size}.{fmt}")
+
+
+def _picture_dir(digest):
+    return os.path.join(current_app.root_path, "static", PROFILE_PICS_DIR, digest)
+
+
 # Save user profile picture
+# The upload is streamed to disk while hashing it, enqueue_picture then has it resized by a background job
+# Returns (picture_hash, upload_path), upload_path is None if this picture was already processed
 def save_picture(form_picture):
-    random_hex = secrets.token_hex(8)
-    # Split filename to get the file extension. Using _ as variable for f_name because it will be unused
-    _, f_ext = os.path.splitext(form_picture.filename)
-    # Create new picture file name using hex and file extension
-    picture_filename = random_hex + f_ext
-    picture_path = os.path.join(
-        current_app.root_path, "static/profile_pics", picture_filename
+    upload_dir = os.path.join(current_app.instance_path, "uploads")
+    os.makedirs(upload_dir, exist_ok=True)
+    max_bytes = current_app.config["PICTURE_MAX_BYTES"]
+    upload_path = os.path.join(upload_dir, secrets.token_hex(8))
+
+    digest = hashlib.sha256()
+    size = 0
+    with timed("picture_upload"), open(upload_path, "wb") as upload:
+        for chunk in iter(lambda: form_picture.stream.read(64 * 1024), b""):
+            size += len(chunk)
+            if size > max_bytes:
+                upload.close()
+                os.remove(upload_path)
+                abort(413)
+            digest.update(chunk)
+            upload.write(chunk)
+    # Identical uploads share a content hash, so they are stored once (truncated to fit the image_file column)
+    picture_hash = digest.hexdigest()[:20]
+
+    if os.path.isdir(_picture_dir(picture_hash)):
+        os.remove(upload_path)
+        return picture_hash, None
+    return picture_hash, upload_path
+
+
+# Queue resizing a picture saved by save_picture, call once the account update is committed
+# previous_image_file is the user's picture now, the job only replaces it if the user still has it by then
+def enqueue_picture(upload_path, picture_hash, user_id, previous_image_file):
+    jobs.enqueue(
+        "process_picture",
+        upload_path=upload_path,
+        picture_hash=picture_hash,
+        user_id=user_id,
+        previous_image_file=previous_image_file,
     )
 
-    # Resize picture
-    output_size = (125, 125)
-    image = Image.open(form_picture)
-    image.thumbnail(output_size)
 
-    # Save profile picture to path above
-    image.save(picture_path)
-    return picture_filename
+# Background job resizing an uploaded profile picture into each size as JPEG and WebP
+# Pillow is imported here, only job workers ever need it
+@jobs.task("process_picture")
+def process_picture(upload_path, picture_hash, user_id, previous_image_file=None):
+    from PIL import Image, ImageOps
+
+    picture_dir = _picture_dir(picture_hash)
+    if not os.path.isdir(picture_dir):
+        # Write into a temporary folder first so a half written folder is never served
+        tmp_dir = picture_dir + ".tmp-" + secrets.token_hex(4)
+        os.makedirs(tmp_dir)
+        with timed("picture_resize"):
+            image = ImageOps.exif_transpose(Image.open(upload_path)).convert("RGB")
+            for size in current_app.config["PICTURE_SIZES"]:
+                resized = image.copy()
+                resized.thumbnail((size, size))
+                resized.save(
+                    os.path.join(tmp_dir, f"{size}.jpg"), quality=85, optimize=True
+                )
+                resized.save(os.path.join(tmp_dir, f"{size}.webp"), quality=80)
+        try:
+            os.rename(tmp_dir, picture_dir)
+        except OSError:
+            # Another worker processed the same picture first
+            shutil.rmtree(tmp_dir)
+    if os.path.exists(upload_path):
+        os.remove(upload_path)
+
+    # A picture chosen since this upload wins, jobs queued before previous_image_file existed always apply
+    query = User.query.filter_by(id=user_id)
+    if previous_image_file is not None:
+        query = query.filter_by(image_file=previous_image_file)
+    # The invalidations only reach this process' caches. Other processes read the new picture from the user
+    # row for post cards and the account page, cached anonymous pages there catch up within CACHE_PAGE_SECONDS
+    # unless CACHE_BACKEND is shared (redis)
+    if query.update({"image_file": picture_hash}, synchronize_session=False):
+        db.session.commit()
+        identity.invalidate(user_id)
+        invalidate_author(user_id)
+
+
+# Delete profile pictures no user refers to anymore, along with abandoned uploads
+# Anything modified within the grace period is kept since a job may still be about to use it
+def remove_unused_pictures(grace_seconds=3600):
+    cutoff = time.time() - grace_seconds
+    referenced = {image_file for (image_file,) in db.session.query(User.image_file)}
+    referenced.add("default.jpg")
+    removed = []
+
+    pics_dir = os.path.join(current_app.root_path, "static", PROFILE_PICS_DIR)
+    upload_dir = os.path.join(current_app.instance_path, "uploads")
+    candidates = [
+        (name, os.path.join(pics_dir, name))
+        for name in os.listdir(pics_dir)
+        if name not in referenced
+    ]
+    if os.path.isdir(upload_dir):
+        candidates += [
+            (name, os.path.join(upload_dir, name)) for name in os.listdir(upload_dir)
+        ]
+    for name, path in candidates:
+        if os.path.getmtime(path) > cutoff:
+            continue
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+        removed.append(name)
+    return removed
+
+
+# Show which of the form's unique fields are taken, after saving a user broke a unique constraint
+# The lookup only runs on this failure path, saving a user normally needs no checks beforehand
+# Returns False if no field is taken, so the error was about something else
+def add_taken_errors(form, user_id=None):
+    query = db.session.query(User.username, User.email).filter(
+        or_(User.username == form.username.data, User.email == form.email.data)
+    )
+    if user_id is not None:
+        query = query.filter(User.id != user_id)
+    taken = set()
+    for username, email in query:
+        if username == form.username.data:
+            taken.add("username")
+        if email == form.email.data:
+            taken.add("email")
+    for field in taken:
+        form[field].errors.append(form.taken_messages[field])
+    return bool(taken)
 
 
 # Send user reset password email with token
+# The email is queued and sent by a background worker so a slow mail server never holds up the request
 def send_reset_email(user):
     # Get token
     token = user.get_reset_token()
-    # Send user email message with token
-    msg = Message(
-        "Password Reset Request",
+    # Queue the email message with token
+    jobs.enqueue(
+        "send_email",
+        subject="Password Reset Request",
         sender="noreply@rdotsilva.com",
         recipients=[user.email],
+        # Compose the email body
+        body=f"To reset your email please visit the following link: {url_for('users.reset_token', token=token, _external=True)} If you did not make this request please ignore this email.",
     )
-    # Compose the email body
-    msg.body = f"To reset your email please visit the following link: {url_for('users.reset_token', token=token, _external=True)} If you did not make this request please ignore this email."
-    # Send the message
-    mail.send(msg)
+
+
+# Background job sending an email, retried by the job queue if the mail server fails
+# Flask-Mail is set up on first use so web workers that never send mail don't import it
+@jobs.task("send_email")
+def send_email(subject, sender, recipients, body):
+    from flask_mail import Mail, Message
+
+    mail = current_app.extensions.get("mail") or Mail(current_app).state
+    msg = Message(subject, sender=sender, recipients=recipients)
+    msg.body = body
+    with timed("smtp_send"):
+        mail.send(msg)
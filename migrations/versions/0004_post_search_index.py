@@ -0,0 +1,42 @@
+"""post search index
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 07:00:12.417203
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != "sqlite":
+        # PostgreSQL searches the post table through an index on its text search vector instead
+        op.execute(
+            "CREATE INDEX ix_post_search ON post USING gin (("
+            "setweight(to_tsvector('english', title), 'A') || "
+            "setweight(to_tsvector('english', content), 'D')))"
+        )
+        return
+    # Full text index over posts, the rowid of each entry is the post id
+    op.execute(
+        "CREATE VIRTUAL TABLE post_search USING fts5("
+        "title, content, category UNINDEXED, tokenize = 'porter unicode61')"
+    )
+    op.execute(
+        "INSERT INTO post_search (rowid, title, content, category) "
+        "SELECT id, title, content, category FROM post"
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != "sqlite":
+        op.execute("DROP INDEX ix_post_search")
+        return
+    op.execute("DROP TABLE post_search")
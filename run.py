@@ -1,14 +1,9 @@
-from fitnessblog import create_app, db
+from fitnessblog import create_app
 
 # Create a new app instance
+# The database schema is managed by migrations, run "flask db upgrade" to create or update it
 app = create_app()
 
-# Add this in to recreate the database. Comment out once database is created
-app_ctx = app.app_context()
-app_ctx.push()
-db.create_all()
-app_ctx.pop()
-
 # Run in debug mode, avoiding the use of ENV variable with the flask run command
 if __name__ == "__main__":
     app.run(debug=True)
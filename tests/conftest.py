@@ -0,0 +1,72 @@
+from contextlib import contextmanager
+import pytest
+from sqlalchemy import event
+from fitnessblog import create_app, db
+from fitnessblog.config import Config
+from fitnessblog.schema import upgrade
+
+
+class TestConfig(Config):
+    TESTING = True
+    SECRET_KEY = "test"
+    # A fresh in memory database for every test, migrated to the latest schema
+    SQLALCHEMY_DATABASE_URI = "sqlite://"
+    DATABASE_REPLICA_URLS = []
+    WTF_CSRF_ENABLED = False
+    RATELIMIT_ENABLED = False
+    PASSWORD_HASH_WORKERS = 0
+    BCRYPT_LOG_ROUNDS = 4
+    JOBS_EAGER = True
+    METRICS_ENABLED = False
+    PROFILE_SLOW_REQUESTS = False
+
+
+# Requests made with the test client get their own app context and database session, like real requests
+# Test code reading or writing the database directly wraps it in "with app.app_context()"
+@pytest.fixture
+def app():
+    app = create_app(TestConfig)
+    with app.app_context():
+        upgrade()
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+# Log the test client in as a user without going through the login form
+@pytest.fixture
+def login(client):
+    def login(user_id):
+        with client.session_transaction() as session:
+            session["_user_id"] = str(user_id)
+            session["_fresh"] = True
+
+    return login
+
+
+# Collects the SQL statements run inside a with block, e.g.
+#     with count_statements() as statements:
+#         client.get("/")
+#     assert len(statements) == 3
+@pytest.fixture
+def count_statements(app):
+    with app.app_context():
+        engine = db.engine
+
+    @contextmanager
+    def count_statements():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    return count_statements
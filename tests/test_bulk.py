@@ -0,0 +1,39 @@
+import json
+from fitnessblog.models import Post
+from fitnessblog.posts.bulk import import_posts
+from fitnessblog.search.utils import search_posts
+from fitnessblog.seed import seed_database
+
+
+def records(titles):
+    for line, title in enumerate(titles, 1):
+        yield line, {"title": title, "content": f"About {title}", "category": "diet"}
+
+
+# Each batch is written with one INSERT, the posts still get their own ids in the search index
+def test_import_batches_keep_ids(app, count_statements):
+    titles = [f"Protein {n}" for n in range(7)]
+    with app.app_context():
+        seed_database(1, 3, seed=1)
+        with count_statements() as statements:
+            imported, invalid, _ = import_posts(
+                records(titles), user_id=1, batch_size=5
+            )
+        assert (imported, invalid) == (7, 0)
+        inserts = [s for s in statements if s.startswith("INSERT INTO post ")]
+        assert len(inserts) == 2
+
+        posts = Post.query.filter(Post.title.in_(titles)).all()
+        assert len(posts) == 7
+        for post in posts:
+            assert post.content == f"About {post.title}"
+            assert [item.id for item in search_posts(post.title).items][0] == post.id
+
+
+def test_export_needs_login(app, client, login):
+    with app.app_context():
+        seed_database(1, 3, seed=1)
+    assert client.get("/api/v1/posts/export").status_code == 401
+    login(1)
+    lines = client.get("/api/v1/posts/export").get_data(as_text=True).splitlines()
+    assert [json.loads(line)["author"] for line in lines] == ["user1"] * 3
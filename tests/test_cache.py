@@ -0,0 +1,16 @@
+from fitnessblog.cache import FragmentCache, LRUBackend
+
+
+# Filling the cache evicts entries but never the version counters, so a bumped version is never used again
+def test_versions_survive_eviction():
+    cache = FragmentCache()
+    cache.backend = LRUBackend(max_entries=2)
+    cache.bump("feeds")
+    cache.set("page:1:/home", "old page")
+    cache.bump("feeds")
+    for n in range(3):
+        cache.set(f"card:{n}", "card")
+    assert cache.versions("feeds") == [2]
+    cache.bump("feeds")
+    assert cache.versions("feeds") == [3]
+    assert cache.get("page:1:/home") is None
@@ -0,0 +1,29 @@
+import datetime
+from fitnessblog.posts.bulk import import_posts
+from fitnessblog.posts.stats import (
+    rolling_count,
+    rolling_counts_by_category,
+    rolling_since,
+)
+from fitnessblog.posts.utils import latest_feed
+from fitnessblog.seed import seed_database
+
+
+# The latest feed lists exactly the posts its total and the sidebar count, including the partial first hour
+def test_latest_feed_matches_rolling_counts(app):
+    since = rolling_since()
+    dates = [
+        since - datetime.timedelta(minutes=1),
+        since + datetime.timedelta(minutes=1),
+        datetime.datetime.utcnow() - datetime.timedelta(hours=1),
+    ]
+    records = [
+        (line, {"title": "T", "content": "C", "category": "diet", "date_posted": date})
+        for line, date in enumerate((date.isoformat() for date in dates), 1)
+    ]
+    with app.app_context():
+        seed_database(1, 0, seed=1)
+        import_posts(records, user_id=1)
+        assert latest_feed().count() == 2
+        assert rolling_count() == 2
+        assert rolling_counts_by_category() == {"diet": 2}
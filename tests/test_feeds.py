@@ -0,0 +1,55 @@
+import pytest
+from fitnessblog.models import Post
+from fitnessblog.seed import seed_database
+
+# SQL statements each page runs once the logged in user and the sidebar counts are cached
+# The post cards come with their authors from the feed query, so the count doesn't grow with the cards on the page
+FEED_STATEMENTS = {
+    # Post count, one page of posts with their authors
+    "home": 2,
+    "category": 2,
+    "latest": 2,
+    # The user, post count, posts and whether the logged in user follows them
+    "user": 4,
+    # The post with its author
+    "post": 1,
+}
+
+
+# URLs for each feed, pointing at the newest post, its category and its author
+def feed_urls(app):
+    with app.app_context():
+        newest = Post.query.order_by(Post.date_posted.desc(), Post.id.desc()).first()
+        return {
+            "home": ["/", "/home"],
+            "category": [f"/category/{newest.category}"],
+            "latest": ["/latest"],
+            "user": [f"/user/{newest.author.username}"],
+            "post": [f"/post/{newest.id}"],
+        }
+
+
+# A page with a single card and a full page of cards by different authors run the same statements
+# The posts are all from the last 12 hours, so /latest lists them too
+@pytest.mark.parametrize("posts", [1, 60])
+def test_feed_statements(app, client, login, count_statements, posts):
+    with app.app_context():
+        seed_database(30, posts, seed=1, days=0.5)
+    login(1)
+    # Loads the logged in user into the session and caches the sidebar counts
+    assert client.get("/about").status_code == 200
+
+    for feed, urls in feed_urls(app).items():
+        for url in urls:
+            with count_statements() as statements:
+                response = client.get(url)
+            assert response.status_code == 200, url
+            assert len(statements) == FEED_STATEMENTS[feed], (url, statements)
+
+
+def test_feed_pages_are_full(app, client, login):
+    with app.app_context():
+        seed_database(30, 60, seed=1)
+    login(1)
+    html = client.get("/").get_data(as_text=True)
+    assert html.count('class="article-content"') == 5
@@ -0,0 +1,25 @@
+import re
+from fitnessblog.seed import seed_database
+from fitnessblog.timeline.utils import is_following
+
+
+# Following and unfollowing need the CSRF token from the user's page
+def test_follow_needs_csrf_token(app, client, login):
+    app.config["WTF_CSRF_ENABLED"] = True
+    with app.app_context():
+        seed_database(2, 0, seed=1)
+    login(1)
+
+    assert client.post("/user/user2/follow").status_code == 400
+    page = client.get("/user/user2").get_data(as_text=True)
+    token = re.search(r'name="csrf_token" type="hidden" value="([^"]+)"', page)
+    response = client.post("/user/user2/follow", data={"csrf_token": token.group(1)})
+    assert response.status_code == 302
+    with app.app_context():
+        assert is_following(1, 2)
+
+    assert client.post("/user/user2/unfollow").status_code == 400
+    response = client.post("/user/user2/unfollow", data={"csrf_token": token.group(1)})
+    assert response.status_code == 302
+    with app.app_context():
+        assert not is_following(1, 2)
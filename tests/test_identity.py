@@ -0,0 +1,33 @@
+from types import SimpleNamespace
+from fitnessblog.identity import IdentityCache
+from fitnessblog.seed import seed_database
+
+
+def user(user_id):
+    return SimpleNamespace(
+        id=user_id,
+        username=f"user{user_id}",
+        email=f"user{user_id}@example.com",
+        image_file="default.jpg",
+        profile_type="student",
+    )
+
+
+# Only the most recently used users are kept in the in-process cache
+def test_identity_cache_is_bounded(app):
+    identity = IdentityCache(app)
+    identity.max_entries = 2
+    for user_id in (1, 2, 1, 3):
+        identity.remember(user(user_id))
+    assert list(identity._entries) == [1, 3]
+
+
+# The session cookie is signed, not encrypted, so the email address is never kept in it
+def test_session_leaves_out_email(app, client, login):
+    with app.app_context():
+        seed_database(1, 0, seed=1)
+    login(1)
+    assert "user1@example.com" in client.get("/account").get_data(as_text=True)
+    with client.session_transaction() as session:
+        assert session["_identity"]["username"] == "user1"
+        assert "email" not in session["_identity"]
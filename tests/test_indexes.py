@@ -0,0 +1,66 @@
+import pytest
+from fitnessblog import db
+from fitnessblog.models import User
+from fitnessblog.posts.utils import (
+    category_feed,
+    cursor_query,
+    encode_cursor,
+    home_feed,
+    latest_feed,
+    offset_query,
+    user_feed,
+)
+from fitnessblog.seed import seed_database
+
+# Index each feed should be read through. SQLite adds the rowid (the post id) to the end of every index,
+# so these cover the (date_posted, id) order of the feeds without sorting
+FEED_INDEXES = {
+    "home": "ix_post_date_posted",
+    "category": "ix_post_category_date_posted",
+    "latest": "ix_post_date_posted",
+    "user": "ix_post_user_id_date_posted",
+}
+
+
+# Lines of SQLite's EXPLAIN QUERY PLAN for a query
+def query_plan(query):
+    connection = db.session.connection()
+    compiled = query.statement.compile(connection)
+    params = [compiled.params[name] for name in compiled.positiontup]
+    cursor = connection.connection.cursor()
+    rows = cursor.execute("EXPLAIN QUERY PLAN " + str(compiled), params).fetchall()
+    return [row[-1] for row in rows]
+
+
+def feeds():
+    user = User.query.get(1)
+    return {
+        "home": home_feed(),
+        "category": category_feed("cardio"),
+        "latest": latest_feed(),
+        "user": user_feed(user),
+    }
+
+
+# Every way a feed page is read: by page number, the first page by cursor and the pages either side of a cursor
+def page_queries(feed, cursor):
+    return {
+        "offset": offset_query(feed, 3),
+        "first": cursor_query(feed),
+        "older": cursor_query(feed, before=cursor),
+        "newer": cursor_query(feed, after=cursor),
+    }
+
+
+@pytest.mark.parametrize("feed", sorted(FEED_INDEXES))
+def test_feed_queries_use_index(app, feed):
+    with app.app_context():
+        seed_database(30, 500, seed=1)
+        query = feeds()[feed]
+        cursor = encode_cursor(query.offset(2).first())
+        for page, page_query in page_queries(query, cursor).items():
+            plan = query_plan(page_query)
+            post_steps = [step for step in plan if " post " in f" {step} "]
+            assert post_steps, (page, plan)
+            assert f"USING INDEX {FEED_INDEXES[feed]}" in post_steps[0], (page, plan)
+            assert not any("TEMP B-TREE" in step for step in plan), (page, plan)
@@ -0,0 +1,35 @@
+from datetime import datetime, timedelta
+from fitnessblog import db, jobs
+from fitnessblog.models import Job
+
+
+@jobs.task("test_noop")
+def noop():
+    pass
+
+
+def expire_claim(job):
+    job.run_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+
+# A job claimed by a worker that never finished is claimed again once its claim times out,
+# and dead-lettered once that has used up JOBS_MAX_ATTEMPTS
+def test_lost_jobs_are_claimed_again(app):
+    app.config.update(JOBS_EAGER=False, JOBS_MAX_ATTEMPTS=2)
+    with app.app_context():
+        job_id = jobs.enqueue("test_noop").id
+
+        job = jobs.claim_next()
+        assert (job.id, job.status, job.attempts) == (job_id, "running", 1)
+        assert jobs.claim_next() is None
+
+        expire_claim(job)
+        job = jobs.claim_next()
+        assert (job.id, job.attempts) == (job_id, 2)
+
+        expire_claim(job)
+        assert jobs.claim_next() is None
+        job = Job.query.get(job_id)
+        assert job.status == "dead"
+        assert job.last_error
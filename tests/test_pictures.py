@@ -0,0 +1,40 @@
+from PIL import Image
+from fitnessblog import db
+from fitnessblog.models import User
+from fitnessblog.seed import seed_database
+from fitnessblog.users.utils import process_picture
+
+
+def upload(tmp_path):
+    path = tmp_path / "upload"
+    Image.new("RGB", (400, 300), "red").save(path, "PNG")
+    return str(path)
+
+
+# A picture job only replaces the picture the user had when it was queued
+def test_process_picture_keeps_newer_picture(app, tmp_path):
+    app.root_path = str(tmp_path)
+    (tmp_path / "static" / "profile_pics").mkdir(parents=True)
+    with app.app_context():
+        seed_database(1, 0, seed=1)
+        process_picture(upload(tmp_path), "first", 1, previous_image_file="default.jpg")
+        assert User.query.get(1).image_file == "first"
+
+        User.query.get(1).image_file = "chosen"
+        db.session.commit()
+        process_picture(upload(tmp_path), "stale", 1, previous_image_file="first")
+        assert User.query.get(1).image_file == "chosen"
+
+
+# A job run by another process changes only the user row, the account page shows it anyway
+def test_account_shows_picture_from_another_process(app, client, login):
+    with app.app_context():
+        seed_database(1, 0, seed=1)
+    login(1)
+    assert "profile_pics/default.jpg" in client.get("/account").get_data(as_text=True)
+    with app.app_context():
+        db.session.query(User).filter_by(id=1).update({"image_file": "0123abcd"})
+        db.session.commit()
+    assert "profile_pics/0123abcd/130.jpg" in client.get("/account").get_data(
+        as_text=True
+    )
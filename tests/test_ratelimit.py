@@ -0,0 +1,52 @@
+from fitnessblog import create_app, db, passwords
+from fitnessblog.models import User
+from fitnessblog.ratelimit import MemoryStore, Rate
+from fitnessblog.schema import upgrade
+from tests.conftest import TestConfig
+
+
+class RateLimitConfig(TestConfig):
+    RATELIMIT_ENABLED = True
+
+
+# Past max_keys the least recently used bucket is dropped, buckets in use are kept
+def test_memory_store_drops_least_recently_used():
+    store = MemoryStore(max_keys=2)
+    rate = Rate("1/hour")
+    assert store.hit("a", rate) == (True, 0)
+    store.hit("b", rate)
+    assert not store.hit("a", rate)[0]
+    store.hit("c", rate)
+    assert list(store._buckets) == ["a", "c"]
+    assert store.hit("b", rate)[0]
+
+
+# The account limit counts logins per email address, whatever the case, once the form is valid
+def test_login_account_limit():
+    app = create_app(RateLimitConfig)
+    with app.app_context():
+        upgrade()
+        password = passwords.generate_password_hash("password")
+        db.session.add(
+            User(
+                username="user1",
+                email="user1@example.com",
+                profile_type="student",
+                password=password,
+            )
+        )
+        db.session.commit()
+    client = app.test_client()
+
+    def login(email, remote_addr="10.0.0.1"):
+        return client.post(
+            "/login",
+            data={"email": email, "password": "wrong"},
+            environ_base={"REMOTE_ADDR": remote_addr},
+        )
+
+    assert [login("User1@example.com").status_code for _ in range(5)] == [200] * 5
+    response = login("user1@example.com", "10.0.0.2")
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+    assert login("user2@example.com", "10.0.0.2").status_code == 200
@@ -0,0 +1,6 @@
+from fitnessblog import create_app
+
+# Entry point for WSGI servers, e.g. "gunicorn --preload --workers 4 wsgi:app"
+# Creating the app does no database, network or schema work, so it can be loaded once before the server forks
+# Each worker opens its own database connections and password hashing pool after the fork
+app = create_app()